@@ -1,5 +1,5 @@
 import { ref, computed } from 'vue'
-import type { AgentNodeData, AgentEdge, Topology, SimulationResult, RelationshipType, InputNodeData, OutputNodeData, ModelType } from '../types'
+import type { AgentNodeData, AgentEdge, Topology, SimulationResult, RelationshipType, InputNodeData, OutputNodeData, ModelType, ToolStartEvent, ToolEndEvent } from '../types'
 
 const nodes = ref<AgentNodeData[]>([])
 const inputNodes = ref<InputNodeData[]>([])
@@ -83,6 +83,8 @@ const currentTemplateName = ref<string | null>(null)
 
 // Streaming simulation state
 const processingNodeIds = ref<Set<string>>(new Set())
+// Tool calls currently running, per node (from tool-start / tool-end events)
+const runningToolCalls = ref<Record<string, ToolStartEvent[]>>({})
 const abortController = ref<AbortController | null>(null)
 // Output files generated by simulation
 const outputFiles = ref<string[]>([])
@@ -306,6 +308,7 @@ export function useTopology() {
     abortController.value = null
     isSimulating.value = false
     processingNodeIds.value.clear()
+    runningToolCalls.value = {}
   }
 
   function setProcessingNodes(nodeIds: string[]): void {
@@ -314,10 +317,24 @@ export function useTopology() {
 
   function markNodeComplete(nodeId: string): void {
     processingNodeIds.value.delete(nodeId)
+    delete runningToolCalls.value[nodeId]
   }
 
   function clearProcessingNodes(): void {
     processingNodeIds.value.clear()
+    runningToolCalls.value = {}
+  }
+
+  function toolCallStarted(event: ToolStartEvent): void {
+    runningToolCalls.value[event.nodeId] = [...(runningToolCalls.value[event.nodeId] || []), event]
+  }
+
+  function toolCallFinished(event: ToolEndEvent): void {
+    const running = runningToolCalls.value[event.nodeId] || []
+    const index = running.findIndex(call => call.callId === event.callId && call.toolId === event.toolId)
+    if (index >= 0) {
+      runningToolCalls.value[event.nodeId] = running.filter((_, i) => i !== index)
+    }
   }
 
   function updateNodeResult(nodeId: string, result: SimulationResult): void {
@@ -393,6 +410,9 @@ export function useTopology() {
     markNodeComplete,
     clearProcessingNodes,
     updateNodeResult,
+    runningToolCalls,
+    toolCallStarted,
+    toolCallFinished,
     // Multi-endpoint configuration
     endpointConfigs,
     allAvailableModels,
@@ -35,6 +35,14 @@ export interface AgentTool {
 
 export type NodeType = 'agent' | 'input' | 'output'
 
+// Limits for tool-calling agents; unset fields use the server's [tools.budget] defaults
+export interface ToolBudget {
+  maxTurns?: number                  // Model calls, including the final answer
+  maxCallsPerTool?: number           // Calls per tool id without its own limit
+  maxCalls?: Record<string, number>  // Calls per tool id
+  deadlineSeconds?: number           // Wall clock from node start
+}
+
 export interface AgentNodeData {
   id: string
   type?: 'agent'
@@ -49,6 +57,8 @@ export interface AgentNodeData {
   rogueMode: RogueMode
   skills?: AgentSkill[]  // Custom instruction documents
   tools?: AgentTool[]    // MCP server tools
+  maxParallelTools?: number  // Max tool calls run concurrently within one turn
+  budget?: ToolBudget
 }
 
 export interface InputNodeData {
@@ -93,10 +103,56 @@ export interface Topology {
   globalSettings?: GlobalSettings
 }
 
+export interface RagTrace {
+  tool: string;
+  total_ms: number;
+  stages: Record<string, number>;
+  counts: Record<string, number>;
+  cache: Record<string, { hits: number; misses: number }>;
+}
+
 export interface ToolCallInfo {
+  id?: string;
   tool_name: string;
   args: any;
   result: string;
+  metrics?: RagTrace[];
+  cached?: boolean;  // Reused from an identical earlier call in the same run
+  duration_ms?: number | null;  // Wall time of the call
+}
+
+// Streamed while a tool-enabled node runs (before its node-complete event)
+export interface ToolStartEvent {
+  type: 'tool-start'
+  nodeId: string
+  callId?: string | null
+  toolName: string
+  toolId: string
+  argsPreview: string  // Truncated JSON arguments
+}
+
+export interface ToolEndEvent {
+  type: 'tool-end'
+  nodeId: string
+  callId?: string | null
+  toolName: string
+  toolId: string
+  durationMs: number
+  resultSize: number  // Characters returned to the model
+  cached: boolean
+  error?: string | null
+}
+
+export interface BudgetUsage {
+  turns: number;
+  max_turns: number;
+  tool_calls: Record<string, number>;
+  max_calls: Record<string, number>;
+  denied_calls: number;
+  elapsed_ms: number;
+  deadline_ms?: number | null;
+  exhausted?: string | null;  // 'turns' | 'deadline' | 'tool_calls' | 'tool_calls:<tool id>'
+  forced_final: boolean;      // Final answer requested with tools disabled
 }
 
 export interface SimulationResult {
@@ -109,6 +165,7 @@ export interface SimulationResult {
   duration: number
   error?: string
   tool_calls?: ToolCallInfo[]
+  budget?: BudgetUsage
 }
 
 export interface SimulationResponse {
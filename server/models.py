@@ -28,6 +28,17 @@ class AgentTool(BaseModel):
     description: str
 
 
+class ToolBudget(BaseModel):
+    """Per-node limits for tool-calling agents; unset fields fall back to [tools.budget] in config.toml"""
+    max_turns: Optional[int] = Field(None, alias="maxTurns")  # Model calls, including the final answer
+    max_calls_per_tool: Optional[int] = Field(None, alias="maxCallsPerTool")  # Calls per tool id without its own limit
+    max_calls: Optional[dict[str, int]] = Field(None, alias="maxCalls")  # Calls per tool id
+    deadline_seconds: Optional[float] = Field(None, alias="deadlineSeconds")  # Wall clock from node start
+
+    class Config:
+        populate_by_name = True
+
+
 class AgentNodeData(BaseModel):
     id: str
     type: Optional[Literal["agent"]] = "agent"
@@ -42,6 +53,8 @@ class AgentNodeData(BaseModel):
     rogue_mode: RogueMode = Field(default_factory=lambda: RogueMode(enabled=False), alias="rogueMode")
     skills: Optional[list[AgentSkill]] = None
     tools: Optional[list[AgentTool]] = None
+    max_parallel_tools: Optional[int] = Field(None, alias="maxParallelTools")  # Tool calls run concurrently per turn
+    budget: Optional[ToolBudget] = None  # Turn / per-tool call / deadline limits for tool calls
 
     class Config:
         populate_by_name = True
@@ -130,9 +143,25 @@ class TokenUsage(BaseModel):
 
 
 class ToolCallInfo(BaseModel):
+    id: Optional[str] = None
     tool_name: str
-    args: dict
+    args: dict | str  # JSON-encoded arguments as sent by the model
     result: str
+    metrics: Optional[list[dict]] = None  # RAG stage timings / sizes / cache hits (rag_metrics.RagTrace)
+    cached: bool = False  # Result reused from an identical earlier call in the same run
+    duration_ms: Optional[int] = None  # Wall time of the call, including queueing and budget checks
+
+
+class BudgetUsage(BaseModel):
+    turns: int
+    max_turns: int
+    tool_calls: dict[str, int]  # Executed calls per tool id
+    max_calls: dict[str, int]
+    denied_calls: int = 0  # Calls refused after a limit was reached
+    elapsed_ms: int
+    deadline_ms: Optional[int] = None
+    exhausted: Optional[str] = None  # "turns", "deadline", "tool_calls" or "tool_calls:<tool id>"
+    forced_final: bool = False  # The final answer was requested with tools disabled
 
 
 class SimulationResult(BaseModel):
@@ -142,6 +171,7 @@ class SimulationResult(BaseModel):
     duration: int
     error: Optional[str] = None
     tool_calls: Optional[list[ToolCallInfo]] = None
+    budget: Optional[BudgetUsage] = None  # Tool-calling nodes only
 
 
 class SimulationResponse(BaseModel):
@@ -174,6 +204,33 @@ class NodeCompleteEvent(BaseModel):
         populate_by_name = True
 
 
+class ToolStartEvent(BaseModel):
+    type: Literal["tool-start"] = "tool-start"
+    node_id: str = Field(alias="nodeId")
+    call_id: Optional[str] = Field(None, alias="callId")
+    tool_name: str = Field(alias="toolName")
+    tool_id: str = Field(alias="toolId")
+    args_preview: str = Field(alias="argsPreview")  # Whitespace-collapsed, truncated JSON arguments
+
+    class Config:
+        populate_by_name = True
+
+
+class ToolEndEvent(BaseModel):
+    type: Literal["tool-end"] = "tool-end"
+    node_id: str = Field(alias="nodeId")
+    call_id: Optional[str] = Field(None, alias="callId")
+    tool_name: str = Field(alias="toolName")
+    tool_id: str = Field(alias="toolId")
+    duration_ms: int = Field(alias="durationMs")
+    result_size: int = Field(alias="resultSize")  # Characters in the result returned to the model
+    cached: bool = False
+    error: Optional[str] = None  # Set when the tool raised instead of returning
+
+    class Config:
+        populate_by_name = True
+
+
 class NodeErrorEvent(BaseModel):
     type: Literal["node-error"] = "node-error"
     node_id: str = Field(alias="nodeId")
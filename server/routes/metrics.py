@@ -0,0 +1,32 @@
+"""Metrics API routes"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..tools.tool_wrappers import metrics_registry, tool_executor
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics() -> dict:
+    """GET /api/metrics - Aggregated RAG stage timings, sizes and cache hits per tool"""
+    return metrics_registry.snapshot()
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_metrics_prometheus() -> str:
+    """GET /api/metrics/prometheus - Same metrics in Prometheus text exposition format"""
+    return metrics_registry.prometheus()
+
+
+@router.get("/metrics/executor")
+async def get_executor_metrics() -> dict:
+    """GET /api/metrics/executor - Current queue depth, running calls and totals per tool thread pool"""
+    return tool_executor.stats()
+
+
+@router.delete("/metrics")
+async def reset_metrics() -> dict:
+    """DELETE /api/metrics - Reset the aggregated metrics"""
+    metrics_registry.reset()
+    return {"success": True}
@@ -1,9 +1,10 @@
 """Tool API routes"""
 import logging
 from fastapi import APIRouter
-from typing import List
+from typing import List, Optional
 
 from ..tools.registry import AVAILABLE_TOOLS, ToolDefinition
+from ..tools.tool_wrappers import tool_cache
 
 logger = logging.getLogger(__name__)
 
@@ -29,3 +30,23 @@ async def list_tools() -> List[dict]:
 async def list_categories() -> List[str]:
     """GET /api/tools/categories - List all tool categories"""
     return list(set(t.category for t in AVAILABLE_TOOLS))
+
+
+@router.get("/tools/cache")
+async def get_tool_cache_stats() -> dict:
+    """GET /api/tools/cache - Persistent tool cache size, TTLs and hit/miss counts per namespace"""
+    return tool_cache.stats()
+
+
+@router.get("/tools/cache/entries")
+async def list_tool_cache_entries(namespace: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[dict]:
+    """GET /api/tools/cache/entries - Most recently used cache entries (request, size, age)"""
+    return tool_cache.entries(namespace, limit=min(max(limit, 1), 500), offset=max(offset, 0))
+
+
+@router.delete("/tools/cache")
+async def purge_tool_cache(namespace: Optional[str] = None, key: Optional[str] = None, expired_only: bool = False) -> dict:
+    """DELETE /api/tools/cache - Purge entries (optionally one namespace/key, or only fully expired ones)"""
+    removed = tool_cache.purge(namespace, key=key, expired_only=expired_only)
+    logger.info("Purged %d tool cache entries (namespace=%s, expired_only=%s)", removed, namespace, expired_only)
+    return {"success": True, "removed": removed}
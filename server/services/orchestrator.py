@@ -9,16 +9,29 @@ from pathlib import Path
 # openai-agents SDK imports
 try:
     from agents import Agent, Runner, ModelSettings, OpenAIChatCompletionsModel, ItemHelpers
+    from agents import RunConfig, ToolExecutionConfig
     AGENTS_SDK_AVAILABLE = True
 except ImportError:
     AGENTS_SDK_AVAILABLE = False
 
 from ..models import (
     AgentNodeData, AgentEdge, InputNodeData, Topology,
-    SimulationResult, TokenUsage, EndpointConfig
+    SimulationResult, TokenUsage, EndpointConfig, BudgetUsage
 )
 from .prompt_builder import build_prompt, get_relationship_prefix, IncomingContext
-from ..tools.tool_wrappers import get_tools_for_node
+from ..tools.tool_wrappers import (
+    get_tools_for_node,
+    new_node_budget,
+    new_run_memo,
+    pop_tool_call_metrics,
+    prefetch_enabled,
+    resolve_parallel_settings,
+    set_node_budget,
+    set_patient_context,
+    set_run_memo,
+    set_tool_event_sink,
+    start_patient_prefetch,
+)
 
 
 def save_output_file(input_path: str, topology: Topology, results: dict, actual_input_file: str | None = None) -> str | None:
@@ -293,15 +306,29 @@ async def execute_simulation_stream(
         # Store outputs
         results: dict[str, SimulationResult] = {}
         final_pass_results = results
+
+        # Identical tool calls within this pass share one execution
+        run_memo = new_run_memo()
         
         print(f"DEBUG: Topological sort phases: {len(phases)}", flush=True)
 
+        # Optional patient-level retrieval prefetch: runs in the background while the
+        # phase-0 agents generate, so their tool calls find a warm selection/cache
+        if master_task and prefetch_enabled():
+            prefetch_tool_ids = sorted({t.id for n in nodes for t in (getattr(n, 'tools', []) or [])})
+            prefetch_tasks = start_patient_prefetch(master_task, prefetch_tool_ids)
+            if prefetch_tasks:
+                debug_logs.append(f"DEBUG: Started {len(prefetch_tasks)} retrieval prefetch task(s)")
+
         # Execute each phase
         for phase_index, phase in enumerate(phases):
             print(f"DEBUG: Executing phase {phase_index} with nodes: {phase}", flush=True)
             # Emit phase start event
             yield {"type": "phase-start", "phase": phase_index, "nodeIds": phase}
 
+            # tool-start / tool-end events from this phase's nodes, streamed while they run
+            tool_events: asyncio.Queue = asyncio.Queue()
+
             # Run all nodes in this phase in parallel
             async def execute_node(node_id: str) -> dict:
                 debug_logs.append(f"DEBUG: Executing node {node_id}")
@@ -311,6 +338,20 @@ async def execute_simulation_stream(
                     return {"nodeId": node_id, "result": None, "error": None}
 
                 start_time = time.time()
+                # Tool wrappers read the patient history of this run from a contextvar
+                # (each gathered task has its own context copy)
+                set_patient_context(master_task)
+                set_run_memo(run_memo)
+
+                # Per-call durations for ToolCallInfo, taken from the streamed tool-end events
+                call_durations: dict[str, int] = {}
+
+                def on_tool_event(event: dict) -> None:
+                    if event["type"] == "tool-end" and event.get("callId"):
+                        call_durations[event["callId"]] = event["durationMs"]
+                    tool_events.put_nowait({**event, "nodeId": node_id})
+
+                set_tool_event_sink(on_tool_event)
 
                 try:
                     # Get context from upstream agent nodes
@@ -372,27 +413,52 @@ async def execute_simulation_stream(
                         tools = get_tools_for_node(tool_ids)
                         
                         if tools:
-                            from .runner import Runner
-                            from ..models import ModelSettings
-                            
-                            agent = Runner(
-                                client=client,
-                                model=model_to_use,
-                                system_prompt=system_prompt,
-                                messages=messages,
+                            # Several tool calls returned in one turn run concurrently (up to the
+                            # node's cap); the SDK keeps their outputs in the model's call order
+                            parallel = resolve_parallel_settings({"max_concurrency": node.max_parallel_tools})
+                            agent = Agent(
+                                name=node.name or node_id,
+                                instructions=system_prompt,
+                                model=OpenAIChatCompletionsModel(model=model_to_use, openai_client=client),
                                 model_settings=ModelSettings(
                                     temperature=temperature if not is_new_model else None,
                                     tool_choice="auto",
+                                    parallel_tool_calls=parallel["enabled"],
                                 ),
                                 tools=tools,
+                                # the budget may set tool_choice="none" for the final turn; keep the
+                                # SDK from resetting it after the first tool use
+                                reset_tool_choice=False,
                             )
+                            # Turn / per-tool call / deadline budget: the tool wrappers refuse calls past
+                            # a limit and the input filter asks for a final answer (and turns tools off
+                            # in this run's model_settings) on the final turn
+                            budget = new_node_budget(tool_ids, node.budget.model_dump() if node.budget else None)
+                            set_node_budget(budget)
+                            run_config = budget.bind(RunConfig(
+                                model_settings=ModelSettings(),
+                                tool_execution=ToolExecutionConfig(
+                                    max_function_tool_concurrency=parallel["max_concurrency"],
+                                ),
+                                call_model_input_filter=budget.model_input_filter,
+                            ))
                             
                             # Build user prompt
                             user_prompt = user_content if user_content else "Please provide your analysis."
                             
-                            # Run agent with tools
-                            agent_result = await Runner.run(agent, user_prompt)
-                            output_text = ItemHelpers.text_message_outputs(agent_result.new_items)
+                            # Run agent with tools; if the model still asks for tools on the final
+                            # turn, keep whatever text it produced instead of failing the node
+                            agent_result = await Runner.run(
+                                agent,
+                                user_prompt,
+                                max_turns=budget.max_turns,
+                                run_config=run_config,
+                                error_handlers={
+                                    "max_turns": lambda data: ItemHelpers.text_message_outputs(data.run_data.new_items)
+                                    or "No final answer: the tool budget for this step was exhausted.",
+                                },
+                            )
+                            output_text = ItemHelpers.text_message_outputs(agent_result.new_items) or str(agent_result.final_output or "")
                             
                             # Extract tool calls
                             from ..models import ToolCallInfo
@@ -432,9 +498,12 @@ async def execute_simulation_stream(
                             for cid, info in call_map.items():
                                 tool_calls.append(ToolCallInfo(
                                     id=cid,
-                                    name=info["tool_name"],
-                                    arguments=info["args"],
-                                    result=info["result"]
+                                    tool_name=info["tool_name"],
+                                    args=info["args"],
+                                    result=info["result"],
+                                    metrics=pop_tool_call_metrics(cid),
+                                    cached=bool(run_memo and run_memo.is_cached(cid)),
+                                    duration_ms=call_durations.get(cid),
                                 ))
 
                             duration = int((time.time() - start_time) * 1000)
@@ -451,7 +520,8 @@ async def execute_simulation_stream(
                                     completion=completion_tokens
                                 ),
                                 duration=duration,
-                                tool_calls=tool_calls if tool_calls else None
+                                tool_calls=tool_calls if tool_calls else None,
+                                budget=BudgetUsage(**budget.usage()),
                             )
                             
                             return {"nodeId": node_id, "result": result, "error": None}
@@ -499,9 +569,23 @@ async def execute_simulation_stream(
                     traceback.print_exc()
                     return {"nodeId": node_id, "result": None, "error": str(e)}
 
-            # Execute all nodes in parallel
+            # Execute all nodes in parallel, forwarding tool events until the phase is done
             tasks = [execute_node(node_id) for node_id in phase]
-            phase_results = await asyncio.gather(*tasks)
+
+            async def run_phase() -> list:
+                try:
+                    return await asyncio.gather(*tasks)
+                finally:
+                    tool_events.put_nowait(None)
+
+            phase_task = asyncio.create_task(run_phase())
+            try:
+                while (tool_event := await tool_events.get()) is not None:
+                    yield tool_event
+                phase_results = await phase_task
+            finally:
+                if not phase_task.done():
+                    phase_task.cancel()
 
             # Emit node completion events
             for result in phase_results:
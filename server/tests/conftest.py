@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# server/tools 下的模块使用平铺导入（与服务运行时一致）
+TOOLS_DIR = Path(__file__).resolve().parent.parent / "tools"
+if str(TOOLS_DIR) not in sys.path:
+    sys.path.insert(0, str(TOOLS_DIR))
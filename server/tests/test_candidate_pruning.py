@@ -0,0 +1,60 @@
+import pytest
+
+from candidate_pruning import bm25_scores, prune_candidates
+
+DOCS = [
+    "EGFR exon 19 deletion responds to osimertinib",
+    "ALK rearrangement treated with alectinib",
+    "general supportive care and nutrition",
+    "osimertinib first line for EGFR mutant NSCLC",
+]
+SOURCES = ["ESMO", "NCCN", "ESMO", "ESMO"]
+DISTANCES = [0.30, 0.10, 0.20, 0.40]
+
+
+def test_bm25_prefers_documents_with_query_terms():
+    scores = bm25_scores("EGFR osimertinib", DOCS)
+    assert scores[2] == 0.0
+    assert scores[0] > scores[1] and scores[3] > scores[1]
+    assert bm25_scores("anything", []) == []
+
+
+def test_distance_mode_keeps_the_closest():
+    keep, report = prune_candidates("q", DOCS, DISTANCES, SOURCES, mode="distance", max_candidates=2)
+    assert keep == [1, 2]
+    assert (report.before, report.after) == (4, 2)
+    assert report.per_source == {"NCCN": 1, "ESMO": 1}
+
+
+def test_bm25_mode_ignores_distances():
+    keep, _ = prune_candidates("EGFR osimertinib", DOCS, DISTANCES, SOURCES, mode="bm25", max_candidates=2)
+    assert sorted(keep) == [0, 3]
+
+
+def test_per_source_cap():
+    keep, report = prune_candidates(
+        "q", DOCS, DISTANCES, SOURCES, mode="distance", max_candidates=4, per_source_cap={"ESMO": 1}
+    )
+    assert keep == [1, 2]
+    assert report.per_source == {"NCCN": 1, "ESMO": 1}
+
+
+def test_hybrid_without_distances_falls_back_to_bm25():
+    hybrid, _ = prune_candidates("EGFR osimertinib", DOCS, None, SOURCES, mode="hybrid", max_candidates=2)
+    bm25, _ = prune_candidates("EGFR osimertinib", DOCS, None, SOURCES, mode="bm25", max_candidates=2)
+    assert hybrid == bm25
+
+
+@pytest.mark.parametrize("alpha, first", [(1.0, 1), (0.0, 0)])
+def test_hybrid_alpha_weights_vector_against_lexical(alpha, first):
+    keep, _ = prune_candidates(
+        "EGFR exon 19 deletion", DOCS, DISTANCES, SOURCES, mode="hybrid", max_candidates=4, hybrid_alpha=alpha
+    )
+    assert keep[0] == first
+
+
+def test_off_and_unknown_modes():
+    keep, report = prune_candidates("q", DOCS, DISTANCES, SOURCES, mode="off", max_candidates=1)
+    assert keep == [0, 1, 2, 3] and report.mode == "off"
+    keep, report = prune_candidates("q", DOCS, DISTANCES, SOURCES, mode="nope", max_candidates=1)
+    assert keep == [1] and report.mode == "distance"
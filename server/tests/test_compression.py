@@ -0,0 +1,80 @@
+import pytest
+
+from compression import compress_chunks, estimate_tokens, split_sentences
+
+FILLER = [
+    "The committee reviewed enrolment figures for the previous quarter.",
+    "Imaging was repeated at the regional centre after the scanner upgrade.",
+    "Patients were followed up at three and six months.",
+    "Data were collected using the standard case report form.",
+    "Funding was provided by the national research council.",
+]
+
+
+def make_docs(n: int = 6):
+    docs = []
+    for i in range(n):
+        sents = list(FILLER)
+        sents.insert(i % len(sents), f"For KRAS G12C mutated NSCLC, sotorasib is recommended after line {i + 1}.")
+        docs.append(" ".join(sents))
+    return docs
+
+
+def _kept_sentence_tokens(out):
+    return sum(estimate_tokens(s) for text in out for s in split_sentences(text.replace("…", "\n")))
+
+
+def test_under_budget_is_returned_unchanged():
+    docs = make_docs(2)
+    out, report = compress_chunks("kras sotorasib", docs, budget_tokens=10_000)
+    assert out == docs
+    assert report.tokens_after == report.tokens_before
+    assert report.sentences_kept == 0
+
+
+@pytest.mark.parametrize("budget", [20, 60, 120, 200])
+def test_kept_sentences_fit_the_budget(budget):
+    docs = make_docs()
+    out, report = compress_chunks("KRAS G12C sotorasib", docs, budget_tokens=budget)
+    assert len(out) == len(docs)
+    assert report.tokens_before > budget
+    assert _kept_sentence_tokens(out) <= budget
+    assert report.tokens_after < report.tokens_before
+
+
+def test_most_relevant_sentence_kept_per_chunk():
+    docs = make_docs()
+    out, _ = compress_chunks("KRAS G12C sotorasib", docs, budget_tokens=len(docs) * 20)
+    for i, text in enumerate(out):
+        assert f"after line {i + 1}." in text
+
+
+def test_tight_budget_drops_lower_ranked_chunks_first():
+    docs = make_docs()
+    one_sentence = estimate_tokens(split_sentences(docs[0])[0])
+    out, _ = compress_chunks("KRAS G12C sotorasib", docs, budget_tokens=one_sentence * 2)
+    assert out[0] and out[1]
+    assert out[-1] == ""
+
+
+def test_sentence_order_and_gap_markers():
+    docs = make_docs(3)
+    out, _ = compress_chunks("KRAS G12C sotorasib", docs, budget_tokens=60)
+    for doc, text in zip(docs, out):
+        if not text:
+            continue
+        pieces = [s for s in split_sentences(text.replace("…", "\n"))]
+        positions = [doc.index(p) for p in pieces]
+        assert positions == sorted(positions)
+
+
+def test_embedding_mode_falls_back_to_lexical_on_error():
+    def broken_embed(sentences):
+        raise RuntimeError("embedding endpoint down")
+
+    out, report = compress_chunks(
+        "KRAS G12C sotorasib", make_docs(), budget_tokens=60, mode="embedding",
+        query_embedding=[1.0, 0.0], embed_fn=broken_embed,
+    )
+    assert report.mode == "lexical"
+    assert _kept_sentence_tokens(out) <= 60
@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+
+from dedup import (
+    _pairwise_keep,
+    _synthetic_chunks,
+    band_keys,
+    dedup_against,
+    dedup_candidates,
+    jaccard_matrix,
+    minhash_signatures,
+    mmr_select,
+)
+
+BASE = " ".join(f"token{i}" for i in range(80))
+
+
+def _edit(text: str, n: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    tokens = text.split()
+    for _ in range(n):
+        tokens[rng.randrange(len(tokens))] = f"edit{rng.randrange(10_000)}"
+    return " ".join(tokens)
+
+
+def test_exact_duplicates_keep_the_nearest():
+    docs = [BASE, "something else entirely here", BASE.upper()]
+    keep, report, sig = dedup_candidates(docs, distances=[0.5, 0.1, 0.2])
+    assert keep == [1, 2]
+    assert report.exact == 1 and report.near == 0
+    assert sig.shape == (2, 64)
+
+
+def test_near_duplicates_are_removed():
+    docs = [BASE, _edit(BASE, 1), " ".join(f"other{i}" for i in range(80))]
+    keep, report, _ = dedup_candidates(docs, threshold=0.8)
+    assert keep == [0, 2]
+    assert report.near == 1
+
+
+def test_lsh_matches_pairwise_scan():
+    docs = _synthetic_chunks(600, random.Random(3))
+    sig = minhash_signatures(docs)
+    keep, _, _ = dedup_candidates(docs, threshold=0.8)
+    assert keep == _pairwise_keep(sig, 0.8)
+
+
+def test_band_keys_shape_and_equality():
+    sig = minhash_signatures([BASE, BASE + " tail", "unrelated words only"])
+    keys = band_keys(sig, bands=16)
+    assert keys.shape == (3, 16)
+    assert (keys[0] == band_keys(sig[:1], bands=16)[0]).all()
+    assert band_keys(sig, bands=1000).shape == (3, 64)
+
+
+def test_dedup_against_existing_signatures():
+    _, _, existing = dedup_candidates([BASE])
+    docs = [_edit(BASE, 1, seed=1), "completely different chunk of text about lymphoma staging"]
+    keep, report, sig = dedup_against(docs, None, existing, threshold=0.8)
+    assert keep == [1]
+    assert report.near == 1 and report.after == 1
+    assert sig.shape[0] == 1
+
+
+def test_jaccard_matrix_rowwise():
+    sig = minhash_signatures([BASE, _edit(BASE, 2), "x y z"])
+    sim = jaccard_matrix(sig)
+    assert sim.shape == (3, 3)
+    assert np.allclose(np.diag(sim), 1.0)
+    assert np.allclose(sim, sim.T)
+    assert sim[0, 1] > sim[0, 2]
+    assert jaccard_matrix(sig[:0]).shape == (0, 0)
+
+
+def test_mmr_prefers_diverse_results():
+    docs = [BASE, _edit(BASE, 1), " ".join(f"other{i}" for i in range(80))]
+    sim = jaccard_matrix(minhash_signatures(docs))
+    picked = mmr_select([(0, 0.9), (1, 0.89), (2, 0.7)], sim, k=2, lambda_=0.5)
+    assert [i for i, _ in picked] == [0, 2]
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import rag_common
+from doc_index import DocChunkIndex
+from vector_store import VectorStore
+
+
+class MemoryStore(VectorStore):
+    """按 id 存放 chunk 的内存后端，记录 get 调用次数。"""
+
+    def __init__(self):
+        self.rows = {}
+        self.gets = 0
+
+    def put(self, doc, texts, content_hash, dim=4, seed=0):
+        for cid in [c for c, r in self.rows.items() if r[1]["docx_name"] == doc]:
+            del self.rows[cid]
+        rng = np.random.default_rng(seed)
+        for i, text in enumerate(texts):
+            md = {"docx_name": doc, "chunk_index": i, "content_hash": content_hash}
+            self.rows[f"{doc}:{i}"] = (text, md, rng.normal(size=dim).tolist())
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, ids=None, where=None, with_embeddings=False):
+        self.gets += 1
+        if ids is not None:
+            keys = [i for i in ids if i in self.rows]
+        elif where:
+            (field, value), = where.items()
+            keys = [k for k, r in self.rows.items() if r[1].get(field) == value]
+        else:
+            keys = list(self.rows)
+        out = {
+            "ids": keys,
+            "documents": [self.rows[k][0] for k in keys],
+            "metadatas": [self.rows[k][1] for k in keys],
+        }
+        if with_embeddings:
+            out["embeddings"] = np.asarray([self.rows[k][2] for k in keys], dtype=np.float32)
+        return out
+
+
+@pytest.fixture
+def store():
+    s = MemoryStore()
+    s.put("a", ["a0", "a1", "a2"], "h1", seed=1)
+    s.put("b", ["b0", "b1"], "h1", seed=2)
+    return s
+
+
+def test_index_is_persisted_and_reloaded(store, tmp_path):
+    path = tmp_path / "idx.json"
+    idx = DocChunkIndex(store, "docx_name", index_path=path)
+    assert idx.chunk_ids("a") == ["a:0", "a:1", "a:2"]
+    assert idx.chunk_count(["a", "b", "a"]) == 5
+    assert path.exists()
+
+    store.gets = 0
+    reloaded = DocChunkIndex(store, "docx_name", index_path=path)
+    assert reloaded.chunk_ids("b") == ["b:0", "b:1"]
+    assert store.gets == 0  # 从文件加载，不扫描集合
+
+
+def test_document_rewritten_in_place_is_reindexed(store):
+    idx = DocChunkIndex(store, "docx_name")
+    assert [dc.docs for dc in idx.chunks(["a"])] == [["a0", "a1", "a2"]]
+
+    # 相同 id、相同 chunk 数、新内容：行数不变，只有 content_hash 变化
+    store.put("a", ["new0", "new1", "new2"], "h2", seed=3)
+    assert [dc.docs for dc in idx.chunks(["a"])] == [["new0", "new1", "new2"]]
+    assert idx._hashes["a"] == "h2"
+
+
+def test_row_count_change_rebuilds_the_index(store):
+    idx = DocChunkIndex(store, "docx_name")
+    assert idx.chunk_count(["a"]) == 3
+    store.put("a", ["a0", "a1", "a2", "a3"], "h1", seed=1)
+    idx.chunks(["a"])
+    assert idx.chunk_ids("a") == ["a:0", "a:1", "a:2", "a:3"]
+
+
+def test_chunk_cache_is_lru(store):
+    idx = DocChunkIndex(store, "docx_name", cache_docs=1)
+    idx.chunks(["a"])
+    idx.chunks(["b"])
+    assert list(idx._chunks) == ["b"]
+
+
+def test_query_many_ranks_by_cosine(store):
+    idx = DocChunkIndex(store, "docx_name")
+    target = store.rows["b:1"][2]
+    (docs, metas, dists), = idx.query_many(["a", "b"], [target], 2)
+    assert docs[0] == "b1"
+    assert dists[0] == pytest.approx(0.0, abs=1e-6)
+    assert dists == sorted(dists)
+    assert idx.query_many(["missing"], [target], 5) == [([], [], [])]
+
+
+@pytest.mark.parametrize("cap, n_results, expected", [(1000, None, 5), (4, None, 4), (0, None, 5), (4, 2, 2)])
+def test_source_depth_is_capped(store, monkeypatch, cap, n_results, expected):
+    monkeypatch.setattr(rag_common, "doc_index_max_candidates", lambda: cap)
+    cfg = {"doc_index": DocChunkIndex(store, "docx_name")}
+    if n_results is not None:
+        cfg["n_results"] = n_results
+    assert rag_common._source_depth(cfg, ["a", "b"], 20) == expected
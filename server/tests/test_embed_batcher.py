@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from embed_batcher import EmbedBatcher
+
+
+class FakeEmbeddings:
+    def __init__(self, fail=None, drop=0):
+        self.requests = []
+        self.fail = fail
+        self.drop = drop
+
+    async def create(self, model, input, encoding_format):
+        self.requests.append(list(input))
+        await asyncio.sleep(0)
+        if self.fail is not None:
+            raise self.fail
+        data = [SimpleNamespace(index=i, embedding=[float(len(t)), float(i)]) for i, t in enumerate(input)]
+        data.reverse()  # 服务端不保证顺序
+        return SimpleNamespace(data=data[self.drop:])
+
+
+def make_batcher(**kwargs):
+    fake = FakeEmbeddings(**{k: kwargs.pop(k) for k in ("fail", "drop") if k in kwargs})
+    return EmbedBatcher(client=SimpleNamespace(embeddings=fake), model="test", **kwargs), fake
+
+
+def test_concurrent_calls_share_one_request():
+    batcher, fake = make_batcher(window_ms=20, max_batch=32)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["a", "bb"]), batcher.embed(["bb", "ccc"]), batcher.embed(["a"]))
+
+    first, second, third = asyncio.run(run())
+    assert len(fake.requests) == 1
+    assert fake.requests[0] == ["a", "bb", "ccc"]  # 同一批内相同文本只发送一次
+    assert [v[0] for v in first] == [1.0, 2.0]
+    assert [v[0] for v in second] == [2.0, 3.0]
+    assert [v[0] for v in third] == [1.0]
+    assert not batcher._tasks
+
+
+def test_max_batch_flushes_immediately_and_splits():
+    batcher, fake = make_batcher(window_ms=10_000, max_batch=2)
+
+    async def run():
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), batcher.embed(["c", "d", "e"])), timeout=2
+        )
+
+    asyncio.run(run())
+    assert fake.requests == [["a", "b"], ["c", "d", "e"]]
+
+
+def test_errors_reach_every_caller_in_the_batch():
+    batcher, _ = make_batcher(window_ms=5, fail=RuntimeError("embedding endpoint down"))
+
+    async def run():
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert not batcher._tasks
+
+
+def test_short_response_fails_instead_of_hanging():
+    batcher, _ = make_batcher(window_ms=5, drop=1)
+
+    async def run():
+        return await asyncio.wait_for(batcher.embed(["a", "b"]), timeout=2)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,103 @@
+import random
+from difflib import get_close_matches
+
+import pytest
+
+from fuzzy_match import FuzzyIndex, _perturb, _synthetic_names, normalize_name, run_bench
+
+ITEMS = [
+    "ESMO_Metastatic_NSCLC_2023.pdf",
+    "ESMO_Early_Breast_Cancer_2024.pdf",
+    "NCCN Colon Cancer v2.2024.pdf",
+    "NCCN Rectal Cancer v1.2024.pdf",
+    "WHO Classification of Haematolymphoid Tumours.pdf",
+]
+
+
+def test_normalize_name():
+    assert normalize_name(" `ESMO_Metastatic-NSCLC  2023.PDF` ") == "esmo metastatic nsclc 2023"
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("ESMO_Metastatic_NSCLC_2023.pdf", "ESMO_Metastatic_NSCLC_2023.pdf"),
+        ("esmo metastatic nsclc 2023", "ESMO_Metastatic_NSCLC_2023.pdf"),
+        ("NCCN Colon Cancer v2.2024", "NCCN Colon Cancer v2.2024.pdf"),
+        ("NCCN Colon Cancr v2.2024.pdf", "NCCN Colon Cancer v2.2024.pdf"),
+        ("ESMO Early Breast Cancer 2024", "ESMO_Early_Breast_Cancer_2024.pdf"),
+    ],
+)
+def test_match_finds_close_names(query, expected):
+    assert FuzzyIndex(ITEMS).match(query) == expected
+
+
+def test_unrelated_name_returns_none():
+    index = FuzzyIndex(ITEMS)
+    assert index.match("Pathology of the pancreas.pdf") is None
+    assert index.match("") is None
+    assert FuzzyIndex([]).match("anything") is None
+
+
+def test_match_all_deduplicates_in_order():
+    index = FuzzyIndex(ITEMS)
+    names = ["NCCN Rectal Cancer v1.2024", "esmo metastatic nsclc 2023", "NCCN_Rectal_Cancer_v1.2024.pdf", "nothing"]
+    assert index.match_all(names) == ["NCCN Rectal Cancer v1.2024.pdf", "ESMO_Metastatic_NSCLC_2023.pdf"]
+
+
+@pytest.mark.parametrize("size", [50, 500])
+def test_never_misses_a_difflib_match(size):
+    rng = random.Random(size)
+    items = _synthetic_names(size, rng)
+    index = FuzzyIndex(items)
+    for _ in range(200):
+        query = _perturb(rng.choice(items), rng)
+        expected = get_close_matches(query, items, n=1, cutoff=0.8)
+        got = index.match(query, cutoff=0.8)
+        if expected:
+            assert got is not None, query
+        if got is not None:
+            assert got in items
+
+
+def test_wide_shortlist_when_top_candidates_fail_the_cutoff():
+    # 候选数为 1 时 trigram 最相近的候选可能不过 cutoff，仍应在更宽的 Dice 候选表里找到
+    items = ["abc def ghi", "abc def ghj xyz", "zzzz"]
+    query = "abc def ghj"
+    assert get_close_matches(query, items, n=1, cutoff=0.8)
+    assert FuzzyIndex(items, candidates=1).match(query) is not None
+
+
+def test_normalized_names_match_where_difflib_does_not():
+    # 有意的语义差异：大小写 / 下划线 / 扩展名不同的名字按规范化名命中
+    items = ["esmo_early_breast_cancer_2024_17.pdf", "nccn_rectal_cancer_2023_4.pdf"]
+    query = "Esmo Early Breast Cancer 2024 17.Pdf"
+    assert get_close_matches(query, items, n=1, cutoff=0.8) == []
+    assert FuzzyIndex(items).match(query) == "esmo_early_breast_cancer_2024_17.pdf"
+
+
+def test_hallucinated_names_do_not_scan_the_whole_catalog(monkeypatch):
+    import fuzzy_match
+
+    items = _synthetic_names(2000, random.Random(0))
+    index = FuzzyIndex(items)
+    calls = []
+    real = fuzzy_match.SequenceMatcher
+
+    class Counting(real):
+        def ratio(self):
+            calls.append(1)
+            return super().ratio()
+
+    monkeypatch.setattr(fuzzy_match, "SequenceMatcher", Counting)
+    assert index.match("Pathology Of The Pancreas Atlas.pdf") is None
+    assert len(calls) <= 2 * index.fallback_candidates
+
+
+def test_bench_matches_difflib_except_normalized_hits():
+    rows = run_bench([200, 2000], queries=100, seed=1)
+    assert {row["queries"] for row in rows} == {"hit", "miss"}
+    for row in rows:
+        assert row["missed"] == 0
+        assert row["different"] == 0
+        assert row["agree"] + row["extra"] == pytest.approx(1.0)
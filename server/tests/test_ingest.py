@@ -0,0 +1,134 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import ingest
+from ingest import IngestTarget, Ingestor, chunk_text, embed_texts, file_sha256
+
+
+def _matches(md, where):
+    if "$and" in where:
+        return all(_matches(md, c) for c in where["$and"])
+    return all(md.get(k) == v for k, v in where.items())
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, where=None, limit=None, include=None):
+        metas = [md for _, md in self.rows.values() if where is None or _matches(md, where)]
+        return {"metadatas": metas[:limit] if limit else metas}
+
+    def delete(self, where):
+        for cid in [c for c, (_, md) in self.rows.items() if _matches(md, where)]:
+            del self.rows[cid]
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        for cid, doc, md in zip(ids, documents, metadatas):
+            self.rows[cid] = (doc, md)
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    async def create(self, model, input, encoding_format):
+        self.batches.append(list(input))
+        await asyncio.sleep(0)
+        data = [SimpleNamespace(index=i, embedding=[float(len(t))]) for i, t in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    collection = FakeCollection()
+    embeddings = FakeEmbeddings()
+    invalidated = []
+    monkeypatch.setattr(
+        ingest, "get_persistent_client",
+        lambda path: SimpleNamespace(get_or_create_collection=lambda name: collection),
+    )
+    monkeypatch.setattr(ingest, "async_embed_client", SimpleNamespace(embeddings=embeddings))
+    monkeypatch.setattr(ingest, "invalidate_doc_indexes", lambda db, name: invalidated.append((db, name)))
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(ingest.storage_catalog, "check_interval", 0.0)
+    monkeypatch.setattr(ingest.storage_catalog, "rescan_interval", 0.0)
+    src = tmp_path / "who"
+    src.mkdir()
+    target = IngestTarget("WHO", src, tmp_path / "db", "medical_collection", ".txt", "txt_name")
+    return SimpleNamespace(
+        collection=collection, embeddings=embeddings, invalidated=invalidated, src=src, target=target
+    )
+
+
+def test_chunk_text_packs_paragraphs_with_overlap():
+    text = "\n\n".join(["a" * 40, "b" * 40, "c" * 40])
+    chunks = chunk_text(text, chunk_size=90, overlap=10)
+    assert chunks[0] == "a" * 40 + "\n\n" + "b" * 40
+    assert chunks[1].startswith("b" * 10) and chunks[1].endswith("c" * 40)
+    assert all(len(c) <= 90 for c in chunks)
+
+
+def test_chunk_text_splits_long_paragraphs():
+    chunks = chunk_text("x" * 250, chunk_size=100, overlap=20)
+    assert [len(c) for c in chunks] == [100, 100, 90]
+    assert chunk_text("  \n\n ") == []
+
+
+def test_embed_texts_batches_and_keeps_order(env):
+    vecs = asyncio.run(embed_texts(["a", "bb", "ccc", "dddd", "e"], batch_size=2, concurrency=2))
+    assert vecs == [[1.0], [2.0], [3.0], [4.0], [1.0]]
+    assert env.embeddings.batches == [["a", "bb"], ["ccc", "dddd"], ["e"]]
+
+
+def test_run_ingests_then_skips_unchanged_files(env):
+    (env.src / "lung.txt").write_text("Lung adenocarcinoma.\n\nEGFR, ALK, ROS1.")
+    (env.src / "breast.txt").write_text("Breast carcinoma NST.")
+    ingestor = Ingestor(env.target, workers=2, chunk_size=30, chunk_overlap=0)
+
+    report = asyncio.run(ingestor.run())
+    assert (report.scanned, report.ingested, report.skipped, report.failed) == (2, 2, 0, [])
+    assert report.chunks == len(env.collection.rows) == 3
+    doc, md = env.collection.rows["lung::0"]
+    assert md == {"txt_name": "lung", "chunk_index": 0, "content_hash": file_sha256(env.src / "lung.txt")}
+    assert env.invalidated == [(env.target.db_path, "medical_collection")]
+
+    report = asyncio.run(ingestor.run())
+    assert (report.ingested, report.skipped) == (0, 2)
+
+    (env.src / "breast.txt").write_text("Breast carcinoma NST, HER2 positive.")
+    report = asyncio.run(ingestor.run())
+    assert (report.ingested, report.skipped) == (1, 1)
+
+
+def test_delete_missing_and_dry_run(env):
+    (env.src / "lung.txt").write_text("Lung.")
+    (env.src / "old.txt").write_text("Old.")
+    ingestor = Ingestor(env.target, workers=1)
+    asyncio.run(ingestor.run())
+    (env.src / "old.txt").unlink()
+
+    report = asyncio.run(ingestor.run(delete_missing=True, dry_run=True))
+    assert report.deleted == 1 and "old::0" in env.collection.rows
+
+    report = asyncio.run(ingestor.run(delete_missing=True))
+    assert report.deleted == 1 and "old::0" not in env.collection.rows
+    assert len(env.invalidated) == 2
+
+
+def test_failed_documents_are_reported(env):
+    (env.src / "empty.txt").write_text("   ")
+    (env.src / "lung.txt").write_text("Lung.")
+    report = asyncio.run(Ingestor(env.target, workers=1).run())
+    assert report.failed == ["empty"]
+    assert report.ingested == 1
+
+
+def test_consolidated_layout_tags_the_source():
+    target = ingest.resolve_target("esmo", "consolidated")
+    assert target.db_path == ingest.GUIDELINE_DB_STORAGE
+    assert target.extra_metadata == {ingest.SOURCE_KEY: "ESMO"}
+    assert ingest.resolve_target("who", "consolidated") is ingest.INGEST_TARGETS["who"]
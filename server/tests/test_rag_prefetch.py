@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+
+import rag_prefetch
+import rag_staging_uicc
+from rag_prefetch import SelectionStore, lookup_selection, min_cosine
+from rag_staging_uicc import UICCRAGToolkit
+
+
+@pytest.fixture
+def store(monkeypatch):
+    fresh = SelectionStore(ttl=60)
+    monkeypatch.setattr(rag_prefetch, "selection_store", fresh)
+    monkeypatch.setattr(
+        rag_prefetch,
+        "resolve_prefetch_settings",
+        lambda overrides=None: {
+            "enabled": True, "reuse_selection": True, "wait_timeout": 0.1, "reuse_similarity": 0.85, "ttl": 60.0,
+        },
+    )
+    return fresh
+
+
+def test_min_cosine():
+    assert min_cosine([[1.0, 0.0], [1.0, 1.0]], [1.0, 0.0]) == pytest.approx(2 ** -0.5)
+    assert min_cosine([[1.0, 0.0]], None) == -1.0
+
+
+def test_prefetch_registers_once_and_later_calls_reuse(store):
+    future, prefetched = lookup_selection("t", "k", prefetch=True)
+    assert future is not None and prefetched is None
+    future.set_result({"chosen": ["a"], "embedding": [1.0, 0.0]})
+
+    # 第二次预取由已有登记负责，直接拿到结果
+    again, prefetched = lookup_selection("t", "k", prefetch=True)
+    assert again is None and prefetched["chosen"] == ["a"]
+
+    _, prefetched = lookup_selection("t", "k", prefetch=False)
+    assert prefetched["chosen"] == ["a"]
+
+
+def test_query_far_from_patient_selects_inline(store):
+    future, _ = lookup_selection("t", "k", prefetch=True)
+    future.set_result({"chosen": ["a"], "embedding": [1.0, 0.0]})
+
+    _, near = lookup_selection("t", "k", prefetch=False, query_embeddings=lambda: [[0.99, 0.05]])
+    _, far = lookup_selection("t", "k", prefetch=False, query_embeddings=lambda: [[0.0, 1.0]])
+    assert near is not None
+    assert far is None
+
+
+def test_reuse_needs_prefetch_enabled(store, monkeypatch):
+    future, _ = lookup_selection("t", "k", prefetch=True)
+    future.set_result({"chosen": ["a"], "embedding": [1.0, 0.0]})
+    monkeypatch.setattr(
+        rag_prefetch,
+        "resolve_prefetch_settings",
+        lambda overrides=None: {
+            "enabled": False, "reuse_selection": True, "wait_timeout": 0.1, "reuse_similarity": 0.85, "ttl": 60.0,
+        },
+    )
+    assert lookup_selection("t", "k", prefetch=False) == (None, None)
+
+
+def test_uicc_reuses_prefetched_documents(store, monkeypatch, tmp_path):
+    (tmp_path / "Lung.txt").write_text("LUNG\n\nT1 Tumour 3 cm or less\n")
+    (tmp_path / "Breast.txt").write_text("BREAST\n\nT1 Tumour 2 cm or less\n")
+    monkeypatch.setattr(rag_staging_uicc, "UICC_DIR", str(tmp_path))
+    monkeypatch.setattr(rag_staging_uicc, "embed_query_texts", lambda texts: [[1.0, 0.0] for _ in texts])
+    calls = []
+
+    def fake_select(patient_history, query, doc_names):
+        calls.append(query)
+        return ["Lung"]
+
+    monkeypatch.setattr(UICCRAGToolkit, "_select_documents", staticmethod(fake_select))
+    ctx = SimpleNamespace(context=SimpleNamespace(patient_history="62M, NSCLC, 2.5 cm mass"))
+
+    UICCRAGToolkit._retrieve_uicc_impl(ctx, "", prefetch=True)
+    out = UICCRAGToolkit._retrieve_uicc_impl(ctx, "T stage of the lung tumour")
+    assert calls == [""]
+    assert "Lung" in out and "Breast" not in out
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import reranker_client
+from reranker_client import CircuitBreaker, RerankerClient, RerankerUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 只替换 reranker_client 看到的 time 模块；事件循环仍使用真实时钟
+    fake = FakeClock()
+    monkeypatch.setattr(reranker_client, "time", SimpleNamespace(monotonic=fake, perf_counter=time.perf_counter))
+    return fake
+
+
+def make_client(handler, **kwargs) -> RerankerClient:
+    kwargs.setdefault("max_retries", 0)
+    client = RerankerClient(url="http://reranker.test/v1/rerank", model="test", **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def ok_handler(request: httpx.Request) -> httpx.Response:
+    import json
+
+    docs = json.loads(request.content)["documents"]
+    return httpx.Response(200, json={"results": [{"index": i, "relevance_score": 1.0 / (i + 1)} for i in range(len(docs))]})
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_breaker_release_probe_returns_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+def test_rerank_merges_sub_batches():
+    client = make_client(ok_handler, max_batch_size=2)
+    scored = asyncio.run(client._rerank("q", ["a", "b", "c", "d", "e"]))
+    assert sorted(i for i, _ in scored) == [0, 1, 2, 3, 4]
+    assert [s for _, s in scored] == sorted((s for _, s in scored), reverse=True)
+    assert client.breaker.state == "closed"
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        httpx.Response(200, json=["not", "a", "dict"]),
+        httpx.Response(200, json={"results": "oops"}),
+        httpx.Response(200, content=b"not json"),
+        httpx.Response(400, json={"error": "bad request"}),
+    ],
+)
+def test_bad_responses_count_as_failures(clock, response):
+    client = make_client(lambda request: response, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=10))
+    with pytest.raises(RerankerUnavailable):
+        asyncio.run(client._rerank("q", ["a"]))
+    assert client.breaker.state == "open"
+
+    # 冷却后探测成功即恢复
+    clock.now += 10
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(ok_handler))
+    asyncio.run(client._rerank("q", ["a"]))
+    assert client.breaker.state == "closed"
+
+
+def test_unexpected_exception_does_not_leave_probe_stuck(clock):
+    def handler(request):
+        raise RuntimeError("boom")
+
+    client = make_client(handler, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=10))
+    client.breaker.record_failure()
+    clock.now += 10
+    with pytest.raises(RerankerUnavailable):
+        asyncio.run(client._rerank("q", ["a"]))
+    clock.now += 10
+    assert client.breaker.allow()
+
+
+def test_failed_sub_batch_cancels_siblings():
+    started = []
+    cancelled = []
+
+    async def handler(request):
+        import json
+
+        docs = json.loads(request.content)["documents"]
+        started.append(docs[0])
+        if docs[0] == "fail":
+            return httpx.Response(400)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(docs[0])
+            raise
+        return ok_handler(request)
+
+    client = make_client(handler, max_batch_size=1, max_concurrency=4)
+
+    async def run():
+        with pytest.raises(RerankerUnavailable):
+            await asyncio.wait_for(client._rerank("q", ["slow1", "fail", "slow2"]), timeout=2)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert sorted(cancelled) == ["slow1", "slow2"]
+
+
+def test_cancelled_probe_is_released(clock):
+    async def handler(request):
+        await asyncio.sleep(5)
+        return ok_handler(request)
+
+    client = make_client(handler, breaker=CircuitBreaker(failure_threshold=1, reset_seconds=10))
+    client.breaker.record_failure()
+    clock.now += 10
+
+    async def run():
+        task = asyncio.ensure_future(client._rerank("q", ["a"]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert client.breaker.state == "half-open"
+    assert client.breaker.allow()
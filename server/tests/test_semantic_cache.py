@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+import semantic_cache as semantic_cache_module
+from rag_common import _output_settings_fingerprint
+from semantic_cache import SemanticCache, fingerprint
+
+SOURCES = {"ESMO": {"label": "ESMO", "storage_dir": "data/ESMO", "n_results": 20, "collection": object()}}
+
+
+def settings_key(**changes):
+    args = dict(
+        tool_name="rag_guideline",
+        sources=SOURCES,
+        role_hint=None,
+        role_templates=None,
+        n_results=20,
+        top_k=10,
+        score_threshold=0.6,
+        prune=None,
+        dedup=None,
+        adaptive=None,
+        compress=None,
+    )
+    args.update(changes)
+    return _output_settings_fingerprint(**args)
+
+
+def test_hit_above_threshold_only():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("k", [1.0, 0.0], "guideline output", query="EGFR first line")
+    assert cache.lookup("k", [0.99, 0.05]) == ("guideline output", pytest.approx(0.9987, abs=1e-3), "EGFR first line")
+    assert cache.lookup("k", [0.6, 0.8]) is None
+    assert cache.lookup("k", [0.6, 0.8], threshold=0.5) is not None
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_entries_are_scoped_by_key():
+    cache = SemanticCache()
+    patient_a = ("rag_guideline", fingerprint("patient A"), fingerprint(["a.pdf"]))
+    patient_b = ("rag_guideline", fingerprint("patient B"), fingerprint(["a.pdf"]))
+    cache.store(patient_a, [1.0, 0.0], "A")
+    assert cache.lookup(patient_b, [1.0, 0.0]) is None
+    assert cache.lookup(("rag_tool_who",) + patient_a[1:], [1.0, 0.0]) is None
+    assert cache.lookup(patient_a, [1.0, 0.0])[0] == "A"
+
+
+def test_ttl_max_entries_and_max_keys(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(semantic_cache_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    cache = SemanticCache(ttl=10, max_entries=2, max_keys=2)
+    for i, vec in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store("k", vec, f"out{i}")
+    assert cache.lookup("k", [1.0, 0.0]) is None  # 最早的条目被挤出
+    assert cache.lookup("k", [0.0, 1.0])[0] == "out1"
+
+    cache.store("k2", [1.0, 0.0], "x")
+    cache.store("k3", [1.0, 0.0], "y")
+    assert cache.stats()["keys"] == 2
+
+    now[0] = 11.0
+    assert cache.lookup("k3", [1.0, 0.0]) is None
+
+
+def test_fingerprint_is_stable_and_order_sensitive():
+    assert fingerprint("a", ["x"]) == fingerprint("a", ["x"])
+    assert fingerprint("a", "b") != fingerprint("ab")
+    assert fingerprint(["x", "y"]) != fingerprint(["y", "x"])
+
+
+def test_output_settings_fingerprint_tracks_everything_that_changes_output():
+    base = settings_key()
+    assert settings_key() == base
+    # collection 对象本身不进入键
+    assert settings_key(sources={"ESMO": dict(SOURCES["ESMO"], collection=object())}) == base
+    changed = [
+        settings_key(top_k=5),
+        settings_key(score_threshold=0.5),
+        settings_key(n_results=40),
+        settings_key(role_hint="pathologist", role_templates={"pathologist": "Focus on histology"}),
+        settings_key(sources={"ESMO": dict(SOURCES["ESMO"], n_results=40)}),
+        settings_key(sources={"ESMO": dict(SOURCES["ESMO"], doc_index=object())}),
+        settings_key(prune={"mode": "off"}),
+        settings_key(dedup={"threshold": 0.5}),
+        settings_key(adaptive={"enabled": True}),
+        settings_key(compress={"enabled": True}),
+    ]
+    assert len(set(changed + [base])) == len(changed) + 1
@@ -0,0 +1,82 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import storage_catalog as storage_catalog_module
+from storage_catalog import StorageCatalog
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(
+        storage_catalog_module, "time", SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter)
+    )
+    return now
+
+
+@pytest.fixture
+def storage(tmp_path):
+    (tmp_path / "Lung.PDF").write_bytes(b"x" * 10)
+    (tmp_path / "Breast.pdf").write_bytes(b"y")
+    (tmp_path / "notes.txt").write_text("n")
+    (tmp_path / "sub").mkdir()
+    return tmp_path
+
+
+def test_lists_files_by_suffix(storage, clock):
+    cat = StorageCatalog()
+    assert cat.list_files(storage, [".pdf"]) == ["Breast.pdf", "Lung.PDF"]
+    assert cat.doc_ids(storage, [".PDF"]) == ["Breast", "Lung"]
+    assert [e.filename for e in cat.entries(storage)] == ["Breast.pdf", "Lung.PDF", "notes.txt"]
+    lung = cat.entries(storage, [".pdf"])[1]
+    assert (lung.suffix, lung.size) == (".pdf", 10)
+
+
+def test_missing_directory(tmp_path, clock):
+    cat = StorageCatalog()
+    assert not cat.exists(tmp_path / "nope")
+    assert cat.list_files(tmp_path / "nope", [".pdf"]) == []
+
+
+def test_rescans_when_the_directory_changes(storage, clock, monkeypatch):
+    cat = StorageCatalog(check_interval=2.0, rescan_interval=30.0)
+    scans = []
+    real_scan = StorageCatalog._scan
+    monkeypatch.setattr(StorageCatalog, "_scan", staticmethod(lambda path: scans.append(path) or real_scan(path)))
+
+    cat.doc_ids(storage, [".pdf"])
+    (storage / "Colon.pdf").write_bytes(b"z")
+    st = os.stat(storage)
+    os.utime(storage, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    # check_interval 内不 stat 目录
+    clock[0] += 1.0
+    assert cat.doc_ids(storage, [".pdf"]) == ["Breast", "Lung"]
+    clock[0] += 2.0
+    assert cat.doc_ids(storage, [".pdf"]) == ["Breast", "Colon", "Lung"]
+    assert len(scans) == 2
+
+
+def test_in_place_edits_are_seen_after_rescan_interval(storage, clock):
+    cat = StorageCatalog(check_interval=2.0, rescan_interval=30.0)
+    before = cat.entries(storage, [".txt"])[0].size
+    st = os.stat(storage)
+    (storage / "notes.txt").write_text("a longer note")
+    os.utime(storage, ns=(st.st_atime_ns, st.st_mtime_ns))  # 目录 mtime 不变
+
+    clock[0] += 5.0
+    assert cat.entries(storage, [".txt"])[0].size == before
+    clock[0] += 30.0
+    assert cat.entries(storage, [".txt"])[0].size == len("a longer note")
+
+
+def test_invalidate_forces_a_rescan(storage, clock):
+    cat = StorageCatalog(check_interval=60.0)
+    cat.list_files(storage, [".pdf"])
+    (storage / "Colon.pdf").write_bytes(b"z")
+    assert "Colon.pdf" not in cat.list_files(storage, [".pdf"])
+    cat.invalidate(storage)
+    assert "Colon.pdf" in cat.list_files(storage, [".pdf"])
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import pytest
+from agents import ModelSettings, RunConfig
+
+import tool_budget
+from tool_budget import FINALIZE_PROMPT, NodeBudget, resolve_budget_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(tool_budget, "time", SimpleNamespace(monotonic=fake))
+    return fake
+
+
+def model_call(budget):
+    data = SimpleNamespace(model_data=SimpleNamespace(input=[{"role": "user", "content": "q"}], instructions=None))
+    return budget.model_input_filter(data)
+
+
+def test_defaults_only_limit_turns():
+    cfg = resolve_budget_settings()
+    assert cfg["max_turns"] == 10
+    assert cfg["deadline_seconds"] <= 0
+    assert cfg["max_calls_per_tool"] <= 0
+    assert cfg["max_calls"] == {}
+
+    budget = NodeBudget.from_settings(["rag_guideline"])
+    for _ in range(50):
+        assert budget.check_tool("rag_guideline") is None
+    assert budget.remaining() is None
+
+
+def test_node_overrides_opt_in():
+    cfg = resolve_budget_settings(
+        {"max_turns": 4, "max_calls_per_tool": 2, "max_calls": {"rag_guideline": 3}, "deadline_seconds": None}
+    )
+    assert cfg["max_turns"] == 4
+    assert cfg["max_calls_per_tool"] == 2
+    assert cfg["max_calls"] == {"rag_guideline": 3}
+    assert cfg["deadline_seconds"] == resolve_budget_settings()["deadline_seconds"]
+
+
+def test_per_tool_limits():
+    budget = NodeBudget(["rag_guideline", "pubmed_query"], max_calls_per_tool=1, max_calls={"rag_guideline": 2})
+    assert budget.check_tool("rag_guideline") is None
+    assert budget.check_tool("rag_guideline") is None
+    denied = budget.check_tool("rag_guideline")
+    assert denied and "rag_guideline already called 2 times" in denied
+    assert budget.check_tool("pubmed_query") is None
+    assert budget.check_tool("pubmed_query") is not None
+    assert budget.usage()["denied_calls"] == 2
+    assert budget.exhausted == "tool_calls:rag_guideline"
+    # 所有工具都用完：下一次模型调用强制收尾
+    assert budget.next_turn() == "every tool reached its call limit"
+
+
+def test_deadline(clock):
+    budget = NodeBudget(["rag_guideline"], deadline_seconds=30)
+    assert budget.check_tool("rag_guideline") is None
+    clock.now += 31
+    assert budget.check_tool("rag_guideline") == FINALIZE_PROMPT.format(reason="30s deadline reached")
+    assert budget.next_turn() == "30s deadline reached"
+    assert budget.usage()["deadline_ms"] == 30000
+
+
+def test_final_turn_turns_tools_off_in_the_run_config_only():
+    budget = NodeBudget(["rag_guideline"], max_turns=2)
+    agent_settings = ModelSettings(temperature=0.2)
+    run_config = budget.bind(RunConfig(model_settings=ModelSettings(temperature=0.2)))
+
+    first = model_call(budget)
+    assert len(first.input) == 1
+    assert run_config.model_settings.tool_choice is None
+
+    final = model_call(budget)
+    assert final.input[-1]["role"] == "user"
+    assert final.input[-1]["content"] == FINALIZE_PROMPT.format(reason="turn 2 of 2")
+    assert run_config.model_settings.tool_choice == "none"
+    assert run_config.model_settings.temperature == 0.2
+    assert agent_settings.tool_choice is None
+    assert budget.forced_final
+
+    # 模型无视 tool_choice 仍调用工具时拒绝
+    assert budget.check_tool("rag_guideline") is not None
+    usage = budget.usage()
+    assert usage["exhausted"] == "turns" and usage["forced_final"]
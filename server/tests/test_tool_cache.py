@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+import pytest
+
+import tool_cache as tool_cache_module
+from tool_cache import ToolCache, resolve_tool_cache_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(tool_cache_module.time, "time", fake)
+    return fake
+
+
+def make_cache(tmp_path, **kwargs):
+    kwargs.setdefault("default_ttl", 100)
+    return ToolCache(tmp_path / "cache.sqlite3", **kwargs)
+
+
+def test_shipped_disabled():
+    assert resolve_tool_cache_settings()["enabled"] is False
+
+
+def test_disabled_cache_creates_no_file(tmp_path):
+    cache = make_cache(tmp_path, enabled=False)
+    calls = []
+    assert cache.call("civic", {"gene": "KRAS"}, lambda: calls.append(1) or "v") == "v"
+    assert cache.call("civic", {"gene": "KRAS"}, lambda: calls.append(1) or "v") == "v"
+    assert len(calls) == 2
+    assert cache.stats()["namespaces"] == {}
+    assert cache.entries() == [] and cache.purge() == 0
+    assert not cache.path.exists()
+
+
+def test_fresh_stale_and_expired(tmp_path, clock):
+    cache = make_cache(tmp_path, stale_ttl=50, ttl={"pubmed_esearch": 10})
+    cache.put("civic", {"gene": "KRAS", "variant": "G12C"}, {"evidence": [1, 2]})
+    assert cache.get("civic", {"variant": "G12C", "gene": "KRAS"}) == ({"evidence": [1, 2]}, "fresh")
+    clock.now += 120
+    assert cache.get("civic", {"gene": "KRAS", "variant": "G12C"})[1] == "stale"
+    clock.now += 40
+    assert cache.get("civic", {"gene": "KRAS", "variant": "G12C"}) == (None, "miss")
+    assert cache.ttl_for("pubmed_esearch") == 10 and cache.ttl_for("other") == 100
+
+
+def test_call_stores_only_cacheable_results(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.call("tavily", "q", lambda: {"error": "rate limited"}, should_cache=lambda v: "error" not in v)
+    assert cache.get("tavily", "q") == (None, "miss")
+    with pytest.raises(RuntimeError):
+        cache.call("tavily", "q2", lambda: (_ for _ in ()).throw(RuntimeError("down")))
+    assert cache.get("tavily", "q2") == (None, "miss")
+
+
+def test_stale_hit_returns_old_value_and_refreshes_once(tmp_path, clock):
+    cache = make_cache(tmp_path, stale_ttl=1000)
+    cache.put("civic", "k", "old")
+    clock.now += 200
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return "new"
+
+    assert cache.call("civic", "k", fetch) == "old"
+    assert cache.call("civic", "k", fetch) == "old"  # 同键刷新进行中，不再提交
+    release.set()
+    cache._refresh_pool.shutdown(wait=True)
+    assert len(calls) == 1
+    assert cache.get("civic", "k") == ("new", "fresh")
+
+
+def test_eviction_keeps_recently_used_entries(tmp_path, clock):
+    cache = make_cache(tmp_path, max_bytes=1000)
+    for i in range(10):
+        clock.now += 1
+        cache.put("pubmed_efetch", f"k{i}", "x" * 150)
+        if i >= 1:
+            clock.now += 1
+            cache.get("pubmed_efetch", "k0")  # 保持 k0 最近访问
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert cache.get("pubmed_efetch", "k0")[1] == "fresh"
+    assert cache.get("pubmed_efetch", "k1") == (None, "miss")
+    assert cache.get("pubmed_efetch", "k9")[1] == "fresh"
+
+
+def test_purge_expired_only(tmp_path, clock):
+    cache = make_cache(tmp_path, stale_ttl=0)
+    cache.put("civic", "old", 1)
+    clock.now += 150
+    cache.put("civic", "new", 2)
+    assert cache.purge(expired_only=True) == 1
+    assert [e["request"] for e in cache.entries()] == ["new"]
+    assert cache.purge() == 1
+
+
+def test_call_async_runs_off_the_loop(tmp_path):
+    cache = make_cache(tmp_path)
+    loop_threads = []
+    real_lookup = cache._lookup
+
+    def lookup(namespace, request):
+        loop_threads.append(threading.current_thread())
+        return real_lookup(namespace, request)
+
+    cache._lookup = lookup
+
+    async def fetch():
+        return {"pmids": [1, 2]}
+
+    async def run():
+        first = await cache.call_async("pubmed_esearch", {"term": "kras"}, fetch)
+        second = await cache.call_async("pubmed_esearch", {"term": "kras"}, fetch)
+        return first, second, threading.current_thread()
+
+    first, second, main = asyncio.run(run())
+    assert first == second == {"pmids": [1, 2]}
+    assert loop_threads and all(t is not main for t in loop_threads)
@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import inspect
+import threading
+
+import pytest
+
+import tool_executor
+from tool_executor import ToolExecutor, ToolRejected, ToolTimeout, offload, resolve_parallel_settings
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    settings = {"workers": 1, "timeout": 5.0, "max_queue": 1}
+    monkeypatch.setattr(tool_executor, "resolve_executor_settings", lambda pool, overrides=None: dict(settings))
+    ex = ToolExecutor()
+    yield ex, settings
+    ex.shutdown()
+
+
+def test_runs_in_a_pool_thread_with_the_callers_context(executor):
+    ex, _ = executor
+    var = contextvars.ContextVar("patient", default=None)
+
+    def work(x):
+        return x * 2, var.get(), threading.current_thread().name
+
+    async def run():
+        var.set("p1")
+        return await ex.run("pubmed", work, 21)
+
+    value, patient, thread = asyncio.run(run())
+    assert (value, patient) == (42, "p1")
+    assert thread.startswith("tool-pubmed")
+    assert ex.stats()["pubmed"]["completed"] == 1
+
+
+def test_timeout_returns_to_the_caller_and_is_counted(executor):
+    ex, _ = executor
+    release = threading.Event()
+
+    async def run():
+        with pytest.raises(ToolTimeout):
+            await ex.run("slow", release.wait, 5, timeout=0.05)
+
+    asyncio.run(run())
+    release.set()
+    assert ex.stats()["slow"]["timeouts"] == 1
+
+
+def test_full_queue_rejects_immediately(executor):
+    ex, _ = executor
+    release = threading.Event()
+
+    async def run():
+        running = asyncio.ensure_future(ex.run("p", release.wait, 5))
+        queued = asyncio.ensure_future(ex.run("p", lambda: "queued"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ToolRejected):
+            await ex.run("p", lambda: "rejected")
+        release.set()
+        return await running, await queued
+
+    assert asyncio.run(run()) == (True, "queued")
+    stats = ex.stats()["p"]
+    assert stats["rejected"] == 1 and stats["queued"] == 0 and stats["running"] == 0
+
+
+def test_pools_are_isolated(executor):
+    ex, _ = executor
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(ex.run("stuck", release.wait, 5))
+        await asyncio.sleep(0.02)
+        result = await ex.run("other", lambda: "ok", timeout=1.0)
+        release.set()
+        await blocked
+        return result
+
+    assert asyncio.run(run()) == "ok"
+
+
+def test_errors_propagate_and_are_counted(executor):
+    ex, _ = executor
+
+    def boom():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        asyncio.run(ex.run("p", boom))
+    assert ex.stats()["p"]["errors"] == 1
+
+
+def test_offload_keeps_the_signature_for_function_tool():
+    @offload("pubmed_query")
+    def pubmed_query_tool(query: str, max_results: int = 5) -> str:
+        """Search PubMed."""
+        return query
+
+    assert inspect.iscoroutinefunction(pubmed_query_tool)
+    assert list(inspect.signature(pubmed_query_tool).parameters) == ["query", "max_results"]
+    assert pubmed_query_tool.__doc__ == "Search PubMed."
+
+
+def test_parallel_settings_node_override(monkeypatch):
+    monkeypatch.setattr(
+        tool_executor.config_manager, "get_section", lambda name: {"parallel": {"enabled": True, "max_concurrency": 4}}
+    )
+    assert resolve_parallel_settings({"max_concurrency": None})["max_concurrency"] == 4
+    assert resolve_parallel_settings({"max_concurrency": 2})["max_concurrency"] == 2
+    assert resolve_parallel_settings({"enabled": False})["max_concurrency"] == 1
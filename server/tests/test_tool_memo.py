@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+
+from tool_memo import FAILURE_PREFIXES, RunMemo, _is_error, memo_key
+
+
+@pytest.mark.parametrize(
+    "result",
+    [
+        "Error retrieving guidelines: timeout",
+        "  error searching PubMed: 503",
+        "⚠️ Tool execution failed: connection refused",
+        "RAG dependencies not available. Please check chromadb and config_manager are installed.",
+        "An error occurred while running the tool. Please try again. Error: boom",
+    ],
+)
+def test_failure_messages_are_errors(result):
+    assert _is_error(result)
+
+
+@pytest.mark.parametrize("result", ["KRAS G12C: sotorasib (Level 1)", "", {"error": "x"}, None, ["Error"]])
+def test_regular_results_are_not_errors(result):
+    assert not _is_error(result)
+
+
+def test_failure_prefixes_are_casefolded():
+    assert all(p == p.casefold() for p in FAILURE_PREFIXES)
+
+
+def test_memo_key_normalizes_case_whitespace_and_defaults():
+    schema = {"properties": {"query": {"type": "string"}, "max_results": {"type": "integer", "default": 5}}}
+    a = memo_key("pubmed_query", json.dumps({"query": "  KRAS   G12C "}), schema)
+    b = memo_key("pubmed_query", json.dumps({"query": "kras g12c", "max_results": 5}), schema)
+    c = memo_key("pubmed_query", json.dumps({"query": "kras g12c", "max_results": 10}), schema)
+    assert a == b
+    assert a != c
+
+
+def test_memo_key_unordered_args():
+    a = memo_key("genesearch_batch_tool", json.dumps({"genes": "KRAS G12C, EGFR L858R"}))
+    b = memo_key("genesearch_batch_tool", json.dumps({"genes": ["egfr l858r", "kras g12c"]}))
+    assert a == b
+    assert memo_key("pubmed_query", json.dumps({"query": "a, b"})) != memo_key("pubmed_query", json.dumps({"query": "b, a"}))
+
+
+def _counting(results):
+    calls = []
+
+    async def invoke():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return results[len(calls) - 1]
+
+    return calls, invoke
+
+
+def test_concurrent_calls_share_one_execution():
+    memo = RunMemo()
+    calls, invoke = _counting(["ok"])
+
+    async def run():
+        return await asyncio.gather(*(memo.call("rag_guideline", "k", f"call_{i}", invoke) for i in range(3)))
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert len(calls) == 1
+    assert memo.stats() == {"hits": 2, "misses": 1, "entries": 1}
+    assert memo.is_cached("call_1") and memo.is_cached("call_2")
+    assert not memo.is_cached("call_0")
+    assert memo.cached_calls["call_1"] == "call_0"
+
+
+def test_error_results_are_not_kept_for_later_calls():
+    memo = RunMemo()
+    calls, invoke = _counting(["Error searching PubMed: 503", "ok"])
+
+    async def run():
+        first = await memo.call("pubmed_query", "k", "c1", invoke)
+        second = await memo.call("pubmed_query", "k", "c2", invoke)
+        return first, second
+
+    assert asyncio.run(run()) == ("Error searching PubMed: 503", "ok")
+    assert len(calls) == 2
+    assert not memo.is_cached("c2")
+
+
+def test_exceptions_are_not_kept_for_later_calls():
+    memo = RunMemo()
+    attempts = []
+
+    async def invoke():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await memo.call("pubmed_query", "k", "c1", invoke)
+        return await memo.call("pubmed_query", "k", "c2", invoke)
+
+    assert asyncio.run(run()) == "ok"
+    assert len(attempts) == 2
+
+
+def test_entries_are_keyed_by_tool_id():
+    # 同一个工具对象注册在不同 id 下（与 tool_budget 的计数一致）时各自执行
+    memo = RunMemo()
+    calls, invoke = _counting(["a", "b"])
+
+    async def run():
+        return (
+            await memo.call("rag_guideline", "k", "c1", invoke),
+            await memo.call("rag_tool_who", "k", "c2", invoke),
+        )
+
+    assert asyncio.run(run()) == ("a", "b")
+    assert len(calls) == 2
+
+
+def test_cancelled_owner_hands_over_to_waiter():
+    memo = RunMemo()
+    calls, invoke = _counting(["ok", "ok"])
+
+    async def run():
+        owner = asyncio.ensure_future(memo.call("rag_guideline", "k", "c1", invoke))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(memo.call("rag_guideline", "k", "c2", invoke))
+        await asyncio.sleep(0)
+        owner.cancel()
+        return await waiter
+
+    assert asyncio.run(run()) == "ok"
+    assert len(calls) == 2
+    assert not memo.is_cached("c2")
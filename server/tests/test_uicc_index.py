@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from storage_catalog import storage_catalog
+from uicc_index import UICCIndex, split_sections
+
+LUNG = """LUNG
+
+RULES FOR CLASSIFICATION
+The classification applies to carcinomas of the lung.
+
+T – Primary Tumour
+T1 Tumour 3 cm or less in greatest dimension.
+T2 Tumour more than 3 cm but not more than 5 cm.
+
+N – Regional Lymph Nodes
+N1 Metastasis in ipsilateral peribronchial lymph nodes.
+
+Stage grouping
+Stage IA T1 N0 M0
+Stage IIB T1 N1 M0
+"""
+
+FILLER = "\n".join(f"Line {i} about anatomical subsites of the lung and their history." for i in range(120))
+
+
+@pytest.fixture
+def uicc_dir(tmp_path, monkeypatch):
+    (tmp_path / "Lung.txt").write_text(LUNG + "\nANATOMICAL SITES\n" + FILLER + "\n")
+    (tmp_path / "Breast.txt").write_text("BREAST\n\nStage grouping\nStage I T1 N0 M0\n")
+    monkeypatch.setattr(storage_catalog, "check_interval", 0.0)
+    monkeypatch.setattr(storage_catalog, "rescan_interval", 0.0)
+    return tmp_path
+
+
+def test_split_sections_by_heading():
+    sections = split_sections("Lung", LUNG)
+    assert [(s.title, s.kind) for s in sections] == [
+        ("LUNG", "other"),
+        ("RULES FOR CLASSIFICATION", "rules"),
+        ("T – Primary Tumour", "tnm"),
+        ("N – Regional Lymph Nodes", "tnm"),
+        ("Stage grouping", "stage"),
+    ]
+    assert "T2 Tumour more than 3 cm" in sections[2].text
+    assert all(s.tokens == max(1, len(s.render()) // 4) for s in sections)
+
+
+def test_text_without_headings_is_one_section():
+    sections = split_sections("Notes", "plain text.\nmore text.")
+    assert len(sections) == 1 and sections[0].title == ""
+
+
+def test_small_selection_returns_everything(uicc_dir):
+    sel = UICCIndex(uicc_dir).select("stage", ["Breast"], token_budget=3000)
+    assert sel.trimmed_tokens == 0
+    assert sel.render().startswith("=== Breast.txt ===")
+
+
+def test_budget_keeps_relevant_sections_of_every_document(uicc_dir):
+    index = UICCIndex(uicc_dir)
+    sel = index.select("T1 N1 peribronchial lymph nodes stage", ["Lung", "Breast"], token_budget=200)
+    assert sel.returned_tokens <= 200 < sel.total_tokens
+    titles = [(s.doc, s.title) for s in sel.sections]
+    assert ("Breast", "Stage grouping") in titles
+    assert ("Lung", "ANATOMICAL SITES") not in titles
+    assert any(doc == "Lung" and title in ("Stage grouping", "N – Regional Lymph Nodes") for doc, title in titles)
+    # 文档按选择顺序、章节按原文顺序
+    assert [d for d, _ in titles] == sorted((d for d, _ in titles), key=["Lung", "Breast"].index)
+    assert "omitted" in sel.render()
+
+
+def test_documents_reload_only_when_changed(uicc_dir):
+    index = UICCIndex(uicc_dir)
+    first = index.sections_for(["Breast"])
+    assert index.sections_for(["Breast"])[0] is first[0]
+
+    path = uicc_dir / "Breast.txt"
+    path.write_text("BREAST\n\nStage grouping\nStage IV any T any N M1\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert "Stage IV" in index.sections_for(["Breast"])[1].text
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import MemmapVectorStore, export_chroma_collection
+
+
+class FakeCollection:
+    """Chroma collection.count / get(limit, offset, include) 的最小替身。"""
+
+    def __init__(self, ids, docs, metas, vecs):
+        self.ids, self.docs, self.metas, self.vecs = ids, docs, metas, vecs
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, limit, offset, include):
+        sl = slice(offset, offset + limit)
+        return {
+            "ids": self.ids[sl],
+            "documents": self.docs[sl],
+            "metadatas": self.metas[sl],
+            "embeddings": self.vecs[sl].tolist(),
+        }
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 60
+    metas = [
+        {"source": ["ESMO", "NCCN", "HEMA"][i % 3], "pdf_name": f"doc{i % 7}", "chunk_index": i, "page": i % 4}
+        for i in range(n)
+    ]
+    vecs = rng.normal(size=(n, 8)).astype(np.float32)
+    coll = FakeCollection([f"id{i}" for i in range(n)], [f"text {i}" for i in range(n)], metas, vecs)
+    assert export_chroma_collection(coll, tmp_path, batch_size=16) == n
+    return MemmapVectorStore(tmp_path), vecs, metas
+
+
+def _rows(store, where):
+    return sorted(int(store.metadatas[r]["chunk_index"]) for r in store._eval(where))
+
+
+def test_eval_matches_a_linear_scan(store):
+    s, _, metas = store
+    cases = {
+        "eq": ({"source": "ESMO"}, lambda m: m["source"] == "ESMO"),
+        "in": ({"pdf_name": {"$in": ["doc1", "doc3"]}}, lambda m: m["pdf_name"] in ("doc1", "doc3")),
+        "and": (
+            {"$and": [{"source": {"$eq": "NCCN"}}, {"pdf_name": {"$in": ["doc1", "doc2"]}}]},
+            lambda m: m["source"] == "NCCN" and m["pdf_name"] in ("doc1", "doc2"),
+        ),
+        "or": (
+            {"$or": [{"source": "HEMA"}, {"pdf_name": "doc0"}]},
+            lambda m: m["source"] == "HEMA" or m["pdf_name"] == "doc0",
+        ),
+        # 非索引字段逐行比较
+        "unindexed": ({"page": 2}, lambda m: m["page"] == 2),
+        "missing": ({"pdf_name": "nope"}, lambda m: False),
+    }
+    for name, (where, pred) in cases.items():
+        assert _rows(s, where) == [m["chunk_index"] for m in metas if pred(m)], name
+
+
+def test_unsupported_operator(store):
+    s, _, _ = store
+    with pytest.raises(ValueError):
+        s._eval({"page": {"$gt": 1}})
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 16384])
+def test_query_many_matches_exact_cosine_top_k(store, monkeypatch, chunk_rows):
+    monkeypatch.setattr(vector_store, "QUERY_CHUNK_ROWS", chunk_rows)
+    s, vecs, metas = store
+    queries = np.random.default_rng(1).normal(size=(3, 8)).astype(np.float32)
+    where = {"source": {"$in": ["ESMO", "NCCN"]}}
+
+    results = s.query_many(queries.tolist(), where, 5)
+    allowed = np.array([m["source"] in ("ESMO", "NCCN") for m in metas])
+    unit = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    for q, (docs, got_metas, dists) in zip(queries, results):
+        sims = unit @ (q / np.linalg.norm(q))
+        sims[~allowed] = -np.inf
+        expected = np.argsort(-sims)[:5]
+        assert [m["chunk_index"] for m in got_metas] == expected.tolist()
+        assert docs == [f"text {i}" for i in expected]
+        # float16 存储：距离只需近似
+        assert dists == pytest.approx((1 - sims[expected]).tolist(), abs=2e-3)
+        assert dists == sorted(dists)
+
+
+def test_query_edge_cases(store):
+    s, _, _ = store
+    assert s.query_many([], None, 5) == []
+    assert s.query([1.0] * 8, {"pdf_name": "nope"}, 5) == ([], [], [])
+    docs, _, _ = s.query([1.0] * 8, {"pdf_name": "doc0"}, 100)
+    assert len(docs) == len(s.get(where={"pdf_name": "doc0"})["ids"])
+
+
+def test_get_by_ids_with_embeddings(store):
+    s, vecs, _ = store
+    out = s.get(ids=["id5", "missing", "id2"], with_embeddings=True)
+    assert out["ids"] == ["id5", "id2"]
+    assert out["documents"] == ["text 5", "text 2"]
+    unit = vecs[[5, 2]] / np.linalg.norm(vecs[[5, 2]], axis=1, keepdims=True)
+    assert out["embeddings"] == pytest.approx(unit, abs=2e-3)
@@ -0,0 +1,56 @@
+"""
+后台事件循环：让同步工具（function_tool / run_vector_rag）也能复用长连接的异步 HTTP 客户端。
+
+所有共享的 httpx.AsyncClient 都绑定在同一个常驻 loop 上，
+同步调用方通过 run_sync() 提交协程并等待结果，异步调用方通过 run_async() await。
+"""
+import asyncio
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """获取（懒启动）常驻后台事件循环。"""
+    global _loop
+    if _loop is not None and _loop.is_running():
+        return _loop
+    with _lock:
+        if _loop is None or not _loop.is_running():
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=_run, name="tools-async-runtime", daemon=True).start()
+            ready.wait()
+            _loop = loop
+    return _loop
+
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """在后台 loop 上执行协程并阻塞等待结果（供同步代码使用）。"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())  # type: ignore[arg-type]
+    return future.result(timeout)
+
+
+async def run_async(coro: Awaitable[T]) -> T:
+    """在后台 loop 上执行协程，并在当前 loop 中 await 结果。"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())  # type: ignore[arg-type]
+    return await asyncio.wrap_future(future)
+
+
+def shutdown() -> None:
+    """停止后台 loop（主要用于测试 / 进程退出）。"""
+    global _loop
+    with _lock:
+        loop, _loop = _loop, None
+    if loop is not None and loop.is_running():
+        loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,431 @@
+"""
+run_vector_rag 的离线基准测试。
+
+  - 按 rag_guideline / rag_tool_who / rag_pathology 的元信息布局生成合成 Chroma 库（10k–1M chunk 可配置），
+    同一参数下的库会被复用（--rebuild 强制重建）
+  - 在本地线程里启动确定性的替身服务：OpenAI 兼容的 /v1/embeddings、/v1/chat/completions（文件选择）
+    以及 /v1/rerank，每个接口的延迟可配置
+  - 在不同并发度下重复调用 run_vector_rag，输出各阶段（rag_metrics）与端到端的 p50/p95 以及吞吐
+
+用法（在 server/tools 目录下）：
+    python bench_rag.py --profile guideline --chunks 100000 --requests 200 --concurrency 1,4,16
+    python bench_rag.py --profile pathology --chunks 10000 --rerank-per-doc-ms 1.5 --json out.json
+    python bench_rag.py --profile pathology_wide --chunks 30000 --docs 10 --concurrency 1,4
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# 合成文本的词表：疾病 / 分子 / 治疗词 + 通用填充词
+TOPIC_WORDS = (
+    "lymphoma leukemia myeloma melanoma sarcoma glioma carcinoma adenocarcinoma mesothelioma "
+    "breast lung colon rectal gastric pancreatic ovarian prostate bladder renal hepatic thyroid "
+    "egfr alk ros1 braf kras her2 brca1 brca2 myc bcl2 tp53 pdl1 flt3 npm1 idh1 jak2 "
+    "osimertinib alectinib trastuzumab pembrolizumab nivolumab rituximab venetoclax ibrutinib "
+    "cisplatin carboplatin docetaxel radiotherapy resection transplant chemotherapy maintenance"
+).split()
+FILLER_WORDS = (
+    "patients treatment recommended evidence level trial survival response therapy dose cycle "
+    "stage grade risk first line second line option consider standard phase randomized median "
+    "months progression toxicity benefit arm overall follow guideline panel category data"
+).split()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def hash_embed(texts: Sequence[str], dim: int) -> np.ndarray:
+    """确定性的哈希词袋 embedding（L2 归一化），替身服务与建库共用。"""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for tok in tokenize(text):
+            h = zlib.crc32(tok.encode("utf-8"))
+            out[row, h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.where(norms > 0, norms, 1.0)
+
+
+# ─────────────────────────── 布局 ───────────────────────────
+
+@dataclass(frozen=True)
+class BenchSource:
+    name: str
+    suffix: str
+    where_key: str
+
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "guideline": {
+        "tool_name": "rag_guideline",
+        "sources": (BenchSource("ESMO", ".pdf", "pdf_name"), BenchSource("NCCN", ".pdf", "pdf_name"), BenchSource("HEMA", ".pdf", "pdf_name")),
+        "n_results": 20,
+        "top_k": 10,
+        "score_threshold": 0.6,
+    },
+    "who": {
+        "tool_name": "rag_tool_who",
+        "sources": (BenchSource("WHO", ".txt", "txt_name"),),
+        "n_results": 20,
+        "top_k": 5,
+        "score_threshold": 0.6,
+    },
+    "pathology": {
+        "tool_name": "rag_pathology",
+        "sources": (BenchSource("PATHO", ".docx", "docx_name"),),
+        "n_results": 1000,
+        "top_k": 5,
+        "score_threshold": 0.0,
+    },
+    # 大候选集：每次检索取回 3000 个 chunk，用于观察裁剪 / 去重在候选很多时的耗时
+    "pathology_wide": {
+        "tool_name": "rag_pathology",
+        "sources": (BenchSource("PATHO", ".docx", "docx_name"),),
+        "n_results": 3000,
+        "top_k": 5,
+        "score_threshold": 0.0,
+    },
+}
+
+
+def _doc_topics(rng: random.Random, n_docs: int) -> List[List[str]]:
+    return [rng.sample(TOPIC_WORDS, 3) for _ in range(n_docs)]
+
+
+def _chunk_text(rng: random.Random, topics: Sequence[str], words: int) -> str:
+    picked = [rng.choice(topics) if rng.random() < 0.15 else rng.choice(FILLER_WORDS) for _ in range(words)]
+    return " ".join(picked)
+
+
+def build_corpus(
+    root: Path,
+    profile: str,
+    chunks: int,
+    docs_per_source: int,
+    dim: int,
+    chunk_words: int,
+    seed: int,
+    rebuild: bool = False,
+    batch_size: int = 4000,
+) -> Dict[str, Dict[str, Any]]:
+    """生成（或复用）合成库；返回 {source: {"db": path, "storage_dir": path, "topics": {doc: [...]}}}。"""
+    import chromadb
+
+    spec = PROFILES[profile]
+    sources: Sequence[BenchSource] = spec["sources"]
+    tag = f"{profile}_{chunks}_{docs_per_source}_{dim}_{chunk_words}_{seed}"
+    base = root / tag
+    manifest = base / "manifest.json"
+    if manifest.exists() and not rebuild:
+        with open(manifest, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if base.exists():
+        shutil.rmtree(base)
+
+    rng = random.Random(seed)
+    per_source = max(1, chunks // len(sources))
+    layout: Dict[str, Dict[str, Any]] = {}
+    for src in sources:
+        storage_dir = base / "files" / src.name
+        storage_dir.mkdir(parents=True, exist_ok=True)
+        db_path = base / "db" / src.name
+        collection = chromadb.PersistentClient(path=str(db_path)).get_or_create_collection(name="medical_collection")
+
+        doc_names = [f"{src.name.lower()}_{i:04d}" for i in range(docs_per_source)]
+        topics = dict(zip(doc_names, _doc_topics(rng, docs_per_source)))
+        for name in doc_names:
+            (storage_dir / f"{name}{src.suffix}").touch()
+
+        start = time.perf_counter()
+        for offset in range(0, per_source, batch_size):
+            n = min(batch_size, per_source - offset)
+            ids, texts, metas = [], [], []
+            for j in range(offset, offset + n):
+                doc = doc_names[j % docs_per_source]
+                ids.append(f"{doc}::{j}")
+                texts.append(_chunk_text(rng, topics[doc], chunk_words))
+                metas.append({src.where_key: doc, "chunk_index": j // docs_per_source, "section": f"S{j % 7}"})
+            collection.add(ids=ids, documents=texts, metadatas=metas, embeddings=hash_embed(texts, dim).tolist())
+            print(f"  {src.name}: {offset + n}/{per_source} chunks ({time.perf_counter() - start:.0f}s)", flush=True)
+        layout[src.name] = {"db": str(db_path), "storage_dir": str(storage_dir), "topics": topics}
+
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(layout, f)
+    return layout
+
+
+# ─────────────────────────── 替身服务 ───────────────────────────
+
+@dataclass
+class StandInLatency:
+    embed_ms: float = 20.0
+    chat_ms: float = 300.0
+    rerank_ms: float = 10.0
+    rerank_per_doc_ms: float = 1.0
+
+
+def _make_handler(latency: StandInLatency, dim: int, select_k: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:  # 静默
+            pass
+
+        def _reply(self, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            path = self.path.rstrip("/")
+            if path.endswith("/embeddings"):
+                self._embeddings(req)
+            elif path.endswith("/chat/completions"):
+                self._chat(req)
+            elif path.endswith("/rerank"):
+                self._rerank(req)
+            else:
+                self.send_error(404)
+
+        def _embeddings(self, req: dict) -> None:
+            time.sleep(latency.embed_ms / 1000)
+            inputs = req.get("input") or []
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            vecs = hash_embed(inputs, dim)
+            self._reply({
+                "object": "list",
+                "model": req.get("model", "stand-in"),
+                "data": [{"object": "embedding", "index": i, "embedding": v.tolist()} for i, v in enumerate(vecs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+
+        def _chat(self, req: dict) -> None:
+            time.sleep(latency.chat_ms / 1000)
+            prompt = "\n".join(str(m.get("content", "")) for m in req.get("messages", []))
+            head, _, listing = prompt.partition("Available files:")
+            files = [line[2:].strip() for line in listing.splitlines() if line.startswith("- ")]
+            # 确定性选择：按文件名与提示词的词重叠排序，取前 select_k 个
+            terms = set(tokenize(head))
+            ranked = sorted(files, key=lambda f: (-len(terms.intersection(tokenize(f))), f))
+            content = json.dumps({"selected_items": ranked[:select_k]})
+            self._reply({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "stand-in"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        def _rerank(self, req: dict) -> None:
+            docs = req.get("documents") or []
+            time.sleep((latency.rerank_ms + latency.rerank_per_doc_ms * len(docs)) / 1000)
+            q = set(tokenize(req.get("query", "")))
+            results = []
+            for i, d in enumerate(docs):
+                toks = tokenize(d)
+                overlap = sum(1 for t in toks if t in q) / (len(toks) or 1)
+                results.append({"index": i, "relevance_score": min(1.0, 0.5 + 2 * overlap)})
+            results.sort(key=lambda r: r["relevance_score"], reverse=True)
+            self._reply({"results": results})
+
+    return Handler
+
+
+class StandInServer:
+    """在后台线程运行的替身 HTTP 服务。"""
+
+    def __init__(self, latency: StandInLatency, dim: int, select_k: int = 3, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(latency, dim, select_k))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="bench-stand-in", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StandInServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ─────────────────────────── 运行 ───────────────────────────
+
+def _quantiles(values: Sequence[float]) -> Tuple[float, float]:
+    if not values:
+        return 0.0, 0.0
+    ordered = sorted(values)
+    p50 = statistics.median(ordered)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return p50, p95
+
+
+def _make_queries(layout: Dict[str, Dict[str, Any]], n: int, seed: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    topics = [t for src in layout.values() for t in src["topics"].values()]
+    return [f"{' '.join(rng.choice(topics))} {rng.choice(FILLER_WORDS)} {rng.choice(FILLER_WORDS)}" for _ in range(n)]
+
+
+def run_benchmark(
+    layout: Dict[str, Dict[str, Any]],
+    profile: str,
+    requests: int,
+    concurrency_levels: Sequence[int],
+    seed: int,
+) -> List[Dict[str, Any]]:
+    # 这些模块会在导入时读取环境变量，必须在替身服务地址写入环境之后导入
+    from config_manager import external_client
+    from rag_common import run_vector_rag
+    from rag_metrics import metrics_registry
+    from vector_store import get_persistent_client
+
+    spec = PROFILES[profile]
+    tool_name = spec["tool_name"]
+
+    def _citation(md: dict) -> str:
+        return str(md.get("pdf_name") or md.get("txt_name") or md.get("docx_name") or "Unknown")
+
+    sources: Dict[str, Dict[str, Any]] = {}
+    for src in spec["sources"]:
+        info = layout[src.name]
+        sources[src.name] = {
+            "label": src.name,
+            "storage_dir": Path(info["storage_dir"]),
+            "suffixes": [src.suffix],
+            "collection": get_persistent_client(Path(info["db"])).get_collection(name="medical_collection"),
+            "where_key": src.where_key,
+            "id_transform": lambda name, _sfx=src.suffix: name[: -len(_sfx)] if name.lower().endswith(_sfx) else name,
+            "citation_builder": _citation,
+            "n_results": spec["n_results"],
+        }
+
+    queries = _make_queries(layout, requests, seed)
+
+    def _one(q: str) -> float:
+        start = time.perf_counter()
+        run_vector_rag(
+            tool_name=tool_name,
+            patient_history="",
+            query=q,
+            role_hint=None,
+            external_client=external_client,
+            sources=sources,
+            n_results=spec["n_results"],
+            top_k=spec["top_k"],
+            score_threshold=spec["score_threshold"],
+            semantic={"enabled": False},  # 各并发度重复同一批查询，缓存会掩盖真实耗时
+        )
+        return (time.perf_counter() - start) * 1000
+
+    _one(queries[0])  # 预热：打开集合、建立连接池
+    reports: List[Dict[str, Any]] = []
+    for conc in concurrency_levels:
+        metrics_registry.reset()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=conc) as pool:
+            latencies = list(pool.map(_one, queries))
+        wall = time.perf_counter() - start
+        p50, p95 = _quantiles(latencies)
+        full = metrics_registry.snapshot()
+        snap = full.get(tool_name, {})
+        reports.append({
+            "concurrency": conc,
+            "requests": len(latencies),
+            "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+            "e2e_ms": {"p50": p50, "p95": p95},
+            "stages_ms": {k: {"p50": v["p50"], "p95": v["p95"]} for k, v in snap.get("stages_ms", {}).items()},
+            "counts": {k: v["mean"] for k, v in snap.get("counts", {}).items()},
+            "embed_batch": full.get("embed_batcher", {}).get("counts", {}),
+        })
+    return reports
+
+
+def print_report(reports: Sequence[Dict[str, Any]]) -> None:
+    for rep in reports:
+        print(
+            f"\nconcurrency={rep['concurrency']}  requests={rep['requests']}  "
+            f"throughput={rep['throughput_rps']:.2f} req/s  "
+            f"e2e p50={rep['e2e_ms']['p50']:.0f}ms p95={rep['e2e_ms']['p95']:.0f}ms"
+        )
+        print(f"  {'stage':<12}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage, q in rep["stages_ms"].items():
+            print(f"  {stage:<12}{q['p50']:>10.1f}{q['p95']:>10.1f}")
+        if rep["counts"]:
+            print("  mean sizes: " + " ".join(f"{k}={v:.0f}" for k, v in rep["counts"].items()))
+        batch = rep.get("embed_batch") or {}
+        if batch.get("batch_inputs"):
+            b = batch["batch_inputs"]
+            print(
+                f"  embed batches: {b['count']} requests, inputs/request mean={b['mean']:.1f} "
+                f"p95={b['p95']:.0f} max={b['max']:.0f}"
+            )
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark for run_vector_rag with local stand-in services.")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="guideline")
+    parser.add_argument("--chunks", type=int, default=10000, help="total synthetic chunks across the profile's sources")
+    parser.add_argument("--docs", type=int, default=50, help="documents per source")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--chunk-words", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--data-dir", type=Path, default=Path(__file__).parent / "data" / "bench")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the synthetic collections")
+    parser.add_argument("--requests", type=int, default=50, help="calls per concurrency level")
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated concurrency levels")
+    parser.add_argument("--select-k", type=int, default=3, help="files the stand-in LLM selects per source")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument("--rerank-latency-ms", type=float, default=10.0)
+    parser.add_argument("--rerank-per-doc-ms", type=float, default=1.0)
+    parser.add_argument("--json", type=Path, help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    print(f"Preparing {args.profile} corpus: {args.chunks} chunks ...", flush=True)
+    layout = build_corpus(
+        args.data_dir, args.profile, args.chunks, args.docs, args.dim, args.chunk_words, args.seed, rebuild=args.rebuild,
+    )
+    latency = StandInLatency(args.embed_latency_ms, args.chat_latency_ms, args.rerank_latency_ms, args.rerank_per_doc_ms)
+    with StandInServer(latency, args.dim, select_k=args.select_k) as server:
+        # config_manager 从 LOCAL_* / RERANKER_* 环境变量读取服务地址
+        os.environ["LOCAL_API_BASE"] = f"{server.base_url}/v1"
+        os.environ["LOCAL_API_KEY"] = "EMPTY"
+        os.environ["RERANKER_API_BASE"] = f"{server.base_url}/v1/rerank"
+        levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+        reports = run_benchmark(layout, args.profile, args.requests, levels, args.seed)
+
+    print_report(reports)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: str(v) for k, v in vars(args).items()}, "reports": reports}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
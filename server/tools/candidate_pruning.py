@@ -0,0 +1,135 @@
+"""
+rerank 前的候选裁剪：只把得分最高的一部分 chunk 送进 cross-encoder。
+
+打分方式（mode）：
+  - "distance": Chroma 向量距离（越小越好）
+  - "bm25":     在候选集合内部计算的 BM25 词法分数
+  - "hybrid":   两者 min-max 归一化后按 alpha 加权
+  - "off":      不裁剪
+并支持每个 source 的上限（per_source_cap），避免单一来源挤占 rerank 名额。
+"""
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PRUNE_MODES = ("off", "distance", "bm25", "hybrid")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def bm25_scores(query: str, docs: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """在候选集合上计算 BM25（IDF 也只基于候选集合）。"""
+    if not docs:
+        return []
+    q_terms = set(tokenize(query))
+    doc_tokens = [tokenize(d) for d in docs]
+    n = len(doc_tokens)
+    avgdl = (sum(len(t) for t in doc_tokens) / n) or 1.0
+    df: Counter = Counter()
+    for toks in doc_tokens:
+        df.update(q_terms.intersection(toks))
+    idf = {t: math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in q_terms}
+
+    scores: List[float] = []
+    for toks in doc_tokens:
+        tf = Counter(toks)
+        dl = len(toks)
+        s = 0.0
+        for t in q_terms:
+            f = tf.get(t, 0)
+            if f:
+                s += idf[t] * f * (k1 + 1) / (f + k1 * (1 - b + b * dl / avgdl))
+        scores.append(s)
+    return scores
+
+
+def _minmax(values: Sequence[float]) -> List[float]:
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi - lo <= 1e-12:
+        return [1.0] * len(values)
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+@dataclass
+class PruneReport:
+    mode: str
+    before: int
+    after: int
+    per_source: Dict[str, int] = field(default_factory=dict)
+    elapsed_ms: float = 0.0
+    est_rerank_saved_ms: Optional[float] = None
+
+    def summary(self) -> str:
+        saved = f" | est. rerank saving ~{self.est_rerank_saved_ms:.0f}ms" if self.est_rerank_saved_ms is not None else ""
+        return (
+            f"prune[{self.mode}] {self.before} → {self.after} candidates "
+            f"{self.per_source} in {self.elapsed_ms:.1f}ms{saved}"
+        )
+
+
+def prune_candidates(
+    query: str,
+    docs: Sequence[str],
+    distances: Optional[Sequence[float]],
+    sources: Sequence[str],
+    *,
+    mode: str = "distance",
+    max_candidates: int = 64,
+    per_source_cap: Optional[Dict[str, int]] = None,
+    hybrid_alpha: float = 0.5,
+) -> Tuple[List[int], PruneReport]:
+    """
+    返回保留的候选下标（按得分降序）以及裁剪报告。
+    distances 缺失时 distance/hybrid 退化为检索顺序 / 纯 BM25。
+    """
+    start = time.perf_counter()
+    n = len(docs)
+    mode = mode if mode in PRUNE_MODES else "distance"
+    caps = per_source_cap or {}
+
+    if mode == "off" or n == 0:
+        keep = list(range(n))
+    else:
+        has_dist = distances is not None and len(distances) == n
+        # 向量相似度：距离取负；没有距离时用检索顺序代替
+        vec = [-float(d) for d in distances] if has_dist else [-float(i) for i in range(n)]  # type: ignore[union-attr]
+        if mode == "distance":
+            scores = vec
+        elif mode == "bm25":
+            scores = bm25_scores(query, docs)
+        else:
+            lex = _minmax(bm25_scores(query, docs))
+            sem = _minmax(vec) if has_dist else [0.0] * n
+            alpha = hybrid_alpha if has_dist else 0.0
+            scores = [alpha * s + (1 - alpha) * l for s, l in zip(sem, lex)]
+
+        limit = max(1, int(max_candidates)) if max_candidates else n
+        used: Counter = Counter()
+        keep = []
+        for i in sorted(range(n), key=lambda i: scores[i], reverse=True):
+            src = sources[i] if i < len(sources) else ""
+            cap = caps.get(src)
+            if cap is not None and used[src] >= cap:
+                continue
+            used[src] += 1
+            keep.append(i)
+            if len(keep) >= limit:
+                break
+
+    report = PruneReport(
+        mode=mode,
+        before=n,
+        after=len(keep),
+        per_source=dict(Counter(sources[i] for i in keep if i < len(sources))),
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+    )
+    return keep, report
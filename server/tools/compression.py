@@ -0,0 +1,163 @@
+"""
+rerank 之后的查询相关抽取式压缩。
+
+top_k=10 的指南 chunk 会给 agent 的下一轮增加几千 token 的 prefill。这里把选中的 chunk 切成句子，
+按与查询的相关度给句子打分，在 token 预算内只保留得分最高的句子：
+  - 打分（mode）："lexical" 为句子集合内的 BM25；"embedding" 用已算好的查询向量与句子向量的余弦相似度
+    （句子 embedding 一次批量请求，失败时退回 lexical）
+  - 先保证每个 chunk（按 rerank 顺序）保留其最相关的一句，再按分数从高到低补充句子
+  - 每个 chunk 内的句子保持原顺序，不相邻的片段之间用 “…” 连接；citation 由调用方照常附加
+token 数按约 4 字符 / token 估计（与 uicc_index 一致）。
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from candidate_pruning import bm25_scores
+from config_manager import config_manager
+
+COMPRESS_MODES = ("lexical", "embedding")
+
+_SENTENCE_RE = re.compile(r"[^.!?。！？；;\n]+(?:[.!?。！？；;]+|\n+|$)")
+_GAP = " … "
+RANK_PRIOR = 0.15  # rerank 名次的先验权重：同等相关度下优先保留排名靠前的 chunk
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点与换行切句，保留原文（含标点）；空白句丢弃。"""
+    return [s.strip() for s in _SENTENCE_RE.findall(text or "") if s.strip()]
+
+
+def resolve_compress_settings(tool_name: str, overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.compress]（含 budgets 中的按工具预算）与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("rag").get("compress", {}))
+    budgets = dict(cfg.pop("budgets", {}) or {})
+    if tool_name in budgets:
+        cfg["budget_tokens"] = budgets[tool_name]
+    if overrides:
+        cfg.update(overrides)
+    mode = str(cfg.get("mode", "lexical"))
+    return {
+        "enabled": bool(cfg.get("enabled", False)),
+        "mode": mode if mode in COMPRESS_MODES else "lexical",
+        "budget_tokens": int(cfg.get("budget_tokens", 1500)),
+    }
+
+
+@dataclass
+class CompressionReport:
+    chunks: int
+    sentences_total: int = 0
+    sentences_kept: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    mode: str = "lexical"
+    elapsed_ms: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"compress[{self.mode}] {self.chunks} chunks ~{self.tokens_before} → ~{self.tokens_after} tokens "
+            f"({self.sentences_kept}/{self.sentences_total} sentences) in {self.elapsed_ms:.1f}ms"
+        )
+
+
+def _embedding_scores(
+    query_embedding: Sequence[float], sentences: Sequence[str], embed_fn: Callable[[Sequence[str]], List[List[float]]]
+) -> List[float]:
+    vecs = np.asarray(embed_fn(list(sentences)), dtype=np.float32)
+    q = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(vecs, axis=1) * (np.linalg.norm(q) or 1.0)
+    return ((vecs @ q) / np.where(norms > 0, norms, 1.0)).astype(float).tolist()
+
+
+def compress_chunks(
+    query: str,
+    docs: Sequence[str],
+    budget_tokens: int,
+    *,
+    mode: str = "lexical",
+    query_embedding: Optional[Sequence[float]] = None,
+    embed_fn: Optional[Callable[[Sequence[str]], List[List[float]]]] = None,
+) -> Tuple[List[str], CompressionReport]:
+    """
+    docs 按 rerank 顺序传入，返回等长的压缩后文本（预算不足时排名靠后的 chunk 可能为空串）
+    与压缩报告。总量不超过预算时原样返回。
+    """
+    start = time.perf_counter()
+    report = CompressionReport(chunks=len(docs), mode=mode)
+    report.tokens_before = sum(estimate_tokens(d) for d in docs)
+    if report.tokens_before <= budget_tokens or not docs:
+        report.tokens_after = report.tokens_before
+        report.elapsed_ms = (time.perf_counter() - start) * 1000
+        return list(docs), report
+
+    # (chunk 下标, 句内序号, 句子)
+    units: List[Tuple[int, int, str]] = []
+    n_sentences: List[int] = []
+    for ci, doc in enumerate(docs):
+        sents = split_sentences(doc)
+        n_sentences.append(len(sents))
+        units.extend((ci, si, sent) for si, sent in enumerate(sents))
+    report.sentences_total = len(units)
+    sentences = [u[2] for u in units]
+
+    raw: Optional[List[float]] = None
+    if mode == "embedding" and query_embedding is not None and embed_fn is not None:
+        try:
+            raw = _embedding_scores(query_embedding, sentences, embed_fn)
+        except Exception:
+            raw = None
+            report.mode = "lexical"
+    if raw is None:
+        raw = bm25_scores(query, sentences)
+    arr = np.asarray(raw, dtype=np.float64)
+    spread = float(arr.max() - arr.min()) if arr.size else 0.0
+    norm = (arr - arr.min()) / spread if spread > 1e-12 else np.ones_like(arr)
+    n_docs = max(1, len(docs))
+    scores = [float(s) + RANK_PRIOR * (1 - ci / n_docs) for s, (ci, _, _) in zip(norm, units)]
+
+    cost = [estimate_tokens(s) for s in sentences]
+    kept: set = set()
+    used = 0
+    # 1) 每个 chunk 先保留最相关的一句（按 rerank 顺序）
+    best_per_chunk: Dict[int, int] = {}
+    for ui, (ci, _, _) in enumerate(units):
+        if ci not in best_per_chunk or scores[ui] > scores[best_per_chunk[ci]]:
+            best_per_chunk[ci] = ui
+    for ci in range(len(docs)):
+        ui = best_per_chunk.get(ci)
+        if ui is not None and used + cost[ui] <= budget_tokens:
+            kept.add(ui)
+            used += cost[ui]
+    # 2) 按分数补充
+    for ui in sorted(range(len(units)), key=lambda i: scores[i], reverse=True):
+        if ui not in kept and used + cost[ui] <= budget_tokens:
+            kept.add(ui)
+            used += cost[ui]
+
+    out: List[str] = []
+    for ci in range(len(docs)):
+        parts: List[str] = []
+        prev_si = None
+        for ui in sorted(u for u in kept if units[u][0] == ci):
+            si = units[ui][1]
+            if prev_si is not None:
+                parts.append(" " if si == prev_si + 1 else _GAP)
+            elif si > 0:
+                parts.append("… ")
+            parts.append(units[ui][2])
+            prev_si = si
+        if prev_si is not None and prev_si < n_sentences[ci] - 1:
+            parts.append(" …")
+        out.append("".join(parts))
+    report.sentences_kept = len(kept)
+    report.tokens_after = sum(estimate_tokens(t) for t in out if t)
+    report.elapsed_ms = (time.perf_counter() - start) * 1000
+    return out, report
@@ -50,6 +50,7 @@ class ConfigManager:
         
         # 初始化客户端（延迟初始化，避免导入时的问题）
         self._embed_client: Optional[OpenAI] = None
+        self._async_embed_client: Optional[AsyncOpenAI] = None
         self._external_client: Optional[OpenAI] = None
         self._async_external_client: Optional[AsyncOpenAI] = None
         
@@ -71,6 +72,7 @@ class ConfigManager:
         self.ESMO_DB_STORAGE = self.base_dir / self._paths_config.get("esmo_db_storage", "ESMO_chroma_db_qwen")
         self.NCCN_DB_STORAGE = self.base_dir / self._paths_config.get("nccn_db_storage", "NCCN_chroma_db_qwen")
         self.HEMA_DB_STORAGE = self.base_dir / self._paths_config.get("hema_db_storage", "HEMA_chroma_db_qwen")
+        self.GUIDELINE_DB_STORAGE = self.base_dir / self._paths_config.get("guideline_db_storage", "guideline_chroma_db_qwen")
         self.PATHO_DB_STORAGE = self.base_dir / self._paths_config.get("patho_db_storage", "patho_chroma_db_qwen")
         self.WHO_DB_STORAGE = self.base_dir / self._paths_config.get("who_db_storage", "who_chroma_db_qwen")
         self.UICC_DB_STORAGE = self.base_dir / self._paths_config.get("uicc_db_storage", "uicc_chroma_db_qwen0717")
@@ -108,6 +110,16 @@ class ConfigManager:
             )
         return self._embed_client
 
+    @property
+    def async_embed_client(self) -> AsyncOpenAI:
+        """获取 embedding 客户端（异步，懒加载）"""
+        if self._async_embed_client is None:
+            self._async_embed_client = AsyncOpenAI(
+                api_key=self._embedding_config["api_key"],
+                base_url=self._embedding_config.get("api_base"),
+            )
+        return self._async_embed_client
+
     @property
     def external_client(self) -> OpenAI:
         """获取外部 LLM 客户端（同步，懒加载）"""
@@ -134,6 +146,10 @@ class ConfigManager:
         """获取指定section的配置"""
         return self._load_section(section_name)
 
+    def get_section(self, section_name: str) -> Dict[str, Any]:
+        """获取可选 section 的原始配置（不注入环境变量，不存在时返回空 dict）"""
+        return dict(self._full_config.get(section_name, {}))
+
     def get_full_config(self) -> Dict[str, Any]:
         """获取完整配置"""
         return self._full_config.copy()
@@ -182,6 +198,7 @@ config_manager = ConfigManager()
 
 # 导出常用对象，保持向后兼容
 embed_client = config_manager.embed_client
+async_embed_client = config_manager.async_embed_client
 external_client = config_manager.external_client
 async_external_client = config_manager.async_external_client
 EMBED_MODEL = config_manager.EMBED_MODEL
@@ -198,6 +215,7 @@ HEMA_STORAGE = config_manager.HEMA_STORAGE
 ESMO_DB_STORAGE = config_manager.ESMO_DB_STORAGE
 NCCN_DB_STORAGE = config_manager.NCCN_DB_STORAGE
 HEMA_DB_STORAGE = config_manager.HEMA_DB_STORAGE
+GUIDELINE_DB_STORAGE = config_manager.GUIDELINE_DB_STORAGE
 UICC_DIR = config_manager.UICC_DIR
 WHO_DIR = config_manager.WHO_DIR
 PATHO_DIR = config_manager.PATHO_DIR
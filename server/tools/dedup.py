@@ -0,0 +1,304 @@
+"""
+跨来源的候选去重与 MMR 多样化。
+
+ESMO / NCCN 经常包含几乎相同的段落，切块窗口重叠也会产生重复 chunk；
+这些重复文本会白白占用 rerank 与下游 LLM prefill。这里：
+  - 先按规范化文本去掉完全重复
+  - 再用词级 shingle 的 MinHash 签名估计 Jaccard 相似度，去掉近似重复（保留向量距离更近的一条）。
+    近似重复只在 LSH 桶内比较：签名切成 bands 段，至少一段完全相同的候选才逐行比较签名，
+    内存为 O(n·num_perm)。默认 16 段 × 4 行时，相似度 0.8 的一对被漏检的概率约 2e-4
+  - rerank 之后可选地用 MMR（maximal marginal relevance）从通过阈值的 chunk 中挑最终 top_k，
+    冗余度同样用 MinHash 相似度度量，无需额外的 embedding 请求
+
+基准（在 server/tools 目录下）：
+    python dedup.py bench --sizes 1000 3000 10000
+"""
+import argparse
+import hashlib
+import random
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PRIME = np.uint64(4294967311)  # > 2**32，crc32 哈希值都小于它
+_MAX_COEF = 2 ** 31  # a * h + b < 2**63，uint64 不会溢出
+_BAND_MIX = np.random.default_rng(0).integers(1, 2 ** 63, size=1024, dtype=np.uint64) | np.uint64(1)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_TOKEN_RE.findall((text or "").lower()))
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    tokens = _normalize(text).split()
+    if len(tokens) <= shingle_size:
+        grams = [" ".join(tokens)]
+    else:
+        grams = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in set(grams)), dtype=np.uint64)
+
+
+def minhash_signatures(docs: Sequence[str], num_perm: int = 64, shingle_size: int = 5, seed: int = 1) -> np.ndarray:
+    """返回 (len(docs), num_perm) 的 MinHash 签名矩阵。"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MAX_COEF, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _MAX_COEF, size=num_perm, dtype=np.uint64)
+    sig = np.empty((len(docs), num_perm), dtype=np.uint64)
+    for row, doc in enumerate(docs):
+        h = _shingle_hashes(doc, shingle_size)
+        sig[row] = ((h[:, None] * a[None, :] + b[None, :]) % _PRIME).min(axis=0)
+    return sig
+
+
+def jaccard_matrix(signatures: np.ndarray) -> np.ndarray:
+    """由签名估计两两 Jaccard 相似度，返回 (n, n) float32 矩阵（逐行计算；只用于 MMR 的小候选集）。"""
+    n = signatures.shape[0]
+    out = np.empty((n, n), dtype=np.float32)
+    for row in range(n):
+        out[row] = (signatures == signatures[row]).mean(axis=1, dtype=np.float32)
+    return out
+
+
+def band_keys(signatures: np.ndarray, bands: int = 16) -> np.ndarray:
+    """把签名切成 bands 段，每段哈希成一个 uint64，返回 (n, bands)；段长为 num_perm // bands，余下的列不参与。"""
+    n, num_perm = signatures.shape
+    bands = max(1, min(int(bands), num_perm))
+    rows = num_perm // bands
+    blocks = signatures[:, : bands * rows].reshape(n, bands, rows)
+    # 乘以奇数系数后求和（uint64 自然回绕）；碰撞只会多出候选，之后仍会逐行校验
+    return (blocks * _BAND_MIX[:rows]).sum(axis=2, dtype=np.uint64)
+
+
+def _lsh_filter(
+    signatures: np.ndarray, threshold: float, bands: int, existing: Optional[np.ndarray] = None
+) -> List[int]:
+    """
+    按行顺序保留签名：与之前保留的行（以及 existing 中的行）估计 Jaccard ≥ threshold 的行丢弃。
+    只比较至少共享一个 LSH 桶的行。
+    """
+    base = existing if existing is not None and existing.shape[0] else None
+    pool = signatures if base is None else np.vstack([base, signatures])
+    offset = 0 if base is None else base.shape[0]
+    buckets: List[Dict[int, List[int]]] = []
+
+    def _add(row: int, keys: Sequence[int]) -> None:
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(row)
+
+    keys = band_keys(pool, bands).tolist()
+    buckets.extend({} for _ in range(len(keys[0]) if keys else 0))
+    for row in range(offset):
+        _add(row, keys[row])
+
+    kept: List[int] = []
+    for row in range(signatures.shape[0]):
+        row_keys = keys[offset + row]
+        cand = {j for band, key in enumerate(row_keys) for j in buckets[band].get(key, ())}
+        if cand:
+            idx = np.fromiter(cand, dtype=np.int64, count=len(cand))
+            if float((pool[idx] == signatures[row]).mean(axis=1).max()) >= threshold:
+                continue
+        kept.append(row)
+        _add(offset + row, row_keys)
+    return kept
+
+
+@dataclass
+class DedupReport:
+    before: int
+    after: int
+    exact: int = 0
+    near: int = 0
+    elapsed_ms: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"dedup {self.before} → {self.after} candidates "
+            f"(exact={self.exact}, near={self.near}) in {self.elapsed_ms:.1f}ms"
+        )
+
+
+def dedup_candidates(
+    docs: Sequence[str],
+    distances: Optional[Sequence[float]] = None,
+    *,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    shingle_size: int = 5,
+    bands: int = 16,
+) -> Tuple[List[int], DedupReport, np.ndarray]:
+    """
+    返回保留的候选下标（保持原顺序）、去重报告以及保留候选的 MinHash 签名。
+    重复组内保留距离最小（缺少距离时为检索顺序最靠前）的一条。
+    """
+    start = time.perf_counter()
+    n = len(docs)
+    if n == 0:
+        return [], DedupReport(0, 0), np.zeros((0, num_perm), dtype=np.uint64)
+    if distances is not None and len(distances) == n:
+        order = [int(i) for i in np.argsort(np.asarray(distances, dtype=np.float64), kind="stable")]
+    else:
+        order = list(range(n))
+
+    # 完全重复（规范化后相同）
+    seen = set()
+    unique: List[int] = []
+    for i in order:
+        key = hashlib.sha1(_normalize(docs[i]).encode("utf-8")).digest()
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(i)
+    exact = n - len(unique)
+
+    sig = minhash_signatures([docs[i] for i in unique], num_perm=num_perm, shingle_size=shingle_size)
+    kept_rows = _lsh_filter(sig, threshold, bands)
+    kept_rows.sort(key=lambda r: unique[r])
+    keep = [unique[r] for r in kept_rows]
+    report = DedupReport(
+        before=n,
+        after=len(keep),
+        exact=exact,
+        near=len(unique) - len(keep),
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+    )
+    return keep, report, sig[kept_rows]
+
+
+def dedup_against(
+    docs: Sequence[str],
+    distances: Optional[Sequence[float]],
+    existing: Optional[np.ndarray],
+    *,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    shingle_size: int = 5,
+    bands: int = 16,
+) -> Tuple[List[int], DedupReport, np.ndarray]:
+    """
+    对新一批候选去重：先在批内去重，再去掉与 existing（已保留候选的签名）近似重复的条目。
+    用于分批检索时只处理新增候选。
+    """
+    start = time.perf_counter()
+    keep, report, sig = dedup_candidates(
+        docs, distances, threshold=threshold, num_perm=num_perm, shingle_size=shingle_size, bands=bands
+    )
+    if existing is not None and existing.shape[0] and sig.shape[0]:
+        fresh = _lsh_filter(sig, threshold, bands, existing=existing)
+        report.near += len(keep) - len(fresh)
+        keep = [keep[r] for r in fresh]
+        sig = sig[fresh]
+        report.after = len(keep)
+    report.elapsed_ms = (time.perf_counter() - start) * 1000
+    return keep, report, sig
+
+
+def mmr_select(
+    scored: Sequence[Tuple[int, float]],
+    similarity: np.ndarray,
+    k: int,
+    lambda_: float = 0.7,
+) -> List[Tuple[int, float]]:
+    """
+    Maximal marginal relevance：在 scored（(下标, 相关度)）中选 k 个，
+    每步最大化 lambda * 相关度 - (1 - lambda) * 与已选结果的最大相似度。
+    similarity 以原始下标索引。
+    """
+    if k <= 0 or not scored:
+        return []
+    idx = np.array([i for i, _ in scored], dtype=np.int64)
+    rel = np.array([s for _, s in scored], dtype=np.float64)
+    sim = similarity[np.ix_(idx, idx)].astype(np.float64)
+    redundancy = np.zeros(len(idx), dtype=np.float64)
+    available = np.ones(len(idx), dtype=bool)
+    picked: List[int] = []
+    for _ in range(min(k, len(idx))):
+        mmr = np.where(available, lambda_ * rel - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, sim[:, best])
+    return [(int(idx[p]), float(rel[p])) for p in picked]
+
+
+def _synthetic_chunks(n: int, rng: random.Random, words: int = 120, dup_rate: float = 0.2) -> List[str]:
+    vocab = [f"w{i}" for i in range(2000)]
+    docs: List[str] = []
+    for _ in range(n):
+        if docs and rng.random() < dup_rate:
+            # 近似重复：改掉少量词
+            tokens = rng.choice(docs).split()
+            for _ in range(max(1, len(tokens) // 50)):
+                tokens[rng.randrange(len(tokens))] = rng.choice(vocab)
+            docs.append(" ".join(tokens))
+        else:
+            docs.append(" ".join(rng.choice(vocab) for _ in range(words)))
+    return docs
+
+
+def _pairwise_keep(sig: np.ndarray, threshold: float) -> List[int]:
+    """逐行两两比较的参考实现（基准中统计 LSH 漏检的近似重复）。"""
+    kept: List[int] = []
+    for row in range(sig.shape[0]):
+        if kept and float((sig[kept] == sig[row]).mean(axis=1).max()) >= threshold:
+            continue
+        kept.append(row)
+    return kept
+
+
+def run_bench(sizes: Sequence[int], threshold: float = 0.8, bands: int = 16, seed: int = 0) -> List[Dict[str, float]]:
+    import tracemalloc
+
+    rng = random.Random(seed)
+    rows: List[Dict[str, float]] = []
+    for size in sizes:
+        docs = _synthetic_chunks(size, rng)
+        start = time.perf_counter()
+        sig = minhash_signatures(docs)
+        sig_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        kept_rows = _lsh_filter(sig, threshold, bands)
+        lsh_ms = (time.perf_counter() - start) * 1000
+
+        # 峰值内存单独测（tracemalloc 会拖慢计时）
+        tracemalloc.start()
+        keep, _, _ = dedup_candidates(docs, threshold=threshold, bands=bands)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+        ref = _pairwise_keep(sig, threshold)
+        missed = len(set(kept_rows) - set(ref))
+        rows.append({
+            "candidates": size, "signature_ms": sig_ms, "lsh_ms": lsh_ms, "peak_mb": peak_mb, "kept": len(keep),
+            "reference_kept": len(ref), "missed_duplicates": missed,
+        })
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Candidate dedup utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("bench", help="time LSH dedup on synthetic candidates and compare with a full pairwise scan")
+    p_bench.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000])
+    p_bench.add_argument("--threshold", type=float, default=0.8)
+    p_bench.add_argument("--bands", type=int, default=16)
+    p_bench.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        print(f"{'candidates':>11}{'sig ms':>9}{'lsh ms':>9}{'peak MB':>9}{'kept':>7}{'ref kept':>10}{'missed':>8}")
+        for r in run_bench(args.sizes, args.threshold, args.bands, args.seed):
+            print(
+                f"{r['candidates']:>11}{r['signature_ms']:>9.1f}{r['lsh_ms']:>9.1f}{r['peak_mb']:>9.1f}{r['kept']:>7}"
+                f"{r['reference_kept']:>10}{r['missed_duplicates']:>8}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,311 @@
+"""
+文档 → chunk id 索引：文档范围的检索直接按 id 取 chunk，不走 HNSW。
+
+rag_pathology 需要的是选中 .docx 的全部 chunk，原先靠按 docx_name 过滤的 1000 条 ANN 查询获取，
+既慢又有上限。这里：
+  - 预计算 {文档名: [chunk id（按 chunk_index 排序）]} 与各文档的 content_hash，持久化到 data/doc_index/ 下
+    （也可用 CLI 预先构建）
+  - 选中文档的 chunk（文本 / 元信息 / 归一化向量）通过 collection.get(ids=...) 取回，
+    并按文档缓存在内存里（LRU，容量见 [rag.doc_index] cache_docs）
+  - 每次取 chunk 前检查新鲜度：集合行数变化时整体重建；否则取选中文档首个 chunk 的 content_hash，
+    与索引记录不一致（ingest 以相同 id / 相同 chunk 数重写了文档）时只重建该文档的条目并丢弃其缓存。
+    ingest 写入后也会调用 invalidate_doc_indexes() 删除该集合的持久化索引
+  - 与查询向量做一次 NumPy 矩阵乘得到余弦相似度，按相似度排序后交给 reranker
+
+返回的距离是余弦距离（1 - cos），与 memmap 后端一致。
+构建（在 server/tools 目录下）：
+    python doc_index.py build patho_chroma_db_qwen --collection patho_collection --field docx_name
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config_manager import config_manager
+from rag_metrics import note_cache
+from vector_store import QueryResult, VectorStore, as_vector_store, open_collection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _DocChunks:
+    docs: List[str]
+    metas: List[dict]
+    vectors: np.ndarray  # (n, D) float32，已 L2 归一化
+
+
+def _settings() -> Dict[str, object]:
+    return dict(config_manager.get_section("rag").get("doc_index", {}))
+
+
+def max_candidates() -> int:
+    """文档范围检索每个 source 的候选硬上限（[rag.doc_index] max_candidates，<= 0 表示不限）。"""
+    return int(_settings().get("max_candidates", 1000))
+
+
+def index_path_for(db_path: Path, collection_name: str, field: str) -> Path:
+    base = config_manager.base_dir / str(_settings().get("dir", "data/doc_index"))
+    return base / f"{Path(db_path).name}__{collection_name}__{field}.json"
+
+
+def _group_rows(ids: Sequence[str], metas: Sequence[Optional[dict]], field: str, rows: Dict[str, list], hashes: Dict[str, Optional[str]]) -> None:
+    for cid, md in zip(ids, metas):
+        md = md or {}
+        if field not in md:
+            continue
+        doc = str(md[field])
+        rows.setdefault(doc, []).append((int(md.get("chunk_index", 0) or 0), cid))
+        hashes.setdefault(doc, md.get("content_hash"))
+
+
+def build_doc_index(store: VectorStore, field: str) -> Tuple[Dict[str, List[str]], Dict[str, Optional[str]]]:
+    """遍历集合元信息，得到 ({field 值: [chunk id]}, {field 值: content_hash})，每个文档内按 chunk_index 排序。"""
+    rows: Dict[str, List[Tuple[int, str]]] = {}
+    hashes: Dict[str, Optional[str]] = {}
+    for ids, metas in store.scan_metadata():
+        _group_rows(ids, metas, field, rows, hashes)
+    return {doc: [cid for _, cid in sorted(items)] for doc, items in rows.items()}, hashes
+
+
+class DocChunkIndex:
+    """单个集合 + 元信息字段上的文档 → chunk 索引与 chunk 缓存。"""
+
+    def __init__(self, collection, field: str, index_path: Optional[Path] = None, cache_docs: int = 64):
+        self.store = as_vector_store(collection)
+        self.field = field
+        self.index_path = Path(index_path) if index_path else None
+        self.cache_docs = int(cache_docs)
+        self._index: Optional[Dict[str, List[str]]] = None
+        self._hashes: Dict[str, Optional[str]] = {}
+        self._count: Optional[int] = None
+        self._chunks: "OrderedDict[str, _DocChunks]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ── 索引 ──
+    def _load_or_build(self) -> Dict[str, List[str]]:
+        count = self.store.count()
+        self._count = count
+        if self.index_path and self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("field") == self.field and saved.get("count") == count and "hashes" in saved:
+                    self._hashes = saved["hashes"]
+                    return saved["index"]
+                logger.info("[DOC_INDEX] %s is stale (count %s → %s), rebuilding", self.index_path, saved.get("count"), count)
+            except (OSError, ValueError, KeyError):
+                logger.warning("[DOC_INDEX] unreadable index %s, rebuilding", self.index_path)
+
+        start = time.perf_counter()
+        index, self._hashes = build_doc_index(self.store, self.field)
+        logger.info(
+            "[DOC_INDEX] indexed %d documents / %d chunks by %s in %.1fms",
+            len(index), sum(len(v) for v in index.values()), self.field, (time.perf_counter() - start) * 1000,
+        )
+        self._save(index)
+        return index
+
+    def _save(self, index: Dict[str, List[str]]) -> None:
+        if not self.index_path:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"field": self.field, "count": self._count, "index": index, "hashes": self._hashes}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def _revalidate(self, docs: Sequence[str]) -> None:
+        """行数变化时整体失效；否则按首个 chunk 的 content_hash 找出被重写的文档，只重建这些文档的条目。"""
+        if self._index is not None and self.store.count() != self._count:
+            logger.info("[DOC_INDEX] collection size changed (%s → %s), rebuilding", self._count, self.store.count())
+            self.invalidate()
+        index = self.index
+        heads = {doc: index[doc][0] for doc in docs if index.get(doc)}
+        if not heads:
+            return
+        res = self.store.get(ids=list(heads.values()))
+        current = {cid: (md or {}).get("content_hash") for cid, md in zip(res["ids"], res["metadatas"])}
+        stale = [doc for doc, cid in heads.items() if cid not in current or current[cid] != self._hashes.get(doc)]
+        if not stale:
+            return
+        for doc in stale:
+            res = self.store.get(where={self.field: doc})
+            rows: Dict[str, list] = {}
+            hashes: Dict[str, Optional[str]] = {}
+            _group_rows(res["ids"], res["metadatas"], self.field, rows, hashes)
+            with self._lock:
+                if rows.get(doc):
+                    index[doc] = [cid for _, cid in sorted(rows[doc])]
+                    self._hashes[doc] = hashes.get(doc)
+                else:
+                    index.pop(doc, None)
+                    self._hashes.pop(doc, None)
+                self._chunks.pop(doc, None)
+        logger.info("[DOC_INDEX] re-indexed %d rewritten document(s): %s", len(stale), ", ".join(stale[:5]))
+        with self._lock:
+            self._save(index)
+
+    @property
+    def index(self) -> Dict[str, List[str]]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load_or_build()
+        return self._index
+
+    def chunk_ids(self, doc: str) -> List[str]:
+        return list(self.index.get(doc, []))
+
+    # ── chunk 取回 ──
+    def _fetch(self, docs: Sequence[str]) -> Dict[str, _DocChunks]:
+        """缓存未命中的文档合并成一次 get(ids=...)。"""
+        wanted = {doc: self.index.get(doc, []) for doc in docs}
+        ids = [cid for cids in wanted.values() for cid in cids]
+        if not ids:
+            return {doc: _DocChunks([], [], np.zeros((0, 0), dtype=np.float32)) for doc in docs}
+        res = self.store.get(ids=ids, with_embeddings=True)
+        vecs = np.asarray(res["embeddings"], dtype=np.float32)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs / np.where(norms > 0, norms, 1.0)
+        row_of = {cid: i for i, cid in enumerate(res["ids"])}
+        out: Dict[str, _DocChunks] = {}
+        for doc, cids in wanted.items():
+            rows = [row_of[c] for c in cids if c in row_of]
+            out[doc] = _DocChunks(
+                docs=[res["documents"][r] for r in rows],
+                metas=[res["metadatas"][r] or {} for r in rows],
+                vectors=vecs[rows],
+            )
+        return out
+
+    def chunks(self, docs: Sequence[str]) -> List[_DocChunks]:
+        """按输入顺序返回各文档的 chunk（LRU 缓存，取之前先检查新鲜度）。"""
+        self._revalidate(list(dict.fromkeys(docs)))
+        found: Dict[str, _DocChunks] = {}
+        with self._lock:
+            for doc in docs:
+                hit = self._chunks.get(doc)
+                if hit is not None:
+                    self._chunks.move_to_end(doc)
+                    found[doc] = hit
+                note_cache("doc_chunks", hit is not None)
+        missing = [doc for doc in dict.fromkeys(docs) if doc not in found]
+        if missing:
+            fetched = self._fetch(missing)
+            found.update(fetched)
+            with self._lock:
+                for doc, dc in fetched.items():
+                    self._chunks[doc] = dc
+                    self._chunks.move_to_end(doc)
+                while len(self._chunks) > self.cache_docs:
+                    self._chunks.popitem(last=False)
+        return [found[doc] for doc in docs]
+
+    # ── 打分 ──
+    def query_many(self, docs: Sequence[str], embeddings: Sequence[Sequence[float]], n_results: int) -> List[QueryResult]:
+        """
+        取 docs 的全部 chunk，与每个查询向量做余弦相似度，返回按距离升序的前 n_results 条
+        （格式同 VectorStore.query_many）。
+        """
+        if not len(embeddings):
+            return []
+        parts = [dc for dc in self.chunks(list(dict.fromkeys(docs))) if dc.docs]
+        if not parts:
+            return [([], [], []) for _ in embeddings]
+        all_docs = [d for dc in parts for d in dc.docs]
+        all_metas = [md for dc in parts for md in dc.metas]
+        mat = np.vstack([dc.vectors for dc in parts])
+
+        q = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms > 0, norms, 1.0)
+        sims_all = mat @ q.T
+
+        out: List[QueryResult] = []
+        k = min(int(n_results), sims_all.shape[0])
+        for qi in range(q.shape[0]):
+            sims = sims_all[:, qi]
+            top = np.argpartition(-sims, k - 1)[:k] if k < sims.shape[0] else np.arange(sims.shape[0])
+            top = top[np.argsort(-sims[top], kind="stable")]
+            out.append((
+                [all_docs[i] for i in top],
+                [all_metas[i] for i in top],
+                (1.0 - sims[top]).astype(float).tolist(),
+            ))
+        return out
+
+    def chunk_count(self, docs: Sequence[str]) -> int:
+        """选中文档的 chunk 总数（文档范围检索的候选上限）。"""
+        index = self.index
+        return sum(len(index.get(doc, [])) for doc in dict.fromkeys(docs))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+            self._hashes = {}
+            self._count = None
+            self._chunks.clear()
+
+
+_indexes: Dict[Tuple[str, str, str], DocChunkIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_doc_index(db_path: Path, collection_name: str, field: str) -> DocChunkIndex:
+    """按 (库路径, 集合, 字段) 复用 DocChunkIndex；集合按 [rag] vector_backend 打开。"""
+    key = (str(db_path), collection_name, field)
+    with _indexes_lock:
+        idx = _indexes.get(key)
+        if idx is None:
+            idx = DocChunkIndex(
+                open_collection(Path(db_path), collection_name),
+                field,
+                index_path=index_path_for(db_path, collection_name, field),
+                cache_docs=int(_settings().get("cache_docs", 64)),
+            )
+            _indexes[key] = idx
+    return idx
+
+
+def invalidate_doc_indexes(db_path: Path, collection_name: str) -> None:
+    """集合被写入后调用：丢弃本进程中的索引与 chunk 缓存，并删除持久化索引（其他进程下次加载时重建）。"""
+    with _indexes_lock:
+        for (path, name, _), idx in _indexes.items():
+            if path == str(db_path) and name == collection_name:
+                idx.invalidate()
+    base = config_manager.base_dir / str(_settings().get("dir", "data/doc_index"))
+    for path in base.glob(f"{Path(db_path).name}__{collection_name}__*.json"):
+        path.unlink(missing_ok=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Document → chunk id index utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_build = sub.add_parser("build", help="(re)build the document → chunk id index of a collection")
+    p_build.add_argument("db_path", type=Path, help="Chroma PersistentClient directory")
+    p_build.add_argument("--collection", default="patho_collection")
+    p_build.add_argument("--field", default="docx_name", help="metadata field naming the document")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "build":
+        db_path = args.db_path if args.db_path.is_absolute() else config_manager.base_dir / args.db_path
+        path = index_path_for(db_path, args.collection, args.field)
+        if path.exists():
+            path.unlink()
+        idx = get_doc_index(db_path, args.collection, args.field)
+        print(f"Indexed {len(idx.index)} documents → {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+"""
+embedding 请求微批。
+
+多个 agent / 批处理文件同时调用 RAG 工具时，每个 embed_query_texts 都是一次只有一两条输入的
+HTTP 请求，而 embedding 服务（Qwen3-Embedding-8B）处理批量输入的效率高得多。这里在后台事件循环上：
+  - 第一条请求到达后最多等待 window_ms 毫秒，期间到达的请求合并在一起
+  - 累计输入达到 max_batch 条时立即发送（单个请求本身超过 max_batch 时单独发送）
+  - 同一批内相同文本只发送一次，结果按调用方拆回
+每批的输入条数 / 合并的调用数计入 metrics_registry（tool="embed_batcher"），可在 /api/metrics 查看分布。
+"""
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from async_runtime import get_background_loop, run_sync
+from config_manager import config_manager, async_embed_client, EMBED_MODEL
+from rag_metrics import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+METRICS_NAME = "embed_batcher"
+
+
+def resolve_embed_batch_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.embed_batch] 与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("rag").get("embed_batch", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "enabled": bool(cfg.get("enabled", True)),
+        "window_ms": float(cfg.get("window_ms", 5.0)),
+        "max_batch": max(1, int(cfg.get("max_batch", 32))),
+    }
+
+
+@dataclass
+class _Pending:
+    texts: List[str]
+    future: "asyncio.Future[List[List[float]]]"
+
+
+class EmbedBatcher:
+    """只在后台 loop 上操作内部状态（_pending / _timer），无需加锁。"""
+
+    def __init__(self, client=None, model: str = EMBED_MODEL, window_ms: float = 5.0, max_batch: int = 32):
+        self.client = client or async_embed_client
+        self.model = model
+        self.window_ms = float(window_ms)
+        self.max_batch = int(max_batch)
+        self._pending: List[_Pending] = []
+        self._pending_inputs = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: "set[asyncio.Task]" = set()  # 在途的发送任务（保持引用，避免被回收）
+
+    async def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """在后台 loop 上调用：排队并等待所在批次的结果。"""
+        loop = asyncio.get_running_loop()
+        item = _Pending(list(texts), loop.create_future())
+        self._pending.append(item)
+        self._pending_inputs += len(item.texts)
+        if self._pending_inputs >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await item.future
+
+    def embed_sync(self, texts: Sequence[str]) -> List[List[float]]:
+        """同步调用方（工具线程）使用。"""
+        if not texts:
+            return []
+        return run_sync(self.embed(texts))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch: List[_Pending] = []
+            n = 0
+            while self._pending and (not batch or n + len(self._pending[0].texts) <= self.max_batch):
+                item = self._pending.pop(0)
+                batch.append(item)
+                n += len(item.texts)
+            self._pending_inputs -= n
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[_Pending]) -> None:
+        unique: Dict[str, int] = {}
+        for item in batch:
+            for t in item.texts:
+                unique.setdefault(t, len(unique))
+        metrics_registry.observe(METRICS_NAME, "batch_inputs", len(unique))
+        metrics_registry.observe(METRICS_NAME, "batch_calls", len(batch))
+        try:
+            resp = await self.client.embeddings.create(
+                model=self.model,
+                input=list(unique),
+                encoding_format="float",
+            )
+            vectors = [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+            if len(vectors) != len(unique):
+                raise ValueError(f"embedding response has {len(vectors)} vectors for {len(unique)} inputs")
+        except asyncio.CancelledError:
+            for item in batch:
+                item.future.cancel()
+            raise
+        except Exception as e:
+            # 异常交给调用方的 future，任务本身正常结束
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        if len(batch) > 1:
+            logger.debug("[EMBED_BATCH] %d calls → 1 request with %d inputs", len(batch), len(unique))
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result([vectors[unique[t]] for t in item.texts])
+
+
+_batcher: Optional[EmbedBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_embed_batcher() -> EmbedBatcher:
+    """进程内共享的微批器（首次使用时按配置创建，并确保后台 loop 已启动）。"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            cfg = resolve_embed_batch_settings()
+            get_background_loop()
+            _batcher = EmbedBatcher(window_ms=cfg["window_ms"], max_batch=cfg["max_batch"])
+    return _batcher
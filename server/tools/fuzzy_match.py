@@ -0,0 +1,262 @@
+"""
+LLM 选出的文件名 → 目录中真实文件名的模糊匹配索引。
+
+choose_items_with_llm 与 UICC 选择器原先对每个返回的名字都用 difflib.get_close_matches 扫描整个目录，
+目录有上千个 PDF 时每次调用都要做大量 SequenceMatcher 比较。这里每个目录（文件名列表）只建一次索引：
+  - 规范化名字（小写、去扩展名、空白 / 下划线 / 连字符归一）→ 原名 的精确映射，命中直接返回
+  - 字符 trigram 倒排索引：按共享 trigram 数（Dice 系数）取少量候选（candidates），
+    再用与 difflib 相同的 SequenceMatcher.ratio 校验 cutoff
+  - 没有候选通过时在更宽的 Dice 候选表（fallback_candidates 个中 Dice ≥ fallback_min_dice 的）里再校验一次，
+    不做全目录扫描；LLM 编造的文件名（最常见的未命中）因此只花与命中相近的时间
+    （合成基准中实际匹配对的 Dice 最低约 0.6）
+
+与 difflib.get_close_matches(name, items, n=1, cutoff) 的语义差异（基准与 tests/test_fuzzy_match.py 固定了这些行为）：
+  - 规范化后相同的名字直接命中（如 "Esmo Breast Cancer 2024.Pdf" → "esmo_breast_cancer_2024.pdf"），
+    原名 ratio 不到 cutoff 时也会命中；原名候选都不过 cutoff 时再按规范化名比较 ratio。
+    这是有意的：LLM 常改写大小写 / 下划线 / 扩展名。基准中的 extra 一列即这类匹配
+  - 只在 Dice 候选中找 ratio 最高者，理论上可能与 difflib 在整个目录上的最优结果不同（different），
+    或漏掉 Dice 很低但 ratio 过 cutoff 的条目（missed）；合成基准中两者均为 0
+索引按文件名元组缓存（LRU），目录变化后自然换用新索引。
+
+基准（在 server/tools 目录下）：
+    python fuzzy_match.py bench --sizes 100 1000 10000
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from difflib import SequenceMatcher, get_close_matches
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_SEP_RE = re.compile(r"[\s_\-]+")
+_EXT_RE = re.compile(r"\.(pdf|txt|docx?|md)$", re.IGNORECASE)
+
+
+def normalize_name(name: str) -> str:
+    name = _EXT_RE.sub("", (name or "").strip().strip("`'\"").strip())
+    return _SEP_RE.sub(" ", name.lower()).strip()
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _best_ratio(name: str, candidates: Iterable[Tuple[int, str]], cutoff: float) -> Optional[int]:
+    """ratio 最高且 ≥ cutoff 的候选下标；与 get_close_matches 一样先用 real_quick_ratio / quick_ratio 排除。"""
+    best, best_ratio = None, cutoff
+    sm = SequenceMatcher()
+    sm.set_seq2(name)
+    for i, text in candidates:
+        sm.set_seq1(text)
+        if sm.real_quick_ratio() < best_ratio or sm.quick_ratio() < best_ratio:
+            continue
+        ratio = sm.ratio()
+        if ratio >= best_ratio and (best is None or ratio > best_ratio):
+            best, best_ratio = i, ratio
+    return best
+
+
+class FuzzyIndex:
+    def __init__(
+        self, items: Sequence[str], candidates: int = 8, fallback_candidates: int = 64, fallback_min_dice: float = 0.3
+    ):
+        self.items = list(items)
+        self.candidates = int(candidates)
+        self.fallback_candidates = max(int(fallback_candidates), self.candidates)
+        self.fallback_min_dice = float(fallback_min_dice)
+        self._exact: Dict[str, int] = {}
+        postings: Dict[str, List[int]] = defaultdict(list)
+        sizes: List[int] = []
+        self._norms: List[str] = []
+        for i, item in enumerate(self.items):
+            self._exact.setdefault(item, i)
+            norm = normalize_name(item)
+            self._norms.append(norm)
+            self._exact.setdefault(norm, i)
+            grams = set(_trigrams(norm))
+            sizes.append(len(grams))
+            for g in grams:
+                postings[g].append(i)
+        self._postings: Dict[str, np.ndarray] = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        self._sizes = np.asarray(sizes, dtype=np.float64)
+
+    def match(self, name: str, cutoff: float = 0.8) -> Optional[str]:
+        """返回最相近的条目；相似度（difflib ratio）低于 cutoff 时返回 None。"""
+        if not self.items or not name:
+            return None
+        hit = self._exact.get(name)
+        if hit is None:
+            hit = self._exact.get(normalize_name(name))
+        if hit is not None:
+            return self.items[hit]
+
+        norm = normalize_name(name)
+        grams = set(_trigrams(norm))
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if not lists:
+            return None
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.items))
+        # Dice 系数排序候选，再按 difflib 的 ratio 校验
+        dice = 2.0 * overlap / (len(grams) + self._sizes)
+        k = min(self.fallback_candidates, int((overlap > 0).sum()))
+        top = np.argpartition(-dice, k - 1)[:k]
+        ranked = [int(i) for i in top[np.argsort(-dice[top], kind="stable")]]
+        best = self._best(name, norm, ranked[: self.candidates], cutoff)
+        if best is None:
+            wide = [i for i in ranked[self.candidates:] if dice[i] >= self.fallback_min_dice]
+            if wide:
+                best = self._best(name, norm, wide, cutoff)
+        return None if best is None else self.items[best]
+
+    def _best(self, name: str, norm: str, ranked: Iterable[int], cutoff: float) -> Optional[int]:
+        """候选中原名 ratio 最高且 ≥ cutoff 的条目；没有时按规范化名比较。"""
+        ranked = list(ranked)
+        best = _best_ratio(name, ((i, self.items[i]) for i in ranked), cutoff)
+        if best is None:
+            # 规范化后比较（忽略大小写 / 扩展名差异）
+            best = _best_ratio(norm, ((i, self._norms[i]) for i in ranked), cutoff)
+        return best
+
+    def match_all(self, names: Sequence[str], cutoff: float = 0.8) -> List[str]:
+        """逐个匹配并去重，保持首次出现的顺序。"""
+        out: List[str] = []
+        for name in names:
+            m = self.match(name, cutoff)
+            if m is not None and m not in out:
+                out.append(m)
+        return out
+
+
+_cache: "OrderedDict[Tuple[str, ...], FuzzyIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 32
+
+
+def get_fuzzy_index(items: Sequence[str]) -> FuzzyIndex:
+    """按文件名列表复用索引。"""
+    key = tuple(items)
+    with _cache_lock:
+        idx = _cache.get(key)
+        if idx is not None:
+            _cache.move_to_end(key)
+            return idx
+    idx = FuzzyIndex(key)
+    with _cache_lock:
+        _cache[key] = idx
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return idx
+
+
+# ─────────────────────────── 基准 ───────────────────────────
+
+_WORDS = (
+    "esmo nccn clinical practice guidelines breast lung colorectal gastric cancer lymphoma leukaemia myeloma "
+    "metastatic early advanced management diagnosis treatment follow-up update 2021 2022 2023 2024 "
+    "non-small-cell small-cell hodgkin follicular diffuse large b-cell ovarian prostate renal melanoma"
+).split()
+
+
+def _synthetic_names(n: int, rng: random.Random) -> List[str]:
+    names = set()
+    while len(names) < n:
+        words = rng.sample(_WORDS, rng.randint(3, 7))
+        names.add("_".join(words) + f"_{rng.randint(1, 999)}.pdf")
+    return sorted(names)
+
+
+def _perturb(name: str, rng: random.Random) -> str:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return name
+    if kind == 1:
+        return name[:-4]  # 去扩展名
+    if kind == 2:
+        return name.replace("_", " ").title()
+    i = rng.randrange(len(name) - 4)
+    return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i + 1:]  # 单字符错字
+
+
+def _hallucinated(items: Sequence[str], n: int, rng: random.Random) -> List[str]:
+    """目录里没有的文件名（LLM 编造的名字），用来测未命中的耗时。"""
+    existing = set(items)
+    out: List[str] = []
+    while len(out) < n:
+        words = rng.sample(_WORDS, rng.randint(2, 5))
+        name = " ".join(w.title() for w in words) + f" v{rng.randint(1, 9)}.pdf"
+        if name not in existing:
+            out.append(name)
+    return out
+
+
+def _compare(idx: FuzzyIndex, items: Sequence[str], qs: Sequence[str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    ours = [idx.match(q) for q in qs]
+    idx_ms = (time.perf_counter() - start) * 1000 / len(qs)
+
+    start = time.perf_counter()
+    ref = [(get_close_matches(q, items, n=1, cutoff=0.8) or [None])[0] for q in qs]
+    dl_ms = (time.perf_counter() - start) * 1000 / len(qs)
+
+    # 与 difflib 不一致的三种情况分开统计：都找到但不同 / 只有 difflib 找到 / 只有索引找到（规范化匹配）
+    return {
+        "index_ms": idx_ms, "difflib_ms": dl_ms,
+        "agree": sum(1 for a, b in zip(ours, ref) if a == b) / len(qs),
+        "different": sum(1 for a, b in zip(ours, ref) if a is not None and b is not None and a != b) / len(qs),
+        "missed": sum(1 for a, b in zip(ours, ref) if a is None and b is not None) / len(qs),
+        "extra": sum(1 for a, b in zip(ours, ref) if a is not None and b is None) / len(qs),
+        "found": sum(1 for a in ours if a is not None) / len(qs),
+    }
+
+
+def run_bench(sizes: Sequence[int], queries: int = 200, seed: int = 0) -> List[Dict[str, float]]:
+    """每个目录规模一行命中（扰动过的真实文件名）和一行未命中（编造的文件名）。"""
+    rng = random.Random(seed)
+    rows: List[Dict[str, float]] = []
+    for size in sizes:
+        items = _synthetic_names(size, rng)
+        start = time.perf_counter()
+        idx = FuzzyIndex(items)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for kind, qs in (
+            ("hit", [_perturb(rng.choice(items), rng) for _ in range(queries)]),
+            ("miss", _hallucinated(items, queries, rng)),
+        ):
+            row = {"items": size, "queries": kind, "build_ms": build_ms}
+            row.update(_compare(idx, items, qs))
+            row["speedup"] = row["difflib_ms"] / row["index_ms"] if row["index_ms"] > 0 else float("inf")
+            rows.append(row)
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fuzzy filename matcher utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("bench", help="compare the trigram index with difflib.get_close_matches")
+    p_bench.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    p_bench.add_argument("--queries", type=int, default=200)
+    p_bench.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        print(
+            f"{'items':>7}{'queries':>8}{'build ms':>10}{'index ms':>11}{'difflib ms':>12}{'speedup':>9}"
+            f"{'agree':>8}{'different':>11}{'missed':>8}{'extra':>8}{'found':>8}"
+        )
+        for r in run_bench(args.sizes, args.queries, args.seed):
+            print(
+                f"{r['items']:>7}{r['queries']:>8}{r['build_ms']:>10.1f}{r['index_ms']:>11.3f}{r['difflib_ms']:>12.3f}"
+                f"{r['speedup']:>8.0f}x{r['agree']:>8.2f}{r['different']:>11.2f}{r['missed']:>8.2f}"
+                f"{r['extra']:>8.2f}{r['found']:>8.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
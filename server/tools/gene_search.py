@@ -1,4 +1,5 @@
 import requests
+import httpx
 import json
 import time
 import logging
@@ -8,17 +9,20 @@ from dataclasses import dataclass
 import asyncio
 from openai.types.shared import Reasoning
 from typing import List
-import mlflow
 from urllib.parse import urljoin
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import os
-from logging_setup import setup_logging
 
-# 可选开启 mlflow autolog，默认关闭避免泄露敏感信息
+# mlflow 为可选依赖：仅在安装且显式开启 MLFLOW_AUTOLOG 时启用（默认关闭避免泄露敏感信息）
 if os.getenv("MLFLOW_AUTOLOG", "").lower() in ("1", "true", "yes"):
-    mlflow.openai.autolog()
-mlflow.set_experiment("MDT_Workflow_civic")
+    try:
+        import mlflow
+
+        mlflow.openai.autolog()
+        mlflow.set_experiment("MDT_Workflow_civic")
+    except ImportError:
+        logging.getLogger(__name__).warning("MLFLOW_AUTOLOG is set but mlflow is not installed")
 set_tracing_disabled(True)
 # ─────────────────────────────────────────────────────────────────────────────
 # CIViC v2 GraphQL Tool Definition
@@ -29,6 +33,9 @@ class MedicalContext:
     patient_history: str
     role_hint: Optional[str] = None
 
+from async_runtime import run_async
+from tool_cache import tool_cache
+
 # 导入统一的配置管理器
 from config_manager import (
     config_manager,
@@ -42,21 +49,9 @@ REASONING_EFFORT = config_manager.REASONING_EFFORT or "medium"
 REASONING_VERBOSITY = config_manager.REASONING_VERBOSITY or "low"
 DEFAULT_REASONING = Reasoning(effort=REASONING_EFFORT) if REASONING_EFFORT else None
 cli_async = async_external_client
-setup_logging()
 logger = logging.getLogger(__name__)
-# @function_tool(name_override="civic_tool")
-def civic_tool(
-    ctx: RunContextWrapper[MedicalContext],
-    hugo_symbol: str,
-    variant_partial: Optional[str] = "Mutation"
-) -> str:
-    if variant_partial is None:
-        variant_partial = "Mutation"
-    variant_partial = variant_partial.strip()
-
-    url = "https://civicdb.org/api/graphql"
-    headers = {"Content-Type": "application/json"}
-    graphql_query = """
+CIVIC_URL = "https://civicdb.org/api/graphql"
+CIVIC_QUERY = """
     query ConciseVariantInfo($geneSymbol: String!, $variantName: String!) {
       gene(entrezSymbol: $geneSymbol) {
         variants(name: $variantName) {
@@ -82,26 +77,30 @@ def civic_tool(
       }
     }
     """
-    variables = {"geneSymbol": hugo_symbol, "variantName": variant_partial}
-    print(f"[civic_tool] Query variables = {variables!r}")
+HTTP_TIMEOUT = 10
 
-    try:
-        start = time.perf_counter()
-        resp = requests.post(url, json={"query": graphql_query, "variables": variables}, headers=headers, timeout=10)
-        resp.raise_for_status()
-        elapsed = time.perf_counter() - start
-        logger.info("CIViC request ok | elapsed=%.2fs | status=%s", elapsed, resp.status_code)
-    except requests.RequestException as e:
-        logger.warning("CIViC request failed | err=%s", e)
-        if hasattr(e, "response") and e.response is not None:
-            return f"CIViC GraphQL API Error {e.response.status_code}: {e.response.text}"
-        return f"CIViC GraphQL API request failed: {str(e)}"
+# CIViC / OncoKB 的异步版本共用一个长连接 httpx 客户端，绑定在 async_runtime 的后台 loop 上
+_http_client: Optional[httpx.AsyncClient] = None
 
-    data = resp.json()
+
+def _get_http_client() -> httpx.AsyncClient:
+    # 只会在后台 loop 内调用，无需加锁
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+def _civic_variables(hugo_symbol: str, variant_partial: Optional[str]) -> dict:
+    if variant_partial is None:
+        variant_partial = "Mutation"
+    return {"geneSymbol": hugo_symbol, "variantName": variant_partial.strip()}
+
+
+def _parse_civic(data: dict) -> str:
     if "errors" in data:
         return f"CIViC GraphQL returned errors: {data['errors']}"
 
-
     result = []
     gene = (data.get("data") or {}).get("gene") or {}
     variants = (gene.get("variants") or {}).get("nodes", [])
@@ -123,19 +122,78 @@ def civic_tool(
     return json.dumps(result, indent=2, ensure_ascii=False)
 
 
+def _civic_cacheable(data: dict) -> bool:
+    return isinstance(data, dict) and "errors" not in data
+
+
+def _civic_post(variables: dict) -> dict:
+    start = time.perf_counter()
+    resp = requests.post(
+        CIVIC_URL,
+        json={"query": CIVIC_QUERY, "variables": variables},
+        headers={"Content-Type": "application/json"},
+        timeout=HTTP_TIMEOUT,
+    )
+    resp.raise_for_status()
+    elapsed = time.perf_counter() - start
+    logger.info("CIViC request ok | elapsed=%.2fs | status=%s", elapsed, resp.status_code)
+    return resp.json()
+
+
+# @function_tool(name_override="civic_tool")
+def civic_tool(
+    ctx: RunContextWrapper[MedicalContext],
+    hugo_symbol: str,
+    variant_partial: Optional[str] = "Mutation"
+) -> str:
+    variables = _civic_variables(hugo_symbol, variant_partial)
+    print(f"[civic_tool] Query variables = {variables!r}")
+
+    try:
+        data = tool_cache.call("civic", variables, lambda: _civic_post(variables), should_cache=_civic_cacheable)
+    except requests.RequestException as e:
+        logger.warning("CIViC request failed | err=%s", e)
+        if hasattr(e, "response") and e.response is not None:
+            return f"CIViC GraphQL API Error {e.response.status_code}: {e.response.text}"
+        return f"CIViC GraphQL API request failed: {str(e)}"
+
+    return _parse_civic(data)
+
+
+async def _civic_post_async(variables: dict) -> dict:
+    start = time.perf_counter()
+    resp = await _get_http_client().post(CIVIC_URL, json={"query": CIVIC_QUERY, "variables": variables})
+    resp.raise_for_status()
+    logger.info("CIViC request ok | elapsed=%.2fs | status=%s", time.perf_counter() - start, resp.status_code)
+    return resp.json()
+
+
+async def _civic_fetch(variables: dict) -> str:
+    try:
+        data = await tool_cache.call_async(
+            "civic", variables, lambda: _civic_post_async(variables), should_cache=_civic_cacheable
+        )
+    except httpx.HTTPStatusError as e:
+        logger.warning("CIViC request failed | err=%s", e)
+        return f"CIViC GraphQL API Error {e.response.status_code}: {e.response.text}"
+    except httpx.HTTPError as e:
+        logger.warning("CIViC request failed | err=%s", e)
+        return f"CIViC GraphQL API request failed: {str(e)}"
+    return _parse_civic(data)
+
+
+async def civic_tool_async(hugo_symbol: str, variant_partial: Optional[str] = "Mutation") -> str:
+    """civic_tool 的异步版本（请求在后台 loop 的共享客户端上发出，不占用线程）。"""
+    return await run_async(_civic_fetch(_civic_variables(hugo_symbol, variant_partial)))
+
+
 ONCOKB_TOKEN = get_env_var("ONCOKB_TOKEN")
 
 # -----------------------------------------------------------------------------
 # OncoKB Query Function (simplified)
 # -----------------------------------------------------------------------------
-def onco_kb(
-    hugo_symbol: str,
-    change: str,
-    alteration: str
-) -> dict:
-    """
-    Query OncoKB for a specific alteration. Returns parsed JSON as dict.
-    """
+def _oncokb_request(hugo_symbol: str, change: str, alteration: str) -> Tuple[str, str, dict, dict]:
+    """返回 (url, endpoint, params, headers)。"""
     base_url = "https://www.oncokb.org/api/v1/"
     if not ONCOKB_TOKEN:
         raise EnvironmentError("Missing OncoKB token. Please set ONCOKB_TOKEN in environment.")
@@ -170,131 +228,220 @@ def onco_kb(
             "alteration": alteration
         }
 
+    return urljoin(base_url, endpoint), endpoint, params, headers
 
 
-    url = urljoin(base_url, endpoint)
-    try:
+def onco_kb(
+    hugo_symbol: str,
+    change: str,
+    alteration: str
+) -> dict:
+    """
+    Query OncoKB for a specific alteration. Returns parsed JSON as dict.
+    """
+    url, endpoint, params, headers = _oncokb_request(hugo_symbol, change, alteration)
+
+    def _get() -> dict:
         start = time.perf_counter()
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
+        resp = requests.get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT)
         resp.raise_for_status()
         elapsed = time.perf_counter() - start
         logger.info("OncoKB request ok | endpoint=%s | status=%s | elapsed=%.2fs", endpoint, resp.status_code, elapsed)
         return resp.json()
+
+    try:
+        return tool_cache.call("oncokb", {"endpoint": endpoint, "params": params}, _get)
     except requests.RequestException as exc:
         logger.warning("OncoKB request failed | endpoint=%s | err=%s", endpoint, exc)
         return {"error": f"OncoKB request failed: {exc}"}
 
 
+async def _oncokb_fetch(url: str, endpoint: str, params: dict, headers: dict) -> dict:
+    async def _get() -> dict:
+        start = time.perf_counter()
+        resp = await _get_http_client().get(url, params=params, headers=headers)
+        resp.raise_for_status()
+        logger.info(
+            "OncoKB request ok | endpoint=%s | status=%s | elapsed=%.2fs",
+            endpoint, resp.status_code, time.perf_counter() - start,
+        )
+        return resp.json()
+
+    try:
+        return await tool_cache.call_async("oncokb", {"endpoint": endpoint, "params": params}, _get)
+    except httpx.HTTPError as exc:
+        logger.warning("OncoKB request failed | endpoint=%s | err=%s", endpoint, exc)
+        return {"error": f"OncoKB request failed: {exc}"}
+
+
+async def onco_kb_async(hugo_symbol: str, change: str, alteration: str) -> dict:
+    """onco_kb 的异步版本。"""
+    return await run_async(_oncokb_fetch(*_oncokb_request(hugo_symbol, change, alteration)))
+
+
 from typing import List, Optional
 import json
 from agents import function_tool, RunContextWrapper
 
 # Assuming civic_tool and onco_kb are defined above
 
-@function_tool(name_override="genesearch_batch_tool")
-def genesearch_batch_tool(ctx: RunContextWrapper, queries: List[str]) -> List[Dict]:
-    """
-    Batch search OncoKB and Civic for gene alterations
-    Arg:
-    queries: a list of query strings, each in form of "GENE ALTERATION"
-    """
-    batch = []
+CNV_TERMS = ["amplification", "deletion", "gain", "loss"]
+SV_TERMS = ["translocation", "duplication", "insertion", "inversion", "fusion"]
 
-    cnv = ["amplification", "deletion", "gain", "loss"]
-    sv = ["translocation", "duplication", "insertion", "inversion", "fusion"]
-    def detect_change(alteration: str) -> str:
-        low = alteration.lower()
-        if any(term in low for term in cnv):
-            return "amplification"
-        if any(term in low for term in sv):
-            return "variant"
-        return "mutation"
-
-    def has_any_therapies(data):
-        if not isinstance(data, list):
-            return False
-        return any(
-            prof.get("therapies")
-            for var_entry in data
-            for prof in var_entry.get("profiles", [])
-        )
 
-    for q in queries:
-        # 1) fusion
-        m_fus = re.search(r"([\w-]+)\s+fusion$", q, flags=re.IGNORECASE)
-        if m_fus:
-            gene = m_fus.group(1)
-            mutation_clean = "fusion"
+def detect_change(alteration: str) -> str:
+    low = alteration.lower()
+    if any(term in low for term in CNV_TERMS):
+        return "amplification"
+    if any(term in low for term in SV_TERMS):
+        return "variant"
+    return "mutation"
+
+
+def has_any_therapies(data) -> bool:
+    if not isinstance(data, list):
+        return False
+    return any(
+        prof.get("therapies")
+        for var_entry in data
+        for prof in var_entry.get("profiles", [])
+    )
+
+
+def parse_gene_query(q: str) -> Tuple[str, str]:
+    """"GENE ALTERATION" → (gene, 规范化后的 alteration)。"""
+    # 1) fusion
+    m_fus = re.search(r"([\w-]+)\s+fusion$", q, flags=re.IGNORECASE)
+    if m_fus:
+        gene = m_fus.group(1)
+        mutation_clean = "fusion"
+    else:
+        # 2) splice site
+        m_splice = re.match(r"^(\w+)\s+splice site\s+(.+)$", q, flags=re.IGNORECASE)
+        if m_splice:
+            gene = m_splice.group(1)
+            mutation_clean = f"c.{m_splice.group(2)}"
         else:
-            # 2) splice site
-            m_splice = re.match(r"^(\w+)\s+splice site\s+(.+)$", q, flags=re.IGNORECASE)
-            if m_splice:
-                gene = m_splice.group(1)
-                mutation_clean = f"c.{m_splice.group(2)}"
-            else:
-                parts = q.split(maxsplit=1)
-                gene = parts[0]
-                mutation_clean = parts[1] if len(parts) == 2 else ""
-
-        # 3) normalize deletion/rearrangement/duplication
-        lc = mutation_clean.lower()
-        mutation_clean = re.sub(r'(?i)(fs)\s*\*\s*\d+\b', r'\1', mutation_clean)
-        if "deletion" in lc:
-            mutation_clean = "deletion"
-        elif "rearrangement" in lc:
-            mutation_clean = "rearrangement"
-        elif "duplication" in lc:
-            mutation_clean = "duplication"
-
-        # CIViC
+            parts = q.split(maxsplit=1)
+            gene = parts[0]
+            mutation_clean = parts[1] if len(parts) == 2 else ""
+
+    # 3) normalize deletion/rearrangement/duplication
+    lc = mutation_clean.lower()
+    mutation_clean = re.sub(r'(?i)(fs)\s*\*\s*\d+\b', r'\1', mutation_clean)
+    if "deletion" in lc:
+        mutation_clean = "deletion"
+    elif "rearrangement" in lc:
+        mutation_clean = "rearrangement"
+    elif "duplication" in lc:
+        mutation_clean = "duplication"
+    return gene, mutation_clean
+
+
+def simplify_oncokb(onco_data: dict) -> List[Dict]:
+    treatments = onco_data.get("treatments", []) or []
+    return [
+        {
+            "level": t.get("level"),
+            "cancerType": t.get("levelAssociatedCancerType", {})
+                             .get("mainType", {})
+                             .get("name"),
+            "drugs": [d.get("drugName") for d in t.get("drugs", [])]
+        }
+        for t in treatments
+    ]
+
+
+def search_gene(q: str, ctx: Optional[RunContextWrapper] = None) -> Optional[Dict]:
+    """单条查询：CIViC（无治疗证据时回退到 "GENE Mutation"）+ OncoKB；任一步出错返回 None。"""
+    gene, mutation_clean = parse_gene_query(q)
+
+    # CIViC
+    try:
+        raw1 = civic_tool(ctx, hugo_symbol=gene, variant_partial=mutation_clean)
+        data1 = json.loads(raw1)
+    except Exception:
+        # skip this query entirely on error
+        return None
+
+    civic_entry = {"data": data1}
+    if not has_any_therapies(data1):
+        # fallback
         try:
-            raw1 = civic_tool(ctx, hugo_symbol=gene, variant_partial=mutation_clean)
-            data1 = json.loads(raw1)
+            raw2 = civic_tool(ctx, hugo_symbol=gene, variant_partial="Mutation")
+            data2 = json.loads(raw2)
+            civic_entry.update({
+                "fallback_query": f"{gene} Mutation",
+                "fallback_data": data2
+            })
         except Exception:
-            # skip this query entirely on error
-            continue
-
-        civic_entry = {"data": data1}
-        if not has_any_therapies(data1):
-            # fallback
-            try:
-                raw2 = civic_tool(ctx, hugo_symbol=gene, variant_partial="Mutation")
-                data2 = json.loads(raw2)
-                civic_entry.update({
-                    "fallback_query": f"{gene} Mutation",
-                    "fallback_data": data2
-                })
-            except Exception:
-                # if even fallback fails, skip
-                continue
-
-        # OncoKB
-        alteration = mutation_clean
-        change = detect_change(alteration)
+            # if even fallback fails, skip
+            return None
+
+    # OncoKB
+    try:
+        onco_data = onco_kb(gene, detect_change(mutation_clean), mutation_clean)
+    except Exception:
+        return None
+
+    return {"query": q, "civic": civic_entry, "oncokb": simplify_oncokb(onco_data)}
+
+
+async def search_gene_async(q: str) -> Optional[Dict]:
+    """search_gene 的异步版本；CIViC 与 OncoKB 请求并发发出。"""
+    gene, mutation_clean = parse_gene_query(q)
+    civic_res, onco_res = await asyncio.gather(
+        civic_tool_async(gene, mutation_clean),
+        onco_kb_async(gene, detect_change(mutation_clean), mutation_clean),
+        return_exceptions=True,
+    )
+    if isinstance(onco_res, BaseException):
+        return None
+    try:
+        if isinstance(civic_res, BaseException):
+            raise civic_res
+        data1 = json.loads(civic_res)
+    except Exception:
+        return None
+
+    civic_entry = {"data": data1}
+    if not has_any_therapies(data1):
         try:
-            onco_data = onco_kb(gene, change, alteration)
+            data2 = json.loads(await civic_tool_async(gene, "Mutation"))
+            civic_entry.update({
+                "fallback_query": f"{gene} Mutation",
+                "fallback_data": data2
+            })
         except Exception:
-            continue
-
-        treatments = onco_data.get("treatments", []) or []
-        simplified = [
-            {
-                "level": t.get("level"),
-                "cancerType": t.get("levelAssociatedCancerType", {})
-                                 .get("mainType", {})
-                                 .get("name"),
-                "drugs": [d.get("drugName") for d in t.get("drugs", [])]
-            }
-            for t in treatments
-        ]
+            return None
+
+    return {"query": q, "civic": civic_entry, "oncokb": simplify_oncokb(onco_res)}
 
-        batch.append({
-            "query": q,
-            "civic": civic_entry,
-            "oncokb": simplified
-        })
 
+def search_genes_batch(queries: List[str], ctx: Optional[RunContextWrapper] = None) -> List[Dict]:
+    """逐条查询（同步），跳过出错的查询。"""
+    batch = []
+    for q in queries:
+        entry = search_gene(q, ctx)
+        if entry is not None:
+            batch.append(entry)
     return batch
+
+
+async def search_genes_batch_async(queries: List[str]) -> List[Dict]:
+    """各条查询并发执行，结果保持输入顺序，跳过出错的查询。"""
+    results = await asyncio.gather(*(search_gene_async(q) for q in queries))
+    return [entry for entry in results if entry is not None]
+
+
+@function_tool(name_override="genesearch_batch_tool")
+async def genesearch_batch_tool(ctx: RunContextWrapper, queries: List[str]) -> List[Dict]:
+    """
+    Batch search OncoKB and Civic for gene alterations
+    Arg:
+    queries: a list of query strings, each in form of "GENE ALTERATION"
+    """
+    return await search_genes_batch_async(queries)
     # return json.dumps(batch, indent=2, ensure_ascii=False)
 
 
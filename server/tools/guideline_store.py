@@ -0,0 +1,145 @@
+"""
+rag_guideline 的向量库布局与迁移工具。
+
+两种模式（config.toml [rag] guideline_mode）：
+  - "separate":     ESMO / NCCN / HEMA 各自一个 PersistentClient（历史布局）
+  - "consolidated": 三者合并到 GUIDELINE_DB_STORAGE 的一个 collection，每个 chunk 带 source 字段，
+                    run_vector_rag 用 {"$or": [{"$and": [source, pdf_name]}...]} 一次查询覆盖全部来源
+
+迁移时合并库沿用源库集合的索引参数（hnsw:space 等 "hnsw:" 元信息），源库之间不一致或与已有合并库
+不一致时拒绝迁移，以免距离度量悄悄改变、分数与阈值失效。
+迁移（在 server/tools 目录下）：
+    python guideline_store.py migrate [--batch-size 1000] [--reset]
+"""
+import argparse
+import logging
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from config_manager import (
+    config_manager,
+    ESMO_DB_STORAGE,
+    NCCN_DB_STORAGE,
+    HEMA_DB_STORAGE,
+    GUIDELINE_DB_STORAGE,
+)
+from vector_store import get_persistent_client, open_collection
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "medical_collection"
+SOURCE_KEY = "source"
+SEPARATE_STORES: Dict[str, Path] = {
+    "ESMO": ESMO_DB_STORAGE,
+    "NCCN": NCCN_DB_STORAGE,
+    "HEMA": HEMA_DB_STORAGE,
+}
+
+
+def guideline_mode() -> str:
+    mode = str(config_manager.get_section("rag").get("guideline_mode", "separate"))
+    return mode if mode in ("separate", "consolidated") else "separate"
+
+
+def guideline_source_settings(mode: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    返回每个 guideline source 在 run_vector_rag 里需要的 collection / source_filter。
+    合并库模式下所有 source 指向同一个 collection 对象，run_vector_rag 会合并成一次查询。
+    """
+    mode = mode or guideline_mode()
+    if mode == "consolidated":
+        collection = open_collection(GUIDELINE_DB_STORAGE, COLLECTION_NAME)
+        return {
+            src: {"collection": collection, "source_filter": {SOURCE_KEY: src}}
+            for src in SEPARATE_STORES
+        }
+    return {
+        src: {"collection": open_collection(path, COLLECTION_NAME)}
+        for src, path in SEPARATE_STORES.items()
+    }
+
+
+def _index_metadata(metadata: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    """集合元信息中决定索引 / 距离度量的部分（"hnsw:" 前缀）。"""
+    return {k: v for k, v in (metadata or {}).items() if str(k).startswith("hnsw:")}
+
+
+def migrate(batch_size: int = 1000, reset: bool = False, sources: Optional[Sequence[str]] = None) -> Dict[str, int]:
+    """把三个独立库的 chunk（含 embedding）复制到合并库，并补上 source 字段。"""
+    copied: Dict[str, int] = {}
+    source_collections = {}
+    for src in sources or list(SEPARATE_STORES):
+        path = SEPARATE_STORES[src]
+        if not Path(path).exists():
+            logger.warning("[MIGRATE] %s store not found: %s", src, path)
+            copied[src] = 0
+            continue
+        source_collections[src] = get_persistent_client(path).get_or_create_collection(name=COLLECTION_NAME)
+
+    index_meta = {src: _index_metadata(col.metadata) for src, col in source_collections.items()}
+    distinct = {tuple(sorted(m.items())) for m in index_meta.values()}
+    if len(distinct) > 1:
+        raise ValueError(f"source collections use different index settings, refusing to merge: {index_meta}")
+    metadata = dict(distinct.pop()) if distinct else {}
+
+    target_client = get_persistent_client(GUIDELINE_DB_STORAGE)
+    if reset:
+        try:
+            target_client.delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+    target = target_client.get_or_create_collection(name=COLLECTION_NAME, metadata=metadata or None)
+    if _index_metadata(target.metadata) != metadata:
+        raise ValueError(
+            f"consolidated collection index settings {_index_metadata(target.metadata)} differ from the "
+            f"source collections' {metadata}; rerun with --reset"
+        )
+
+    for src, source in source_collections.items():
+        total = source.count()
+        n = 0
+        for offset in range(0, total, batch_size):
+            res = source.get(
+                limit=batch_size,
+                offset=offset,
+                include=["documents", "metadatas", "embeddings"],
+            )
+            ids = res.get("ids") or []
+            if not ids:
+                break
+            metas = [dict(md or {}, **{SOURCE_KEY: src}) for md in (res.get("metadatas") or [{}] * len(ids))]
+            target.upsert(
+                ids=[f"{src}::{i}" for i in ids],
+                documents=res.get("documents"),
+                metadatas=metas,
+                embeddings=res.get("embeddings"),
+            )
+            n += len(ids)
+            logger.info("[MIGRATE] %s: %d/%d", src, n, total)
+        copied[src] = n
+    return copied
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the consolidated guideline vector store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_migrate = sub.add_parser("migrate", help="copy the ESMO/NCCN/HEMA stores into the consolidated store")
+    p_migrate.add_argument("--batch-size", type=int, default=1000)
+    p_migrate.add_argument("--reset", action="store_true", help="drop the consolidated collection first")
+    p_migrate.add_argument("--source", action="append", choices=sorted(SEPARATE_STORES), help="limit to these sources")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "migrate":
+        try:
+            copied = migrate(batch_size=args.batch_size, reset=args.reset, sources=args.source)
+        except ValueError as e:
+            print(f"Migration aborted: {e}")
+            return 1
+        for src, n in copied.items():
+            print(f"{src}: {n} chunks → {GUIDELINE_DB_STORAGE}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
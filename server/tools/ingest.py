@@ -0,0 +1,355 @@
+"""
+增量构建 / 更新 Chroma 向量库（ESMO / NCCN / HEMA / WHO / patho）。
+
+流程：枚举源文件 → 计算内容 hash（与库中记录一致则跳过）→ 进程池解析 + 切块
+      → 分批 embedding（有界并发）→ 删除旧 chunk 并 upsert。
+
+写入的元信息与 run_vector_rag 过滤时使用的字段保持一致：
+  pdf_name / txt_name / docx_name（不含后缀）、chunk_index、content_hash。
+
+用法（在 server/tools 目录下）：
+    python ingest.py esmo nccn --workers 8 --embed-concurrency 4
+    python ingest.py who --force
+    python ingest.py patho --delete-missing --dry-run
+    python ingest.py esmo --layout consolidated   # 写入合并后的 guideline 库
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config_manager import (
+    config_manager,
+    async_embed_client,
+    EMBED_MODEL,
+    ESMO_STORAGE,
+    NCCN_STORAGE,
+    HEMA_STORAGE,
+    ESMO_DB_STORAGE,
+    NCCN_DB_STORAGE,
+    HEMA_DB_STORAGE,
+    GUIDELINE_DB_STORAGE,
+    WHO_DIR,
+    WHO_DB_STORAGE,
+    PATHO_DIR,
+    PATHO_DB_STORAGE,
+)
+from doc_index import invalidate_doc_indexes
+from guideline_store import SOURCE_KEY, guideline_mode
+from storage_catalog import storage_catalog
+from vector_store import get_persistent_client
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestTarget:
+    """一个向量库的构建目标。"""
+    name: str
+    source_dir: Path
+    db_path: Path
+    collection_name: str
+    suffix: str
+    where_key: str
+    extra_metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+INGEST_TARGETS: Dict[str, IngestTarget] = {
+    "esmo": IngestTarget("ESMO", ESMO_STORAGE, ESMO_DB_STORAGE, "medical_collection", ".pdf", "pdf_name"),
+    "nccn": IngestTarget("NCCN", NCCN_STORAGE, NCCN_DB_STORAGE, "medical_collection", ".pdf", "pdf_name"),
+    "hema": IngestTarget("HEMA", HEMA_STORAGE, HEMA_DB_STORAGE, "medical_collection", ".pdf", "pdf_name"),
+    "who": IngestTarget("WHO", WHO_DIR, WHO_DB_STORAGE, "medical_collection", ".txt", "txt_name"),
+    "patho": IngestTarget("PATHO", PATHO_DIR, PATHO_DB_STORAGE, "patho_collection", ".docx", "docx_name"),
+}
+
+GUIDELINE_TARGETS = ("esmo", "nccn", "hema")
+
+
+def resolve_target(key: str, layout: str = "separate") -> IngestTarget:
+    """consolidated 布局下 ESMO/NCCN/HEMA 写入合并库，并带上 source 字段。"""
+    target = INGEST_TARGETS[key]
+    if layout == "consolidated" and key in GUIDELINE_TARGETS:
+        return IngestTarget(
+            target.name, target.source_dir, GUIDELINE_DB_STORAGE, target.collection_name,
+            target.suffix, target.where_key, extra_metadata={SOURCE_KEY: target.name},
+        )
+    return target
+
+
+@dataclass
+class IngestReport:
+    target: str
+    scanned: int = 0
+    skipped: int = 0
+    ingested: int = 0
+    deleted: int = 0
+    chunks: int = 0
+    failed: List[str] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"[{self.target}] scanned={self.scanned} skipped={self.skipped} ingested={self.ingested} "
+            f"deleted={self.deleted} chunks={self.chunks} failed={len(self.failed)} elapsed={self.elapsed_s:.1f}s"
+        )
+
+
+# ─────────────────────────── 解析与切块（子进程中执行） ───────────────────────────
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_text(path: Path) -> str:
+    """按后缀提取纯文本。PDF 依赖 pypdf，DOCX 依赖 python-docx（均为可选依赖）。"""
+    suffix = path.suffix.lower()
+    if suffix == ".txt":
+        return path.read_text(encoding="utf-8", errors="ignore")
+    if suffix == ".pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError as e:
+            raise RuntimeError("PDF ingestion requires `pypdf` (pip install pypdf)") from e
+        reader = PdfReader(str(path))
+        return "\n\n".join((page.extract_text() or "") for page in reader.pages)
+    if suffix == ".docx":
+        try:
+            import docx
+        except ImportError as e:
+            raise RuntimeError("DOCX ingestion requires `python-docx` (pip install python-docx)") from e
+        document = docx.Document(str(path))
+        return "\n\n".join(p.text for p in document.paragraphs if p.text.strip())
+    raise ValueError(f"Unsupported file type: {path.name}")
+
+
+def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200) -> List[str]:
+    """按段落拼接成不超过 chunk_size 字符的块，相邻块保留 overlap 字符重叠。"""
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks: List[str] = []
+    buf = ""
+    for para in paragraphs:
+        while len(para) > chunk_size:
+            # 超长段落硬切
+            head, para = para[:chunk_size], para[chunk_size - overlap:]
+            if buf:
+                chunks.append(buf)
+                buf = ""
+            chunks.append(head)
+        if buf and len(buf) + len(para) + 2 > chunk_size:
+            chunks.append(buf)
+            buf = buf[-overlap:] + "\n\n" + para if overlap else para
+        else:
+            buf = f"{buf}\n\n{para}" if buf else para
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+def _extract_and_chunk(args: Tuple[str, int, int]) -> List[str]:
+    path, chunk_size, overlap = args
+    return chunk_text(extract_text(Path(path)), chunk_size=chunk_size, overlap=overlap)
+
+
+# ─────────────────────────── embedding（有界并发） ───────────────────────────
+
+async def embed_texts(
+    texts: Sequence[str],
+    batch_size: int = 32,
+    concurrency: int = 4,
+    sem: Optional[asyncio.Semaphore] = None,
+) -> List[List[float]]:
+    """分批调用 embeddings.create；传入共享的 sem 时，多个文档共用同一个并发上限。"""
+    sem = sem or asyncio.Semaphore(max(1, concurrency))
+    batches = [list(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+
+    async def _one(batch: List[str]) -> List[List[float]]:
+        async with sem:
+            resp = await async_embed_client.embeddings.create(model=EMBED_MODEL, input=batch, encoding_format="float")
+        return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+    parts = await asyncio.gather(*(_one(b) for b in batches))
+    return [vec for part in parts for vec in part]
+
+
+# ─────────────────────────── 主流程 ───────────────────────────
+
+class Ingestor:
+    def __init__(
+        self,
+        target: IngestTarget,
+        workers: int = 4,
+        chunk_size: int = 1200,
+        chunk_overlap: int = 200,
+        embed_batch_size: int = 32,
+        embed_concurrency: int = 4,
+        upsert_batch_size: int = 512,
+    ):
+        self.target = target
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.upsert_batch_size = upsert_batch_size
+        self.client = get_persistent_client(target.db_path)
+        self.collection = self.client.get_or_create_collection(name=target.collection_name)
+
+    @classmethod
+    def from_config(cls, target: IngestTarget, **overrides: Any) -> "Ingestor":
+        cfg = config_manager.get_section("ingest")
+        params = {
+            "workers": int(cfg.get("workers", 4)),
+            "chunk_size": int(cfg.get("chunk_size", 1200)),
+            "chunk_overlap": int(cfg.get("chunk_overlap", 200)),
+            "embed_batch_size": int(cfg.get("embed_batch_size", 32)),
+            "embed_concurrency": int(cfg.get("embed_concurrency", 4)),
+        }
+        params.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(target, **params)
+
+    def _stored_hash(self, doc_id: str) -> Optional[str]:
+        res = self.collection.get(where=self._doc_where(doc_id), limit=1, include=["metadatas"])
+        metas = res.get("metadatas") or []
+        return metas[0].get("content_hash") if metas else None
+
+    def _doc_where(self, doc_id: str) -> dict:
+        conds = [{self.target.where_key: doc_id}] + [{k: v} for k, v in self.target.extra_metadata.items()]
+        return conds[0] if len(conds) == 1 else {"$and": conds}
+
+    def _stored_doc_ids(self) -> set:
+        res = self.collection.get(include=["metadatas"])
+        return {
+            md.get(self.target.where_key)
+            for md in (res.get("metadatas") or [])
+            if md and all(md.get(k) == v for k, v in self.target.extra_metadata.items())
+        }
+
+    def _upsert(self, doc_id: str, content_hash: str, chunks: List[str], embeddings: List[List[float]]) -> None:
+        self.collection.delete(where=self._doc_where(doc_id))
+        prefix = f"{self.target.name}::{doc_id}" if self.target.extra_metadata else doc_id
+        ids = [f"{prefix}::{i}" for i in range(len(chunks))]
+        metas = [
+            {self.target.where_key: doc_id, "chunk_index": i, "content_hash": content_hash, **self.target.extra_metadata}
+            for i in range(len(chunks))
+        ]
+        step = self.upsert_batch_size
+        for i in range(0, len(chunks), step):
+            self.collection.upsert(
+                ids=ids[i:i + step],
+                documents=chunks[i:i + step],
+                metadatas=metas[i:i + step],
+                embeddings=embeddings[i:i + step],
+            )
+
+    async def run(self, force: bool = False, delete_missing: bool = False, dry_run: bool = False) -> IngestReport:
+        t = self.target
+        report = IngestReport(target=t.name)
+        start = time.perf_counter()
+        entries = storage_catalog.entries(t.source_dir, [t.suffix])
+        report.scanned = len(entries)
+
+        # 1) hash 比对，决定需要重建的文档
+        todo: List[Tuple[str, Path, str]] = []
+        for e in entries:
+            path = Path(t.source_dir) / e.filename
+            digest = file_sha256(path)
+            if not force and self._stored_hash(e.doc_id) == digest:
+                report.skipped += 1
+                continue
+            todo.append((e.doc_id, path, digest))
+        logger.info("[INGEST] %s: %d to ingest, %d unchanged", t.name, len(todo), report.skipped)
+
+        if delete_missing:
+            on_disk = {e.doc_id for e in entries}
+            for doc_id in sorted(self._stored_doc_ids() - on_disk):
+                logger.info("[INGEST] %s: removing %s (source file deleted)", t.name, doc_id)
+                if not dry_run:
+                    self.collection.delete(where=self._doc_where(doc_id))
+                report.deleted += 1
+
+        if dry_run or not todo:
+            if report.deleted and not dry_run:
+                invalidate_doc_indexes(t.db_path, t.collection_name)
+            report.elapsed_s = time.perf_counter() - start
+            return report
+
+        # 2) 进程池解析 + 切块；3) 每个文档解析完立即 embedding（全局有界并发）并 upsert
+        loop = asyncio.get_running_loop()
+        embed_sem = asyncio.Semaphore(max(1, self.embed_concurrency))
+        upsert_lock = asyncio.Lock()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            async def _process(doc_id: str, path: Path, digest: str) -> int:
+                chunks = await loop.run_in_executor(
+                    pool, _extract_and_chunk, (str(path), self.chunk_size, self.chunk_overlap)
+                )
+                if not chunks:
+                    raise ValueError("no text extracted")
+                embeddings = await embed_texts(chunks, self.embed_batch_size, sem=embed_sem)
+                # PersistentClient 的写入串行化，避免多个文档同时删除 / 写入
+                async with upsert_lock:
+                    await asyncio.to_thread(self._upsert, doc_id, digest, chunks, embeddings)
+                logger.info("[INGEST] %s: %s → %d chunks", t.name, doc_id, len(chunks))
+                return len(chunks)
+
+            outcomes = await asyncio.gather(*(_process(*item) for item in todo), return_exceptions=True)
+
+        for (doc_id, _, _), outcome in zip(todo, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning("[INGEST] %s: %s failed: %s", t.name, doc_id, outcome)
+                report.failed.append(doc_id)
+            else:
+                report.ingested += 1
+                report.chunks += outcome
+
+        # 文档以相同 id 重写后，文档 → chunk 索引与 chunk 缓存不能再用
+        invalidate_doc_indexes(t.db_path, t.collection_name)
+        report.elapsed_s = time.perf_counter() - start
+        return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Incrementally build the Chroma stores used by the RAG tools.")
+    parser.add_argument("targets", nargs="+", choices=sorted(INGEST_TARGETS), help="stores to update")
+    parser.add_argument("--workers", type=int, help="process pool size for extraction/chunking")
+    parser.add_argument("--chunk-size", type=int, help="max characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, help="characters shared by neighbouring chunks")
+    parser.add_argument("--embed-batch-size", type=int, help="inputs per embeddings request")
+    parser.add_argument("--embed-concurrency", type=int, help="embeddings requests in flight")
+    parser.add_argument("--force", action="store_true", help="re-ingest even if the content hash is unchanged")
+    parser.add_argument("--delete-missing", action="store_true", help="drop chunks whose source file no longer exists")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument(
+        "--layout", choices=("separate", "consolidated"), default=guideline_mode(),
+        help="guideline store layout (defaults to [rag] guideline_mode)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    failed = 0
+    for key in args.targets:
+        ingestor = Ingestor.from_config(
+            resolve_target(key, args.layout),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+        )
+        report = asyncio.run(ingestor.run(force=args.force, delete_missing=args.delete_missing, dry_run=args.dry_run))
+        print(report.summary())
+        failed += len(report.failed)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,7 +2,7 @@ import json
 import asyncio
 import logging
 import time
-from typing import Any, List, Tuple, Dict
+from typing import Any, List, Optional, Tuple, Dict
 import re
 import os
 import httpx
@@ -33,6 +33,7 @@ from config_manager import (
     get_env_var,
     PUBMED_ISSN_FILE,
 )
+from tool_cache import tool_cache
 
 # ────────────────────────── PubMed Function Tool ──────────────────────────
 
@@ -42,6 +43,54 @@ PUBMED_ESUMMARY_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fc
 PUBMED_EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
 PUBMED_API_KEY = get_env_var("PUBMED_API_KEY")
 
+def _new_client() -> httpx.AsyncClient:
+    max_conn = int(os.getenv("HTTPX_MAX_CONNECTIONS", "10"))
+    keepalive = int(os.getenv("HTTPX_MAX_KEEPALIVE", "5"))
+    timeout = float(os.getenv("HTTPX_TIMEOUT", "30"))
+    return httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=keepalive),
+    )
+
+
+async def get_with_retry(
+    client: httpx.AsyncClient, url: str, params: dict, retries: int = 3, initial_delay: float = 1.0
+) -> httpx.Response:
+    delay = initial_delay
+    for attempt in range(retries):
+        try:
+            start = time.perf_counter()
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            logging.info("PubMed request ok | url=%s | status=%s | elapsed=%.2fs", url, response.status_code, elapsed)
+            return response
+        except httpx.HTTPError as exc:
+            status = getattr(exc.response, "status_code", None)
+            if status == 429:
+                wait = max(0.2, delay)
+                logging.warning("PubMed 429 Too Many Requests, sleeping %.2fs before retry", wait)
+                await asyncio.sleep(wait)
+                delay *= 2
+                continue
+            if attempt == retries - 1:
+                logging.warning("PubMed request failed after retries | url=%s", url)
+                raise
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def _fetch_text(client: Optional[httpx.AsyncClient], url: str, params: dict, throttle: float = 0.0) -> str:
+    """请求并返回响应文本；client 为 None 时使用一个临时客户端（后台刷新）。"""
+    if client is None:
+        async with _new_client() as own:
+            return await _fetch_text(own, url, params, throttle)
+    text = (await get_with_retry(client, url, params)).text
+    if throttle > 0:
+        await asyncio.sleep(throttle)
+    return text
+
+
 async def pubmed_query(
     queries: List[str] = Field(..., description="List of PubMed search query strings for PubMed"),
     retmax: int = Field(5, description="Maximum number of abstracts per query to return (sorted by relevance)"),
@@ -67,37 +116,16 @@ async def pubmed_query(
     except Exception as e:
         logging.warning(f"ISSN allowlist not loaded ({e}); skipping ISSN filter.")
 
-    max_conn = int(os.getenv("HTTPX_MAX_CONNECTIONS", "10"))
-    keepalive = int(os.getenv("HTTPX_MAX_KEEPALIVE", "5"))
-    timeout = float(os.getenv("HTTPX_TIMEOUT", "30"))
-
-    async with httpx.AsyncClient(
-        timeout=timeout,
-        limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=keepalive),
-    ) as client:
-        async def get_with_retry(url: str, params: dict, retries: int = 3, initial_delay: float = 1.0) -> httpx.Response:
-            delay = initial_delay
-            for attempt in range(retries):
-                try:
-                    start = time.perf_counter()
-                    response = await client.get(url, params=params)
-                    response.raise_for_status()
-                    elapsed = time.perf_counter() - start
-                    logging.info("PubMed request ok | url=%s | status=%s | elapsed=%.2fs", url, response.status_code, elapsed)
-                    return response
-                except httpx.HTTPError as exc:
-                    status = getattr(exc.response, "status_code", None)
-                    if status == 429:
-                        wait = max(0.2, delay)
-                        logging.warning("PubMed 429 Too Many Requests, sleeping %.2fs before retry", wait)
-                        await asyncio.sleep(wait)
-                        delay *= 2
-                        continue
-                    if attempt == retries - 1:
-                        logging.warning("PubMed request failed after retries | url=%s", url)
-                        raise
-                    await asyncio.sleep(delay)
-                    delay *= 2
+    async with _new_client() as client:
+        async def cached_text(namespace: str, url: str, params: dict, throttle: float = 0.0) -> str:
+            # api_key 不进入缓存键；过期刷新在后台进行，不能依赖本次请求的 client
+            request = {"url": url, "params": {k: v for k, v in params.items() if k != "api_key"}}
+            return await tool_cache.call_async(
+                namespace,
+                request,
+                lambda: _fetch_text(client, url, params, throttle),
+                refresh=lambda: _fetch_text(None, url, params, throttle),
+            )
 
         # 1) Loop over each query to perform ESearch
         for query in queries:
@@ -114,11 +142,13 @@ async def pubmed_query(
             }
             if PUBMED_API_KEY:
                 search_params["api_key"] = PUBMED_API_KEY
-            esearch_resp = await get_with_retry(PUBMED_ESEARCH_URL, search_params)
-            esearch_data = esearch_resp.json()
+            # 节流只在真正发出请求时生效（缓存命中不占 NCBI 配额）
+            esearch_data = json.loads(await cached_text(
+                "pubmed_esearch", PUBMED_ESEARCH_URL, search_params,
+                throttle=float(os.getenv("PUBMED_THROTTLE_SEC", "0.15")),
+            ))
             id_list = esearch_data.get("esearchresult", {}).get("idlist", [])
             logging.info("PubMed ESearch | query=%s | hits=%d", term, len(id_list))
-            await asyncio.sleep(float(os.getenv("PUBMED_THROTTLE_SEC", "0.15")))
 
             # Collect unique IDs preserving order
             for pmid in id_list:
@@ -133,8 +163,9 @@ async def pubmed_query(
         esummary_params = {"db": "pubmed", "id": ",".join(aggregated_ids), "retmode": "json"}
         if PUBMED_API_KEY:
             esummary_params["api_key"] = PUBMED_API_KEY
-        esummary_resp = await get_with_retry(PUBMED_ESUMMARY_URL, esummary_params)
-        summary_data = esummary_resp.json().get("result", {})
+        summary_data = json.loads(
+            await cached_text("pubmed_esummary", PUBMED_ESUMMARY_URL, esummary_params)
+        ).get("result", {})
 
         # Filter PMIDs by allowed ISSNs (if loaded)
         filtered_ids: List[str] = []
@@ -167,8 +198,7 @@ async def pubmed_query(
             }
             if PUBMED_API_KEY:
                 fetch_params["api_key"] = PUBMED_API_KEY
-            efetch_resp = await get_with_retry(PUBMED_EFETCH_URL, fetch_params)
-            raw_text = efetch_resp.text.strip()
+            raw_text = (await cached_text("pubmed_efetch", PUBMED_EFETCH_URL, fetch_params)).strip()
             raw_text = re.sub(
                 r"Conflict of interest statement:[\s\S]*?(?=\n\n\d+\.|\Z)",
                 "",
@@ -1,18 +1,29 @@
 import logging
-import os
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-import requests
-from difflib import get_close_matches
 from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 
+import numpy as np
+
 from config_manager import (
     config_manager,
     embed_client,
     EMBED_MODEL,
     MODEL_NAME,
-    RERANKER_MODEL,
-    RERANKER_URL,
 )
+from candidate_pruning import prune_candidates
+from compression import compress_chunks, resolve_compress_settings
+from dedup import dedup_against, dedup_candidates, jaccard_matrix, mmr_select
+from doc_index import max_candidates as doc_index_max_candidates
+from embed_batcher import get_embed_batcher, resolve_embed_batch_settings
+from fuzzy_match import get_fuzzy_index
+from rag_metrics import RagTrace, finish_trace, metrics_registry, note_cache, start_trace
+from rag_prefetch import lookup_selection
+from reranker_client import RerankerUnavailable, get_reranker_client
+from semantic_cache import fingerprint, resolve_semantic_cache_settings, semantic_cache
+from storage_catalog import storage_catalog
+from vector_store import as_vector_store
 
 logger = logging.getLogger(__name__)
 
@@ -52,37 +63,110 @@ def choose_items_with_llm(
         response_format=SelectionOutput,
     )
     selected = resp.choices[0].message.parsed.selected_items
-    valid: List[str] = []
-    for name in selected:
-        close = get_close_matches(name, items, n=1, cutoff=cutoff)
-        if close and close[0] not in valid:
-            valid.append(close[0])
-    return valid
+    return get_fuzzy_index(items).match_all(selected, cutoff=cutoff)
 
 
 def embed_query_text(base_query: str) -> List[float]:
     """单次 embedding，统一模型/格式。"""
+    return embed_query_texts([base_query])[0]
+
+
+def embed_query_texts(texts: Sequence[str]) -> List[List[float]]:
+    """
+    多个查询合并成一次 embeddings 请求，按输入顺序返回。
+    [rag.embed_batch] 启用时经 embed_batcher 与其他线程的并发请求合并成微批发送。
+    """
+    if not texts:
+        return []
+    if resolve_embed_batch_settings()["enabled"]:
+        return get_embed_batcher().embed_sync(texts)
     resp = embed_client.embeddings.create(
         model=EMBED_MODEL,
-        input=[base_query],
+        input=list(texts),
         encoding_format="float",
     )
-    return resp.data[0].embedding
+    data = sorted(resp.data, key=lambda d: d.index)
+    return [d.embedding for d in data]
+
+
+def query_collection(
+    collection, embedding: List[float], where: dict, n_results: int = 20
+) -> Tuple[List[str], List[dict], List[float]]:
+    """从向量库（Chroma collection 或 VectorStore）查询文档、元信息与距离（越小越相关）。"""
+    return as_vector_store(collection).query(embedding, where, n_results)
+
+
+def query_collection_many(
+    collection, embeddings: Sequence[List[float]], where: dict, n_results: int = 20
+) -> List[Tuple[List[str], List[dict], List[float]]]:
+    """同一 where 下多个查询向量一次查询，按 embeddings 顺序返回 (docs, metas, dists)。"""
+    return as_vector_store(collection).query_many(embeddings, where, n_results)
 
 
 def query_collection_docs(collection, embedding: List[float], where: dict, n_results: int = 20) -> Tuple[List[str], List[dict]]:
     """从 Chroma 集合中查询文档与元信息。"""
-    res = collection.query(
-        query_embeddings=[embedding],
-        n_results=n_results,
-        where=where,
-        include=["documents", "metadatas"],
-    )
-    docs = res["documents"][0] if res.get("documents") else []
-    metas = res["metadatas"][0] if res.get("metadatas") else []
+    docs, metas, _ = query_collection(collection, embedding, where, n_results=n_results)
     return docs, metas
 
 
+def rerank_scores(base_query: str, docs: List[str]) -> Optional[List[Tuple[int, float]]]:
+    """调用 reranker，返回按分数降序的 (下标, 分数)；reranker 不可用时返回 None。"""
+    if not docs:
+        return []
+    try:
+        return get_reranker_client().rerank_sync(base_query, docs)
+    except RerankerUnavailable as e:
+        logger.warning("[RERANKER] unavailable: %s", e)
+        return None
+
+
+async def rerank_scores_async(base_query: str, docs: List[str]) -> Optional[List[Tuple[int, float]]]:
+    """rerank_scores 的异步版本，供运行在事件循环中的调用方使用（不占用线程）。"""
+    if not docs:
+        return []
+    try:
+        return await get_reranker_client().rerank_async(base_query, docs)
+    except RerankerUnavailable as e:
+        logger.warning("[RERANKER] unavailable: %s", e)
+        return None
+
+
+def order_by_distance(distances: Optional[Sequence[float]], n: int) -> List[int]:
+    """按向量距离升序给出下标；缺少距离时保持检索顺序。"""
+    if not distances or len(distances) != n:
+        return list(range(n))
+    return sorted(range(n), key=lambda i: distances[i])
+
+
+def select_ranked(
+    scored: Optional[List[Tuple[int, float]]],
+    n: int,
+    top_k: int = 5,
+    score_threshold: float = 0.6,
+    distances: Optional[Sequence[float]] = None,
+    mmr_lambda: Optional[float] = None,
+    similarity: Any = None,
+) -> List[int]:
+    """
+    由 rerank 结果挑选最终下标：过滤阈值，可选 MMR；
+    scored 为 None（reranker 不可用）时退化为距离最近的 top_k。
+    """
+    if scored is None:
+        # 降级：没有 relevance_score 可比较阈值，直接取距离最近的 top_k
+        logger.warning("[RERANKER] falling back to vector-distance ordering for %d chunks", n)
+        return order_by_distance(distances, n)[:top_k]
+
+    passed = [(idx, score) for idx, score in scored if not (score_threshold and score < score_threshold)]
+    if mmr_lambda is not None and similarity is not None and len(passed) > top_k:
+        start = time.perf_counter()
+        passed = mmr_select(passed, similarity, top_k, mmr_lambda)
+        logger.info(
+            "[MMR] selected %d/%d chunks (lambda=%.2f) in %.1fms",
+            len(passed), len(scored), mmr_lambda, (time.perf_counter() - start) * 1000,
+        )
+    return [idx for idx, _ in passed[:top_k]]
+
+
 def rerank_chunks(
     base_query: str,
     docs: List[str],
@@ -90,52 +174,53 @@ def rerank_chunks(
     citation_builder: Callable[[dict], str],
     top_k: int = 5,
     score_threshold: float = 0.6,
+    distances: Optional[List[float]] = None,
+    mmr_lambda: Optional[float] = None,
+    similarity: Any = None,
 ) -> List[str]:
-    """调用 reranker 后拼装带 citation 的段落。"""
-    if not docs or not RERANKER_URL:
+    """
+    调用 reranker 后拼装带 citation 的段落；reranker 不可用时退化为向量距离排序。
+    传入 mmr_lambda 与 similarity（按 docs 下标的两两相似度矩阵）时，
+    用 MMR 在通过阈值的 chunk 中挑选 top_k。
+    """
+    if not docs:
         return []
+    picked = select_ranked(
+        rerank_scores(base_query, docs),
+        len(docs),
+        top_k=top_k,
+        score_threshold=score_threshold,
+        distances=distances,
+        mmr_lambda=mmr_lambda,
+        similarity=similarity,
+    )
+    return [f"{docs[i]}\n— **Source:** {citation_builder(metas[i] if metas else {})}" for i in picked]
 
-    headers = {"Content-Type": "application/json"}
-    # reranker 的鉴权应优先读取 reranker_config；兼容旧逻辑才 fallback 到 embedding_config
-    api_key = None
-    try:
-        api_key = config_manager.reranker_config.get("api_key")
-    except Exception:
-        api_key = None
-    if not api_key:
-        try:
-            api_key = config_manager.embedding_config.get("api_key")
-        except Exception:
-            api_key = None
-    if api_key:
-        headers["Authorization"] = f"bearer {api_key}"
 
-    try:
-        resp = requests.post(
-            RERANKER_URL,
-            json={"model": RERANKER_MODEL, "query": base_query, "documents": docs},
-            headers=headers,
-            timeout=30,
-        )
-        resp.raise_for_status()
-        results = resp.json().get("results", [])
-    except Exception:
+async def rerank_chunks_async(
+    base_query: str,
+    docs: List[str],
+    metas: List[dict],
+    citation_builder: Callable[[dict], str],
+    top_k: int = 5,
+    score_threshold: float = 0.6,
+    distances: Optional[List[float]] = None,
+    mmr_lambda: Optional[float] = None,
+    similarity: Any = None,
+) -> List[str]:
+    """rerank_chunks 的异步版本。"""
+    if not docs:
         return []
-
-    ranked = []
-    for item in sorted(results, key=lambda x: x.get("relevance_score", 0), reverse=True):
-        idx = item.get("index")
-        score = item.get("relevance_score") or 0
-        if idx is None or idx >= len(docs):
-            continue
-        if score_threshold and score < score_threshold:
-            continue
-        md = metas[idx] if metas else {}
-        citation = citation_builder(md)
-        ranked.append(f"{docs[idx]}\n— **Source:** {citation}")
-        if len(ranked) >= top_k:
-            break
-    return ranked
+    picked = select_ranked(
+        await rerank_scores_async(base_query, docs),
+        len(docs),
+        top_k=top_k,
+        score_threshold=score_threshold,
+        distances=distances,
+        mmr_lambda=mmr_lambda,
+        similarity=similarity,
+    )
+    return [f"{docs[i]}\n— **Source:** {citation_builder(metas[i] if metas else {})}" for i in picked]
 
 
 def safe_tool_call(tool_name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
@@ -173,17 +258,271 @@ def validate_paths(paths: Mapping[str, Path]) -> List[str]:
 
 
 def list_files(storage_dir: Path, suffixes: Sequence[str]) -> List[str]:
-    """列出目录下指定后缀的文件名（仅文件名，不含路径）。"""
-    p = Path(storage_dir)
-    if not p.exists():
-        return []
-    suffixes_l = [s.lower() for s in suffixes]
-    out: List[str] = []
-    for name in os.listdir(str(p)):
-        low = name.lower()
-        if any(low.endswith(suf) for suf in suffixes_l):
-            out.append(name)
-    return out
+    """列出目录下指定后缀的文件名（仅文件名，不含路径；走 storage_catalog 缓存）。"""
+    return storage_catalog.list_files(Path(storage_dir), suffixes)
+
+
+def build_where(where_key: str, ids: Sequence[str], source_filter: Optional[Mapping[str, Any]] = None) -> dict:
+    """构造 Chroma where：文档过滤 + （合并库模式下的）source 过滤。"""
+    cond = {where_key: {"$in": list(ids)}} if len(ids) > 1 else {where_key: ids[0]}
+    if not source_filter:
+        return cond
+    return {"$and": [{k: v} for k, v in source_filter.items()] + [cond]}
+
+
+def _match_source(md: Mapping[str, Any], src_names: Sequence[str], sources: Mapping[str, Mapping[str, Any]]) -> str:
+    """根据 chunk 元信息找回它属于哪个 source（合并库查询结果的来源标记）。"""
+    for src_name in src_names:
+        flt = sources[src_name].get("source_filter") or {}
+        if all(md.get(k) == v for k, v in flt.items()):
+            return src_name
+    return src_names[0]
+
+
+def resolve_prune_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.prune] 与调用方覆盖项，得到裁剪参数。"""
+    cfg = dict(config_manager.get_section("rag").get("prune", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "mode": str(cfg.get("mode", "distance")),
+        "max_candidates": int(cfg.get("max_candidates", 64)),
+        "per_source_cap": int(cfg.get("per_source_cap", 0)),
+        "hybrid_alpha": float(cfg.get("hybrid_alpha", 0.5)),
+    }
+
+
+def resolve_dedup_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.dedup] 与调用方覆盖项，得到去重 / MMR 参数。"""
+    cfg = dict(config_manager.get_section("rag").get("dedup", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "enabled": bool(cfg.get("enabled", True)),
+        "threshold": float(cfg.get("threshold", 0.8)),
+        "num_perm": int(cfg.get("num_perm", 64)),
+        "shingle_size": int(cfg.get("shingle_size", 5)),
+        "bands": int(cfg.get("bands", 16)),
+        "mmr": bool(cfg.get("mmr", False)),
+        "mmr_lambda": float(cfg.get("mmr_lambda", 0.7)),
+    }
+
+
+def resolve_adaptive_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.adaptive] 与调用方覆盖项，得到自适应深度参数。"""
+    cfg = dict(config_manager.get_section("rag").get("adaptive", {}))
+    if overrides:
+        cfg.update(overrides)
+    windows = sorted({int(w) for w in cfg.get("windows", [10, 40, 160]) if int(w) > 0})
+    return {
+        "enabled": bool(cfg.get("enabled", False)),
+        "windows": windows or [10, 40, 160],
+    }
+
+
+@dataclass
+class _Candidates:
+    """单个查询的候选 chunk（docs/metas/dists/srcs 按下标对齐）。"""
+    docs: List[str] = field(default_factory=list)
+    metas: List[dict] = field(default_factory=list)
+    dists: List[float] = field(default_factory=list)
+    srcs: List[str] = field(default_factory=list)
+    sigs: Any = None  # 去重阶段得到的 MinHash 签名，供 MMR 复用
+
+    @property
+    def distances(self) -> Optional[List[float]]:
+        return self.dists if len(self.dists) == len(self.docs) else None
+
+    def take(self, keep: Sequence[int]) -> "_Candidates":
+        return _Candidates(
+            docs=[self.docs[i] for i in keep],
+            metas=[self.metas[i] for i in keep] if self.metas else self.metas,
+            dists=[self.dists[i] for i in keep] if self.distances is not None else [],
+            srcs=[self.srcs[i] for i in keep],
+            sigs=self.sigs[keep] if self.sigs is not None else None,
+        )
+
+
+def _source_depth(cfg: Mapping[str, Any], ids: Sequence[str], n_results: int) -> int:
+    """
+    单个 source 的候选上限：有 doc_index 时为选中文档的 chunk 总数，但不超过 [rag.doc_index] max_candidates
+    （可用 n_results 再收紧）；否则为 n_results。
+    """
+    doc_index = cfg.get("doc_index")
+    if doc_index is not None:
+        total = doc_index.chunk_count(ids)
+        cap = doc_index_max_candidates()
+        if cap > 0:
+            total = min(total, cap)
+        return min(total, int(cfg["n_results"])) if "n_results" in cfg else total
+    return int(cfg.get("n_results", n_results))
+
+
+def _retrieve_candidates(
+    tool_name: str,
+    sources: Mapping[str, Mapping[str, Any]],
+    groups: Mapping[int, List[str]],
+    chosen_by_src: Mapping[str, List[str]],
+    embeddings: Sequence[List[float]],
+    n_results: int,
+    depth: Optional[int] = None,
+) -> List[_Candidates]:
+    """按 collection 分组查询，每个查询向量得到一份候选；depth 限制每个 source 的 n_results。"""
+    cands = [_Candidates() for _ in embeddings]
+    for src_names in groups.values():
+        collection = sources[src_names[0]]["collection"]
+        conds: List[dict] = []
+        per_n_results = 0
+        for src_name in src_names:
+            cfg = sources[src_name]
+            ids = [cfg["id_transform"](x) for x in chosen_by_src[src_name]]
+            conds.append(build_where(cfg["where_key"], ids, cfg.get("source_filter")))
+            src_n = _source_depth(cfg, ids, n_results)
+            per_n_results += min(src_n, depth) if depth else src_n
+        where = conds[0] if len(conds) == 1 else {"$or": conds}
+
+        doc_index = sources[src_names[0]].get("doc_index") if len(src_names) == 1 else None
+        if doc_index is not None:
+            # 文档范围检索：按预计算的 chunk id 直接取回并打分，不走 ANN
+            logger.info("[%s] Fetching %s chunks of %d documents by id", tool_name, src_names[0], len(ids))
+            results = doc_index.query_many(ids, embeddings, n_results=per_n_results)
+        else:
+            logger.info("[%s] Querying %s n_results=%s", tool_name, "+".join(src_names), per_n_results)
+            results = query_collection_many(collection, embeddings, where, n_results=per_n_results)
+        for c, (docs, metas, dists) in zip(cands, results):
+            c.docs.extend(docs)
+            c.metas.extend(metas)
+            c.dists.extend(dists)
+            if len(src_names) == 1:
+                c.srcs.extend([src_names[0]] * len(docs))
+            else:
+                c.srcs.extend(_match_source(md, src_names, sources) for md in metas)
+    return cands
+
+
+def _adaptive_search(
+    tool_name: str,
+    base_query: str,
+    retrieve: Callable[[Optional[int]], List[_Candidates]],
+    trace: RagTrace,
+    *,
+    windows: Sequence[int],
+    max_depth: int,
+    top_k: int,
+    score_threshold: float,
+    dedup_cfg: Mapping[str, Any],
+) -> Tuple[_Candidates, Optional[List[Tuple[int, float]]]]:
+    """
+    逐级加深检索：每级重新查询更大的 n_results，只对新出现的 chunk 去重 + rerank，
+    返回累积候选与（下标对应累积候选的）rerank 结果；reranker 不可用时 rerank 结果为 None。
+    """
+    depths = sorted({min(int(w), max_depth) for w in windows} | {max_depth})
+    acc = _Candidates()
+    scored: List[Tuple[int, float]] = []
+    seen: set = set()
+    reason = "max_depth"
+    depth = depths[0]
+    reranker_ok = True
+    for step, depth in enumerate(depths):
+        window = retrieve(depth)[0]
+        new = window.take([i for i, d in enumerate(window.docs) if d not in seen])
+        seen.update(window.docs)
+        trace.lap("query")
+        if not new.docs:
+            reason = "exhausted"
+            break
+
+        if dedup_cfg["enabled"]:
+            keep, dedup_report, sigs = dedup_against(
+                new.docs,
+                new.distances,
+                acc.sigs,
+                threshold=dedup_cfg["threshold"],
+                num_perm=dedup_cfg["num_perm"],
+                shingle_size=dedup_cfg["shingle_size"],
+                bands=dedup_cfg["bands"],
+            )
+            logger.info("[%s] depth=%d %s", tool_name, depth, dedup_report.summary())
+            new = new.take(keep)
+            new.sigs = sigs
+        trace.lap("dedup")
+
+        new_scored = rerank_scores(base_query, new.docs)
+        trace.lap("rerank")
+        offset = len(acc.docs)
+        acc = _Candidates(
+            docs=acc.docs + new.docs,
+            metas=acc.metas + new.metas,
+            dists=acc.dists + new.dists if acc.distances is not None and new.distances is not None else [],
+            srcs=acc.srcs + new.srcs,
+            sigs=new.sigs if offset == 0 else (
+                np.vstack([acc.sigs, new.sigs]) if acc.sigs is not None and new.sigs is not None else None
+            ),
+        )
+        if new_scored is None:
+            # reranker 不可用：不再加深，交给距离排序降级
+            reranker_ok = False
+            reason = "reranker_unavailable"
+            break
+        scored.extend((offset + i, sc) for i, sc in new_scored)
+        new_passed = sum(1 for _, sc in new_scored if not score_threshold or sc >= score_threshold)
+        passed = sum(1 for _, sc in scored if not score_threshold or sc >= score_threshold)
+        logger.info(
+            "[%s] adaptive depth=%d: +%d reranked, %d/%d above threshold",
+            tool_name, depth, len(new.docs), passed, top_k,
+        )
+        if passed >= top_k:
+            reason = "enough"
+            break
+        if step > 0 and new_passed == 0:
+            reason = "falloff"
+            break
+
+    scored.sort(key=lambda x: x[1], reverse=True)
+    trace.count(chunks_retrieved=len(seen), chunks_reranked=len(acc.docs), adaptive_depth=depth)
+    metrics_registry.record_event(tool_name, f"adaptive_depth_{depth}")
+    metrics_registry.record_event(tool_name, f"adaptive_stop_{reason}")
+    logger.info("[%s] adaptive retrieval stopped at depth=%d (%s)", tool_name, depth, reason)
+    return acc, (scored if reranker_ok else None)
+
+
+_SOURCE_SETTING_KEYS = (
+    "label", "storage_dir", "suffixes", "where_key", "source_filter", "n_results", "top_k", "score_threshold", "rerank_cap",
+)
+
+
+def _output_settings_fingerprint(
+    tool_name: str,
+    sources: Mapping[str, Mapping[str, Any]],
+    role_hint: Optional[str],
+    role_templates: Optional[Mapping[str, str]],
+    n_results: int,
+    top_k: int,
+    score_threshold: float,
+    prune: Optional[Mapping[str, Any]],
+    dedup: Optional[Mapping[str, Any]],
+    adaptive: Optional[Mapping[str, Any]],
+    compress: Optional[Mapping[str, Any]],
+) -> str:
+    """语义缓存键中影响输出的全部设置：角色模板、各 source 的参数、全局参数与各阶段（合并配置后）的设置。"""
+    per_source = sorted(
+        (name, [(k, str(cfg[k])) for k in _SOURCE_SETTING_KEYS if k in cfg], "doc_index" in cfg)
+        for name, cfg in sources.items()
+    )
+    template = role_templates.get(role_hint) if role_templates and role_hint else None
+    return fingerprint(
+        role_hint,
+        template,
+        per_source,
+        n_results,
+        top_k,
+        score_threshold,
+        sorted(resolve_prune_settings(prune).items()),
+        sorted(resolve_dedup_settings(dedup).items()),
+        sorted(resolve_adaptive_settings(adaptive).items()),
+        sorted(resolve_compress_settings(tool_name, compress).items()),
+        doc_index_max_candidates(),
+    )
 
 
 def run_vector_rag(
@@ -201,9 +540,16 @@ def run_vector_rag(
     n_results: int = 20,
     top_k: int = 5,
     score_threshold: float = 0.6,
+    prune: Optional[Mapping[str, Any]] = None,
+    dedup: Optional[Mapping[str, Any]] = None,
+    queries: Optional[Sequence[str]] = None,
+    adaptive: Optional[Mapping[str, Any]] = None,
+    semantic: Optional[Mapping[str, Any]] = None,
+    prefetch: bool = False,
+    compress: Optional[Mapping[str, Any]] = None,
 ) -> str:
     """
-    统一向量检索管线：选文件 → embedding → Chroma query → rerank → 拼 citation。
+    统一向量检索管线：选文件 → embedding → Chroma query → 候选裁剪 → 去重 → rerank (+MMR) → 拼 citation。
 
     sources 每个条目需要包含：
       - label: 传给 choose_items_with_llm 的标签（如 \"ESMO\"）
@@ -214,28 +560,68 @@ def run_vector_rag(
       - id_transform: Callable[[str], str]  (把选中的文件名转成 where 的值；例如去掉 .pdf)
       - citation_builder: Callable[[dict], str]
       - (可选) score_threshold/top_k/n_results 覆盖全局
+      - (可选) rerank_cap: 该 source 最多送进 reranker 的 chunk 数
+      - (可选) source_filter: 合并库模式下的来源过滤（如 {"source": "ESMO"}）；
+        多个 source 共享同一个 collection 时只发一次查询
+      - (可选) doc_index: doc_index.DocChunkIndex；设置后按选中文档的 chunk id 直接取回并用
+        NumPy 打分（余弦距离），不做 ANN 查询；候选上限默认为选中文档的 chunk 总数，
+        但不超过 [rag.doc_index] max_candidates，设置 n_results 时再以其收紧
+
+    prune 覆盖 config.toml [rag.prune] 的裁剪参数（mode/max_candidates/per_source_cap/hybrid_alpha）。
+    dedup 覆盖 config.toml [rag.dedup] 的去重 / MMR 参数（enabled/threshold/num_perm/shingle_size/bands/mmr/mmr_lambda）。
+    去重在裁剪之后进行，只处理送进 reranker 的候选。
+
+    queries 非空时为批量模式：文件选择只做一次，所有查询合并成一次 embeddings 请求、
+    每组 collection 一次多向量查询，各查询的 rerank 并发执行；输出按查询分组，
+    已在前面分组出现过的 chunk 不再重复返回。
+
+    adaptive 覆盖 config.toml [rag.adaptive]（enabled/windows）。启用时（仅单查询）按窗口逐级加深检索，
+    每级只 rerank 新增候选；凑够 top_k 个过阈值的结果或新窗口里已没有过阈值的候选时停止，
+    此时不再做 rerank 前裁剪（窗口本身限制了 rerank 数量）。各深度的使用次数记入 metrics_registry 事件。
+
+    semantic 覆盖 config.toml [rag.semantic_cache]（enabled/threshold）。启用时（仅单查询）先做 embedding，
+    在 tool + 患者病史 + 可选文件集合 + 影响输出的全部设置（角色、各 source 与全局参数、裁剪 / 去重 / 自适应 /
+    压缩设置）相同的缓存条目中找余弦相似度 ≥ threshold 的查询，
+    命中则直接返回其输出（跳过选文件 / 检索 / rerank），未命中则在成功返回后写入缓存。
+
+    prefetch=True 表示这是编排层发起的患者级预取：选出的文件登记到 rag_prefetch.selection_store。
+    [rag.prefetch] reuse_selection 开启时，同一 tool + 患者 + 可选文件集合的后续调用在查询为空、
+    或查询向量与患者病史向量的余弦相似度 ≥ reuse_similarity 时复用该选择（预取进行中则等待最多
+    wait_timeout 秒），跳过 LLM 选文件；针对具体问题的查询照常按查询选文件。
+
+    compress 覆盖 config.toml [rag.compress]（enabled/mode/budget_tokens；按工具的预算见 [rag.compress.budgets]）。
+    启用时在选出最终 chunk 后做句子级抽取式压缩，只保留与查询最相关的句子，citation 不变。
+
+    每次调用生成一个 rag_metrics.RagTrace（分阶段耗时 / 规模 / 缓存命中），
+    汇总进 metrics_registry 并挂到当前工具调用上。
     """
+    trace = start_trace(tool_name)
     try:
-        base_query = query.strip() or patient_history
-        if not base_query:
+        query_list = [q.strip() for q in (queries or []) if q and q.strip()] or [query.strip()]
+        base_queries = [q or patient_history for q in query_list]
+        if not all(base_queries):
             logger.warning("[%s] No patient history or query provided", tool_name)
             return "No patient history or query provided."
 
         if role_templates and role_hint and role_hint in role_templates:
-            base_query = base_query + "\n\n" + str(role_templates[role_hint])
+            base_queries = [q + "\n\n" + str(role_templates[role_hint]) for q in base_queries]
+        multi = len(base_queries) > 1
+        trace.count(queries=len(base_queries))
 
         # 1) 枚举文件 + 路径校验
         missing_msgs: List[str] = []
         available_by_src: Dict[str, List[str]] = {}
         for src_name, cfg in sources.items():
             storage_dir = Path(cfg["storage_dir"])
-            if not storage_dir.exists():
+            if not storage_catalog.exists(storage_dir):
                 missing_msgs.append(f"{src_name} directory not found: {storage_dir}")
                 available_by_src[src_name] = []
                 continue
             items = list_files(storage_dir, cfg.get("suffixes", []))
             available_by_src[src_name] = items
             logger.info("[%s] %s: %d files", tool_name, src_name, len(items))
+        trace.lap("list_files")
+        trace.count(files_available=sum(len(v) for v in available_by_src.values()))
 
         if all(len(v) == 0 for v in available_by_src.values()):
             details = ", ".join(f"{k}({len(v)})" for k, v in available_by_src.items())
@@ -243,53 +629,186 @@ def run_vector_rag(
                 logger.error("[%s] Missing sources: %s | %s", tool_name, details, "; ".join(missing_msgs))
             return f"Missing sources/files: {details}"
 
-        # 2) 选择相关文件（逐 source）
+        # 1.5) 会话级语义缓存：同一患者、同一文件集合下语义相同的查询直接复用输出
+        embeddings: Optional[List[List[float]]] = None
+        cache_key = None
+        semantic_cfg = resolve_semantic_cache_settings(semantic)
+        if semantic_cfg["enabled"] and not multi:
+            embeddings = embed_query_texts(base_queries)
+            trace.lap("embed")
+            cache_key = (
+                tool_name,
+                fingerprint(patient_history),
+                fingerprint(sorted((k, tuple(v)) for k, v in available_by_src.items())),
+                _output_settings_fingerprint(
+                    tool_name, sources, role_hint, role_templates, n_results, top_k, score_threshold,
+                    prune, dedup, adaptive, compress,
+                ),
+            )
+            hit = semantic_cache.lookup(cache_key, embeddings[0], threshold=semantic_cfg["threshold"])
+            note_cache("semantic", hit is not None)
+            trace.lap("cache")
+            if hit is not None:
+                output, sim, cached_query = hit
+                logger.info("[%s] Semantic cache hit (cos=%.3f) for %r ≈ %r", tool_name, sim, query_list[0], cached_query)
+                return output
+
+        # 2) 选择相关文件（逐 source；批量模式下所有查询共用一次选择）
         summary_text = patient_history
-        if query.strip():
-            summary_text = f"Patient History:\n{patient_history}\n\nQuery:\n{query.strip()}"
+        query_text = "\n".join(f"- {q}" for q in query_list) if multi else query_list[0]
+        if query_text:
+            summary_text = f"Patient History:\n{patient_history}\n\nQuery:\n{query_text}"
+
+        def _query_embeddings() -> List[List[float]]:
+            nonlocal embeddings
+            if embeddings is None:
+                embeddings = embed_query_texts(base_queries)
+                trace.lap("embed")
+            return embeddings
+
+        selection_key = (
+            tool_name,
+            fingerprint(patient_history),
+            fingerprint(sorted((k, tuple(v)) for k, v in available_by_src.items())),
+        )
+        # 预取的选择来自患者病史；只有查询与之足够接近时才复用，否则按查询重新选文件
+        selection_future, prefetched = lookup_selection(
+            tool_name,
+            selection_key,
+            prefetch=prefetch,
+            query_embeddings=_query_embeddings if any(query_list) else None,
+        )
 
-        chosen_by_src: Dict[str, List[str]] = {}
-        for src_name, cfg in sources.items():
-            items = available_by_src.get(src_name, [])
-            label = cfg.get("label", src_name)
-            chosen = choose_items_with_llm(summary_text, items, label, external_client)
-            chosen_by_src[src_name] = chosen
-            logger.info("[%s] %s selected: %s", tool_name, src_name, chosen)
+        if prefetched is not None:
+            chosen_by_src = {src_name: list(prefetched["chosen"].get(src_name, [])) for src_name in sources}
+            logger.info("[%s] Reusing prefetched selection: %s", tool_name, chosen_by_src)
+        else:
+            chosen_by_src = {}
+            try:
+                for src_name, cfg in sources.items():
+                    items = available_by_src.get(src_name, [])
+                    label = cfg.get("label", src_name)
+                    chosen = choose_items_with_llm(summary_text, items, label, external_client)
+                    chosen_by_src[src_name] = chosen
+                    logger.info("[%s] %s selected: %s", tool_name, src_name, chosen)
+                if selection_future is not None:
+                    # 登记选择时附上患者级查询的向量，供后续调用判断查询是否接近
+                    _query_embeddings()
+            except Exception as e:
+                if selection_future is not None:
+                    selection_future.set_exception(e)
+                raise
+            if selection_future is not None:
+                selection_future.set_result({"chosen": chosen_by_src, "embedding": embeddings[0]})
+        trace.lap("select")
+        trace.count(files_selected=sum(len(v) for v in chosen_by_src.values()))
 
         if all(len(v) == 0 for v in chosen_by_src.values()):
             details = ", ".join(f"{k}({len(v)})" for k, v in chosen_by_src.items())
             logger.warning("[%s] No valid items selected: %s", tool_name, details)
             return f"No valid items selected: {details}"
 
-        # 3) embedding
-        logger.info("[%s] Embedding query...", tool_name)
-        embedding = embed_query_text(base_query)
+        # 3) embedding（多个查询一次请求）
+        if embeddings is None:
+            logger.info("[%s] Embedding %d quer%s...", tool_name, len(base_queries), "ies" if multi else "y")
+            embeddings = embed_query_texts(base_queries)
+            trace.lap("embed")
 
         # 4) Chroma query 聚合
-        docs_all: List[str] = []
-        metas_all: List[dict] = []
+        # 共享同一个 collection 的 source（合并库模式）合并成一次查询
+        groups: Dict[int, List[str]] = {}
         for src_name, cfg in sources.items():
-            chosen = chosen_by_src.get(src_name, [])
-            if not chosen:
-                continue
-
-            collection = cfg["collection"]
-            where_key = cfg["where_key"]
-            id_transform = cfg["id_transform"]
-            ids = [id_transform(x) for x in chosen]
-            where = {where_key: {"$in": ids}} if len(ids) > 1 else {where_key: ids[0]}
-            per_n_results = int(cfg.get("n_results", n_results))
-
-            logger.info("[%s] Querying %s where=%s n_results=%s", tool_name, src_name, where_key, per_n_results)
-            docs, metas = query_collection_docs(collection, embedding, where, n_results=per_n_results)
-            docs_all.extend(docs)
-            metas_all.extend(metas)
-
-        logger.info("[%s] Retrieved %d chunks (pre-rerank)", tool_name, len(docs_all))
-        if not docs_all:
-            return "No relevant chunks found after reranking."
-
-        # 5) rerank + citation
+            if chosen_by_src.get(src_name):
+                groups.setdefault(id(cfg["collection"]), []).append(src_name)
+
+        def _retrieve(depth: Optional[int] = None) -> List[_Candidates]:
+            return _retrieve_candidates(
+                tool_name, sources, groups, chosen_by_src, embeddings, n_results, depth=depth
+            )
+
+        dedup_cfg = resolve_dedup_settings(dedup)
+        adaptive_cfg = resolve_adaptive_settings(adaptive)
+        if adaptive_cfg["enabled"] and not multi:
+            # 4') 自适应深度：逐级扩大检索窗口，只 rerank 新增候选，够用即停
+            max_depth = max(
+                _source_depth(sources[s], [sources[s]["id_transform"](x) for x in chosen_by_src[s]], n_results)
+                for names in groups.values() for s in names
+            )
+            acc, scored = _adaptive_search(
+                tool_name,
+                base_queries[0],
+                _retrieve,
+                trace,
+                windows=adaptive_cfg["windows"],
+                max_depth=max_depth,
+                top_k=top_k,
+                score_threshold=score_threshold,
+                dedup_cfg=dedup_cfg,
+            )
+            if not acc.docs:
+                return "No relevant chunks found after reranking."
+            cands, scored_lists = [acc], [scored]
+        else:
+            cands = _retrieve()
+            trace.lap("query")
+            trace.count(chunks_retrieved=sum(len(c.docs) for c in cands))
+            logger.info("[%s] Retrieved %s chunks (pre-rerank)", tool_name, "/".join(str(len(c.docs)) for c in cands))
+            if not any(c.docs for c in cands):
+                return "No relevant chunks found after reranking."
+
+            prune_cfg = resolve_prune_settings(prune)
+            caps = {
+                src_name: int(cfg.get("rerank_cap", prune_cfg["per_source_cap"]))
+                for src_name, cfg in sources.items()
+                if cfg.get("rerank_cap", prune_cfg["per_source_cap"])
+            }
+            for qi, c in enumerate(cands):
+                tag = f"{tool_name}#{qi + 1}" if multi else tool_name
+                # 4.4) rerank 前候选裁剪
+                keep, report = prune_candidates(
+                    base_queries[qi],
+                    c.docs,
+                    c.distances,
+                    c.srcs,
+                    mode=prune_cfg["mode"],
+                    max_candidates=prune_cfg["max_candidates"],
+                    per_source_cap=caps,
+                    hybrid_alpha=prune_cfg["hybrid_alpha"],
+                )
+                est_before = get_reranker_client().estimate_ms(report.before)
+                est_after = get_reranker_client().estimate_ms(report.after)
+                if est_before is not None and est_after is not None:
+                    report.est_rerank_saved_ms = est_before - est_after
+                logger.info("[%s] %s", tag, report.summary())
+                c = c.take(keep)
+                trace.lap("prune")
+
+                # 4.5) 跨来源去重（完全重复 + MinHash 近似重复），只处理裁剪后的候选
+                if dedup_cfg["enabled"] and c.docs:
+                    keep, dedup_report, sigs = dedup_candidates(
+                        c.docs,
+                        c.distances,
+                        threshold=dedup_cfg["threshold"],
+                        num_perm=dedup_cfg["num_perm"],
+                        shingle_size=dedup_cfg["shingle_size"],
+                        bands=dedup_cfg["bands"],
+                    )
+                    logger.info("[%s] %s", tag, dedup_report.summary())
+                    c = c.take(keep)
+                    c.sigs = sigs
+                cands[qi] = c
+                trace.lap("dedup")
+            trace.count(chunks_reranked=sum(len(c.docs) for c in cands))
+
+            trace.skip()
+            logger.info("[%s] Reranking chunks...", tool_name)
+            if multi:
+                scored_lists = get_reranker_client().rerank_many_sync(base_queries, [c.docs for c in cands])
+            else:
+                scored_lists = [rerank_scores(base_queries[0], cands[0].docs)]
+            trace.lap("rerank")
+
+        # 5) citation
         # 这里默认复用每个 chunk 自己的 metadata；citation_builder 放在 cfg 中，
         # 但聚合后无法区分来源，因此约定：metadata 本身必须能让 citation_builder 工作
         # （例如 pdf_name/txt_name/docx_name 等字段在 md 里）。
@@ -317,22 +836,81 @@ def run_vector_rag(
         if len(citation_builders) == 1:
             citation_builder = list(citation_builders.values())[0]  # type: ignore[assignment]
 
-        logger.info("[%s] Reranking chunks...", tool_name)
-        outputs = rerank_chunks(
-            base_query=base_query,
-            docs=docs_all,
-            metas=metas_all,
-            citation_builder=citation_builder,
-            top_k=top_k,
-            score_threshold=score_threshold,
-        )
-        if not outputs:
+        # 6) 阈值 / MMR 选择 + 拼装
+        use_mmr = dedup_cfg["mmr"] and dedup_cfg["enabled"]
+        emitted = set()
+        chosen_groups: List[List[int]] = []
+        groups_out: List[List[str]] = []
+        for c, scored in zip(cands, scored_lists):
+            # 批量模式下先取完整排序，跳过前面分组已返回的 chunk 后再截 top_k
+            picked = select_ranked(
+                scored,
+                len(c.docs),
+                top_k=len(c.docs) if multi else top_k,
+                score_threshold=score_threshold,
+                distances=c.distances,
+                mmr_lambda=dedup_cfg["mmr_lambda"] if use_mmr and c.sigs is not None else None,
+                similarity=jaccard_matrix(c.sigs) if use_mmr and c.sigs is not None else None,
+            )
+            chosen: List[int] = []
+            for i in picked:
+                if c.docs[i] in emitted:
+                    continue
+                emitted.add(c.docs[i])
+                chosen.append(i)
+                if len(chosen) >= top_k:
+                    break
+            chosen_groups.append(chosen)
+        trace.lap("assemble")
+
+        # 7) 可选：查询相关的抽取式压缩（按工具 token 预算，批量模式下各查询平分）
+        texts_groups = [[c.docs[i] for i in chosen] for c, chosen in zip(cands, chosen_groups)]
+        compress_cfg = resolve_compress_settings(tool_name, compress)
+        if compress_cfg["enabled"]:
+            budget = max(1, compress_cfg["budget_tokens"] // len(cands))
+            tokens_before = tokens_after = 0
+            for qi, texts in enumerate(texts_groups):
+                if not texts:
+                    continue
+                texts_groups[qi], compress_report = compress_chunks(
+                    base_queries[qi],
+                    texts,
+                    budget,
+                    mode=compress_cfg["mode"],
+                    query_embedding=embeddings[qi],
+                    embed_fn=embed_query_texts,
+                )
+                tokens_before += compress_report.tokens_before
+                tokens_after += compress_report.tokens_after
+                logger.info("[%s] %s", tool_name, compress_report.summary())
+            trace.lap("compress")
+            trace.count(tokens_before_compress=tokens_before, tokens_returned=tokens_after)
+
+        for c, chosen, texts in zip(cands, chosen_groups, texts_groups):
+            groups_out.append([
+                f"{text}\n— **Source:** {citation_builder(c.metas[i] if c.metas else {})}"
+                for i, text in zip(chosen, texts)
+                if text
+            ])
+        trace.count(chunks_returned=sum(len(o) for o in groups_out))
+
+        if not any(groups_out):
             logger.warning("[%s] No chunks passed reranking threshold (or reranker unavailable)", tool_name)
             return "No relevant chunks found after reranking."
-        return "\n\n".join(outputs)
+        if not multi:
+            output = "\n\n".join(groups_out[0])
+            if cache_key is not None:
+                semantic_cache.store(cache_key, embeddings[0], output, query=query_list[0])
+            return output
+        sections = []
+        for qi, (q, outputs) in enumerate(zip(query_list, groups_out), 1):
+            body = "\n\n".join(outputs) if outputs else "No relevant chunks found after reranking."
+            sections.append(f"### Query {qi}: {q}\n\n{body}")
+        return "\n\n".join(sections)
 
     except Exception as e:
         msg = f"{tool_name}: {type(e).__name__}: {e}"
         logger.exception("[TOOL_ERROR] %s", msg)
         return f"⚠️ Tool execution failed: {msg}"
-
+    finally:
+        finish_trace(trace)
@@ -1,18 +1,14 @@
-from pathlib import Path
-import chromadb
-from typing import Optional
+from typing import List, Optional
 from dataclasses import dataclass
 from agents import function_tool, RunContextWrapper
 
 from rag_common import run_vector_rag
+from guideline_store import guideline_source_settings
 from config_manager import (
     external_client,
     ESMO_STORAGE,
     NCCN_STORAGE,
     HEMA_STORAGE,
-    ESMO_DB_STORAGE,
-    NCCN_DB_STORAGE,
-    HEMA_DB_STORAGE,
 )
 
 
@@ -28,22 +24,8 @@ class GuidelineRAGToolkit:
     It will automatically select relevant documents from ESMO/NCCN/HEMA and retrieve chunks.
     """
 
-    def __init__(
-        self,
-        esmo_storage: str | Path = ESMO_DB_STORAGE,
-        nccn_storage: str | Path = NCCN_DB_STORAGE,
-        hema_storage: str | Path = HEMA_DB_STORAGE,
-        timeout: float = 30.0,
-    ):
-        esmo_str = str(esmo_storage) if isinstance(esmo_storage, Path) else esmo_storage
-        nccn_str = str(nccn_storage) if isinstance(nccn_storage, Path) else nccn_storage
-        hema_str = str(hema_storage) if isinstance(hema_storage, Path) else hema_storage
-        self.esmo_client = chromadb.PersistentClient(path=esmo_str)
-        self.nccn_client = chromadb.PersistentClient(path=nccn_str)
-        self.hema_client = chromadb.PersistentClient(path=hema_str)
-        self.esmo_collection = self.esmo_client.get_or_create_collection(name="medical_collection")
-        self.nccn_collection = self.nccn_client.get_or_create_collection(name="medical_collection")
-        self.hema_collection = self.hema_client.get_or_create_collection(name="medical_collection")
+    def __init__(self, timeout: float = 30.0):
+        # 向量库由 guideline_source_settings() 按 [rag] guideline_mode 在每次调用时打开（已打开的库会被复用）
         self.timeout = timeout
 
     @staticmethod
@@ -51,8 +33,16 @@ class GuidelineRAGToolkit:
     def retrieve_medical_info(
         ctx: RunContextWrapper[MedicalContext],
         query: str = "",
+        queries: Optional[List[str]] = None,
     ) -> str:
-        toolkit = GuidelineRAGToolkit()
+        """
+        Retrieve guideline chunks from ESMO/NCCN/HEMA.
+        Args:
+            query: The clinical question to retrieve guideline evidence for.
+            queries: Optional list of several related questions answered in one call (results are grouped per question).
+        """
+        # separate 模式下是三个库；consolidated 模式下三者共享一个 collection，只查询一次
+        stores = guideline_source_settings()
 
         def build_citation(md: dict) -> str:
             citation = md.get("pdf_name", "Unknown")
@@ -76,7 +66,7 @@ class GuidelineRAGToolkit:
                 "label": "ESMO",
                 "storage_dir": ESMO_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": toolkit.esmo_collection,
+                **stores["ESMO"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -86,7 +76,7 @@ class GuidelineRAGToolkit:
                 "label": "NCCN",
                 "storage_dir": NCCN_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": toolkit.nccn_collection,
+                **stores["NCCN"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -96,7 +86,7 @@ class GuidelineRAGToolkit:
                 "label": "HEMA",
                 "storage_dir": HEMA_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": toolkit.hema_collection,
+                **stores["HEMA"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -108,6 +98,7 @@ class GuidelineRAGToolkit:
             tool_name="rag_guideline",
             patient_history=ctx.context.patient_history,
             query=query,
+            queries=queries,
             role_hint=ctx.context.role_hint,
             external_client=external_client,
             sources=sources,
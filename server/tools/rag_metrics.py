@@ -0,0 +1,245 @@
+"""
+RAG 调用的分阶段耗时与规模统计。
+
+每次 run_vector_rag / UICC 检索生成一个 RagTrace：
+  - stages: 各阶段耗时（ms），按执行顺序，如 list_files / select / embed / query / prune / dedup / rerank
+  - counts: 文件数、选中文件数、rerank 前后 chunk 数等
+  - cache:  各缓存的命中 / 未命中次数（目录索引、UICC 文档缓存等通过 note_cache 上报）
+trace 结束时：
+  - 汇总进进程内的 metrics_registry（按 tool / stage 的次数、均值、p50/p95、最大值），供 /api/metrics 导出
+  - 追加到当前工具调用的收集器（collect_traces），由编排层挂到对应 ToolCallInfo 上
+本模块只依赖标准库，工具脚本与服务端都可直接导入。
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar[Optional["RagTrace"]] = contextvars.ContextVar("rag_current_trace", default=None)
+_collector: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("rag_trace_collector", default=None)
+
+
+@dataclass
+class RagTrace:
+    tool: str
+    stages: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    cache: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    total_ms: float = 0.0
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+    _last: float = field(default=0.0, repr=False)
+    _token: Any = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        self._last = self._start
+
+    def lap(self, stage: str) -> float:
+        """记录从上一个 lap（或 trace 开始）到现在的耗时，计入 stage；同名阶段累加。"""
+        now = time.perf_counter()
+        ms = (now - self._last) * 1000
+        self._last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+        return ms
+
+    def skip(self) -> None:
+        """丢弃从上一个 lap 到现在的耗时（不计入任何阶段）。"""
+        self._last = time.perf_counter()
+
+    def count(self, **values: int) -> None:
+        for k, v in values.items():
+            self.counts[k] = int(v)
+
+    def note_cache(self, name: str, hit: bool) -> None:
+        slot = self.cache.setdefault(name, {"hits": 0, "misses": 0})
+        slot["hits" if hit else "misses"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tool": self.tool,
+            "total_ms": round(self.total_ms, 1),
+            "stages": {k: round(v, 1) for k, v in self.stages.items()},
+            "counts": dict(self.counts),
+            "cache": {k: dict(v) for k, v in self.cache.items()},
+        }
+
+    def summary(self) -> str:
+        stages = " ".join(f"{k}={v:.0f}ms" for k, v in self.stages.items())
+        counts = " ".join(f"{k}={v}" for k, v in self.counts.items())
+        cache = " ".join(f"{k}={v['hits']}/{v['hits'] + v['misses']}" for k, v in self.cache.items())
+        return f"total={self.total_ms:.0f}ms | {stages} | {counts}" + (f" | cache hits {cache}" if cache else "")
+
+
+class _Series:
+    """单个指标的计数 / 总和 / 最大值 + 最近 N 个样本（用于分位数）。"""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 2),
+            "p95": round(self.quantile(0.95), 2),
+            "max": round(self.max, 2),
+        }
+
+
+class MetricsRegistry:
+    """进程内聚合：按 tool 统计各阶段耗时、规模与缓存命中。"""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._stages: Dict[str, Dict[str, _Series]] = defaultdict(dict)
+        self._counts: Dict[str, Dict[str, _Series]] = defaultdict(dict)
+        self._cache: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
+        self._events: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def _series(self, table: Dict[str, Dict[str, _Series]], tool: str, name: str) -> _Series:
+        series = table[tool].get(name)
+        if series is None:
+            series = table[tool][name] = _Series(self.window)
+        return series
+
+    def record(self, trace: RagTrace) -> None:
+        with self._lock:
+            self._series(self._stages, trace.tool, "total").add(trace.total_ms)
+            for stage, ms in trace.stages.items():
+                self._series(self._stages, trace.tool, stage).add(ms)
+            for name, value in trace.counts.items():
+                self._series(self._counts, trace.tool, name).add(value)
+            for name, hm in trace.cache.items():
+                slot = self._cache[trace.tool].setdefault(name, {"hits": 0, "misses": 0})
+                slot["hits"] += hm.get("hits", 0)
+                slot["misses"] += hm.get("misses", 0)
+
+    def observe(self, tool: str, name: str, value: float) -> None:
+        """单个数值样本（如 embedding 微批的实际批大小），计入 counts。"""
+        with self._lock:
+            self._series(self._counts, tool, name).add(value)
+
+    def record_event(self, tool: str, name: str, n: int = 1) -> None:
+        """离散事件计数（如自适应检索停在哪个深度）。"""
+        with self._lock:
+            self._events[tool][name] = self._events[tool].get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            tools = set(self._stages) | set(self._counts) | set(self._cache) | set(self._events)
+            return {
+                tool: {
+                    "stages_ms": {k: s.to_dict() for k, s in self._stages.get(tool, {}).items()},
+                    "counts": {k: s.to_dict() for k, s in self._counts.get(tool, {}).items()},
+                    "cache": {k: dict(v) for k, v in self._cache.get(tool, {}).items()},
+                    "events": dict(self._events.get(tool, {})),
+                }
+                for tool in sorted(tools)
+            }
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式（summary 风格：分位数 + _count / _sum）。"""
+        lines = [
+            "# TYPE rag_stage_ms summary",
+        ]
+        with self._lock:
+            for tool, table in sorted(self._stages.items()):
+                for stage, s in table.items():
+                    labels = f'tool="{tool}",stage="{stage}"'
+                    for q in (0.5, 0.95):
+                        lines.append(f'rag_stage_ms{{{labels},quantile="{q}"}} {s.quantile(q):.3f}')
+                    lines.append(f"rag_stage_ms_count{{{labels}}} {s.count}")
+                    lines.append(f"rag_stage_ms_sum{{{labels}}} {s.total:.3f}")
+            lines.append("# TYPE rag_items summary")
+            for tool, table in sorted(self._counts.items()):
+                for name, s in table.items():
+                    labels = f'tool="{tool}",name="{name}"'
+                    lines.append(f'rag_items{{{labels},quantile="0.5"}} {s.quantile(0.5):.0f}')
+                    lines.append(f"rag_items_count{{{labels}}} {s.count}")
+                    lines.append(f"rag_items_sum{{{labels}}} {s.total:.0f}")
+            lines.append("# TYPE rag_cache_total counter")
+            for tool, table in sorted(self._cache.items()):
+                for name, hm in table.items():
+                    for kind in ("hits", "misses"):
+                        lines.append(f'rag_cache_total{{tool="{tool}",cache="{name}",result="{kind}"}} {hm[kind]}')
+            lines.append("# TYPE rag_events_total counter")
+            for tool, table in sorted(self._events.items()):
+                for name, n in table.items():
+                    lines.append(f'rag_events_total{{tool="{tool}",event="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counts.clear()
+            self._cache.clear()
+            self._events.clear()
+
+
+metrics_registry = MetricsRegistry()
+
+
+def start_trace(tool: str) -> RagTrace:
+    """开始一次 RAG trace，并设为当前 trace（note_cache 会写入它）。"""
+    trace = RagTrace(tool)
+    trace._token = _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: RagTrace) -> None:
+    """结束 trace：汇总进 registry、追加到当前工具调用的收集器并打日志。"""
+    trace.total_ms = (time.perf_counter() - trace._start) * 1000
+    if trace._token is not None:
+        try:
+            _current_trace.reset(trace._token)
+        except ValueError:  # 在另一个 context 中结束
+            _current_trace.set(None)
+        trace._token = None
+    metrics_registry.record(trace)
+    traces = _collector.get()
+    if traces is not None:
+        traces.append(trace.to_dict())
+    logger.info("[%s] timings: %s", trace.tool, trace.summary())
+
+
+def current_trace() -> Optional[RagTrace]:
+    return _current_trace.get()
+
+
+def note_cache(name: str, hit: bool) -> None:
+    """缓存命中上报；不在 trace 中时忽略。"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.note_cache(name, hit)
+
+
+@contextmanager
+def collect_traces() -> Iterator[List[dict]]:
+    """在 with 块内结束的 trace 都会追加到返回的列表（asyncio.to_thread 会复制 context，线程内同样生效）。"""
+    traces: List[dict] = []
+    token = _collector.set(traces)
+    try:
+        yield traces
+    finally:
+        _collector.reset(token)
@@ -1,10 +1,11 @@
 from pathlib import Path
-import chromadb
 from openai import OpenAI
 from typing import List, Optional
 from agents import function_tool, RunContextWrapper
 from dataclasses import dataclass
 from rag_common import run_vector_rag
+from doc_index import get_doc_index
+from vector_store import open_collection
 
 # 导入统一的配置管理器
 from config_manager import (
@@ -26,18 +27,18 @@ COLLECTION_NAME = "patho_collection"
 class PathologyRAGToolkit:
     """
     RAG toolkit that queries a pre-embedded pathology document database using
-    LLM to select relevant documents, retrieves all chunks for those documents,
-    and returns them with citations.
+    LLM to select relevant documents, fetches all chunks of those documents by id
+    (doc_index), scores them against the query and returns them with citations.
     """
     def __init__(
         self,
         storage_path: str | Path = STORAGE_PATH,
         collection_name: str = COLLECTION_NAME,
     ):
-        # 确保 storage_path 是字符串（ChromaDB 需要字符串路径）
-        storage_path_str = str(storage_path) if isinstance(storage_path, Path) else storage_path
-        self.client = chromadb.PersistentClient(path=storage_path_str)
-        self.collection = self.client.get_or_create_collection(name=collection_name)
+        # 按 [rag] vector_backend 选择 Chroma / memmap 后端（已打开的库会被复用）
+        self.collection = open_collection(Path(storage_path), collection_name)
+        # docx_name → chunk id 索引：选中文档的 chunk 直接按 id 取回，不走 ANN
+        self.doc_index = get_doc_index(Path(storage_path), collection_name, "docx_name")
 
     @staticmethod
     @function_tool(name_override="rag_pathology")
@@ -45,8 +46,11 @@ class PathologyRAGToolkit:
         ctx: RunContextWrapper[MedicalContext],
         query: str = "",
         top_k: int = 5,
+        queries: Optional[List[str]] = None,
     ) -> str:
-        return PathologyRAGToolkit._retrieve_pathology_impl(ctx, query=query, top_k=top_k, tool_name="rag_pathology")
+        return PathologyRAGToolkit._retrieve_pathology_impl(
+            ctx, query=query, top_k=top_k, tool_name="rag_pathology", queries=queries
+        )
 
     @staticmethod
     def _retrieve_pathology_impl(
@@ -55,6 +59,8 @@ class PathologyRAGToolkit:
         query: str,
         top_k: int,
         tool_name: str,
+        queries: Optional[List[str]] = None,
+        prefetch: bool = False,
     ) -> str:
         toolkit = PathologyRAGToolkit()
 
@@ -71,10 +77,10 @@ class PathologyRAGToolkit:
                 "storage_dir": PATHO_DIR,
                 "suffixes": [".docx"],
                 "collection": toolkit.collection,
+                "doc_index": toolkit.doc_index,
                 "where_key": "docx_name",
                 "id_transform": _docx_id,
                 "citation_builder": build_citation,
-                "n_results": 1000,
             }
         }
 
@@ -82,13 +88,14 @@ class PathologyRAGToolkit:
             tool_name=tool_name,
             patient_history=ctx.context.patient_history,
             query=query,
+            queries=queries,
             role_hint=ctx.context.role_hint,
             external_client=external_client,
             sources=sources,
             role_templates=None,
-            n_results=1000,
             top_k=top_k,
             score_threshold=0.0,
+            prefetch=prefetch,
         )
 
     def get_tools(self) -> List[callable]:
@@ -0,0 +1,143 @@
+"""
+患者级检索预取。
+
+每次 RAG 工具调用都从患者病史出发，但检索要等 agent 在生成过程中决定调用工具才开始。
+编排层在拿到 master task 后即可在后台为该患者跑一遍患者级检索（选文件 + embedding + 检索 + rerank），
+与第 0 阶段 agent 的生成并行：
+  - 选出的文件集合（连同患者级查询向量）按 (tool, 患者, 可选文件集合) 登记在 selection_store；
+    之后同一患者的工具调用在查询为空或与患者病史足够接近（余弦相似度 ≥ reuse_similarity）时复用，
+    跳过 LLM 选文件；预取仍在进行时等待它完成（最多 wait_timeout 秒）。具体问题（如第二原发肿瘤）
+    与病史差距大，照常按查询选文件
+  - 患者级检索的输出写入 semantic_cache（启用时），只有与病史语义接近的查询才会命中。
+    semantic_cache 默认关闭，此时预取只省下 LLM 选文件这一步，检索与 rerank 仍在工具调用时执行
+向量检索工具（rag_guideline / rag_pathology / rag_tool_who）经 run_vector_rag 使用这里的登记；rag_staging_uicc
+不做 embedding 检索，只登记并复用 LLM 选出的分期文档（其章节解析缓存也随预取加载）。
+当前运行的患者上下文通过 contextvar 传给不接收 RunContextWrapper 的工具包装函数。
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config_manager import config_manager
+from rag_metrics import note_cache
+
+logger = logging.getLogger(__name__)
+
+_patient_context: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("rag_patient_context", default=None)
+
+
+def set_patient_context(patient_history: Optional[str]) -> contextvars.Token:
+    """设置当前运行（asyncio task / 线程 context）的患者病史。"""
+    return _patient_context.set(patient_history or None)
+
+
+def current_patient_context() -> Optional[str]:
+    return _patient_context.get()
+
+
+def resolve_prefetch_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.prefetch] 与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("rag").get("prefetch", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "enabled": bool(cfg.get("enabled", False)),
+        "reuse_selection": bool(cfg.get("reuse_selection", True)),
+        "wait_timeout": float(cfg.get("wait_timeout", 30.0)),
+        "reuse_similarity": float(cfg.get("reuse_similarity", 0.85)),
+        "ttl": float(cfg.get("ttl", 1800)),
+    }
+
+
+class SelectionStore:
+    """预取得到的文件选择；每个键对应一个 Future，工具调用可等待进行中的预取。"""
+
+    def __init__(self, ttl: float = 1800.0, max_keys: int = 256):
+        self.ttl = float(ttl)
+        self.max_keys = int(max_keys)
+        self._data: Dict[Hashable, "tuple[float, Future]"] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: Hashable) -> Optional[Future]:
+        """登记一次预取；已有未过期的登记时返回 None（由已有的预取负责）。"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._data.get(key)
+            if current is not None and now - current[0] < self.ttl and not (
+                current[1].done() and current[1].exception() is not None
+            ):
+                return None
+            fut: Future = Future()
+            self._data[key] = (now, fut)
+            if len(self._data) > self.max_keys:
+                oldest = min(self._data, key=lambda k: self._data[k][0])
+                self._data.pop(oldest, None)
+            return fut
+
+    def get(self, key: Hashable, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """返回 {"chosen": {source: [文件]}, "embedding": 患者级查询向量}；没有或未完成时返回 None。"""
+        with self._lock:
+            current = self._data.get(key)
+        if current is None or time.monotonic() - current[0] >= self.ttl:
+            return None
+        try:
+            return current[1].result(timeout=wait)
+        except FutureTimeout:
+            logger.info("[PREFETCH] selection still running after %.1fs, selecting inline", wait)
+            return None
+        except Exception:
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+selection_store = SelectionStore(ttl=resolve_prefetch_settings()["ttl"])
+
+
+def min_cosine(embeddings: Sequence[Sequence[float]], reference: Optional[Sequence[float]]) -> float:
+    """各查询向量与参考向量的最小余弦相似度；没有参考向量时为 -1。"""
+    if reference is None or not len(embeddings):
+        return -1.0
+    ref = np.asarray(reference, dtype=np.float32)
+    q = np.asarray(embeddings, dtype=np.float32)
+    denom = np.linalg.norm(q, axis=1) * float(np.linalg.norm(ref))
+    sims = (q @ ref) / np.where(denom > 0, denom, 1.0)
+    return float(sims.min())
+
+
+def lookup_selection(
+    tool_name: str,
+    key: Hashable,
+    *,
+    prefetch: bool,
+    query_embeddings: Optional[Callable[[], Sequence[Sequence[float]]]] = None,
+) -> Tuple[Optional[Future], Optional[Dict[str, Any]]]:
+    """
+    返回 (future, prefetched)。
+    prefetch=True 时登记一次预取，future 由调用方在选完文件后 set_result / set_exception；
+    已有登记（或普通调用且启用了复用）时等待并返回已登记的选择。
+    query_embeddings 为 None 表示空查询（总是复用）；否则按需计算查询向量，与患者级向量的
+    余弦相似度低于 reuse_similarity 时不复用。
+    """
+    cfg = resolve_prefetch_settings()
+    future = selection_store.begin(key) if prefetch else None
+    if future is not None or not (prefetch or (cfg["enabled"] and cfg["reuse_selection"])):
+        return future, None
+    prefetched = selection_store.get(key, wait=cfg["wait_timeout"])
+    if prefetched is not None and query_embeddings is not None:
+        sim = min_cosine(query_embeddings(), prefetched.get("embedding"))
+        if sim < cfg["reuse_similarity"]:
+            logger.info(
+                "[%s] Query too far from the prefetched patient selection (cos=%.3f < %.2f), selecting inline",
+                tool_name, sim, cfg["reuse_similarity"],
+            )
+            prefetched = None
+    note_cache("prefetch_selection", prefetched is not None)
+    return None, prefetched
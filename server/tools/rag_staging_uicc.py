@@ -1,16 +1,20 @@
-import os
 import re
 from pathlib import Path
 from openai import OpenAI
 from typing import List
 from agents import function_tool, RunContextWrapper
 from dataclasses import dataclass
-from difflib import get_close_matches
 import logging
 
 logger = logging.getLogger(__name__)
 
-from rag_common import validate_paths
+from fuzzy_match import get_fuzzy_index
+from storage_catalog import storage_catalog
+from uicc_index import select_uicc_sections
+from rag_common import embed_query_texts
+from rag_metrics import finish_trace, start_trace
+from rag_prefetch import lookup_selection
+from semantic_cache import fingerprint
 
 # 导入统一的配置管理器
 from config_manager import (
@@ -29,7 +33,7 @@ class MedicalContext:
 class UICCRAGToolkit:
     """
     Embedding‑free toolkit: uses the LLM to select which TXT files
-    to return, then reads each file verbatim.
+    to return, then returns their most relevant sections within a token budget.
     """
 
     @staticmethod
@@ -45,7 +49,13 @@ class UICCRAGToolkit:
     def _retrieve_uicc_impl(
             ctx: RunContextWrapper[MedicalContext],
             query: str = "",
+            prefetch: bool = False,
     ) -> str:
+        """
+        prefetch=True 表示编排层发起的患者级预取：LLM 选出的分期文档登记到 rag_prefetch.selection_store，
+        之后同一患者的调用在查询为空或与病史足够接近时复用，跳过 LLM 选文档（规则同 run_vector_rag）。
+        """
+        trace = start_trace("rag_staging_uicc")
         try:
             logger.info("[RAG_STAGING_UICC] Starting retrieve_staging_uicc")
             base_query = query.strip() or ctx.context.patient_history
@@ -54,62 +64,103 @@ class UICCRAGToolkit:
                 return "No query provided."
 
             uicc_dir = UICC_DIR
-            if validate_paths({"UICC_DIR": Path(uicc_dir)}):
+            if not storage_catalog.exists(Path(uicc_dir)):
                 return f"UICC directory not found: {uicc_dir}"
 
-            files = [fn for fn in os.listdir(uicc_dir) if fn.lower().endswith(".txt")]
-            doc_names = [os.path.splitext(fn)[0] for fn in files]
+            doc_names = storage_catalog.doc_ids(Path(uicc_dir), [".txt"])
             if not doc_names:
                 return "No source files found."
+            trace.lap("list_files")
+            trace.count(files_available=len(doc_names))
 
-            clinical_summary = ctx.context.patient_history
-            if query.strip():
-                clinical_summary = (
-                    f"Patient History:\n{ctx.context.patient_history}\n\n"
-                    f"Query:\n{query.strip()}"
-                )
-
-            options = "\n".join(f"- {n}" for n in doc_names)
-            prompt = (
-                f"Given the clinical summary:\n\"\"\"\n{clinical_summary}\n\"\"\"\n\n"
-                f"Select all relevant staging documents from the list below. If no documents are relevant, return an empty list.\n"
-                f"Output only a comma‑separated list of filenames (without .txt):\n\n"
-                f"{options}"
-            )
-
-            resp = external_client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[{"role": "system", "content": prompt}],
-            )
-            reply = resp.choices[0].message.content or ""
+            query_embedding: List[List[float]] = []
 
-            raw_choices = [part.strip() for part in re.split(r"[,\n]", reply) if part.strip()]
-            valid: List[str] = []
-            for choice in raw_choices:
-                match = get_close_matches(choice, doc_names, n=1, cutoff=0.8)
-                if match and match[0] not in valid:
-                    valid.append(match[0])
+            def _query_embeddings() -> List[List[float]]:
+                if not query_embedding:
+                    query_embedding.extend(embed_query_texts([base_query]))
+                    trace.lap("embed")
+                return query_embedding
 
+            selection_key = (
+                "rag_staging_uicc",
+                fingerprint(ctx.context.patient_history),
+                fingerprint(doc_names),
+            )
+            selection_future, prefetched = lookup_selection(
+                "rag_staging_uicc",
+                selection_key,
+                prefetch=prefetch,
+                query_embeddings=_query_embeddings if query.strip() else None,
+            )
+            if prefetched is not None:
+                valid = list(prefetched["chosen"])
+                logger.info("[RAG_STAGING_UICC] Reusing prefetched selection: %s", valid)
+            else:
+                try:
+                    valid = UICCRAGToolkit._select_documents(ctx.context.patient_history, query, doc_names)
+                    if selection_future is not None:
+                        _query_embeddings()
+                except Exception as e:
+                    if selection_future is not None:
+                        selection_future.set_exception(e)
+                    raise
+                if selection_future is not None:
+                    selection_future.set_result({"chosen": valid, "embedding": query_embedding[0]})
+
+            trace.lap("select")
+            trace.count(files_selected=len(valid))
             if not valid:
                 logger.warning("[RAG_STAGING_UICC] No suitable staging documents found")
                 return "No suitable staging documents found for the provided query or patient history."
 
-            logger.info("[RAG_STAGING_UICC] Reading %d staging documents...", len(valid))
-            outputs: List[str] = []
-            for name in valid:
-                path = Path(uicc_dir) / f"{name}.txt"
-                try:
-                    full_text = path.read_text(encoding="utf-8").strip()
-                    outputs.append(f"=== {name}.txt ===\n{full_text}")
-                except FileNotFoundError:
-                    logger.warning("[RAG_STAGING_UICC] File not found: %s", path)
-                    continue
-
-            return "\n\n".join(outputs) if outputs else "No passages retrieved."
+            logger.info("[RAG_STAGING_UICC] Selecting sections from %d staging documents...", len(valid))
+            selection = select_uicc_sections(Path(uicc_dir), base_query, valid)
+            trace.lap("sections")
+            trace.count(
+                sections_total=selection.total_sections,
+                sections_returned=len(selection.sections),
+                tokens_returned=selection.returned_tokens,
+                tokens_trimmed=selection.trimmed_tokens,
+            )
+            logger.info(
+                "[RAG_STAGING_UICC] %d/%d sections, ~%d tokens returned, ~%d tokens trimmed",
+                len(selection.sections), selection.total_sections,
+                selection.returned_tokens, selection.trimmed_tokens,
+            )
+            return selection.render() if selection.sections else "No passages retrieved."
         except Exception as e:
             msg = f"rag_staging_uicc: {type(e).__name__}: {e}"
             logger.exception("[TOOL_ERROR] %s", msg)
             return f"⚠️ Tool execution failed: {msg}"
+        finally:
+            finish_trace(trace)
+
+    @staticmethod
+    def _select_documents(patient_history: str, query: str, doc_names: List[str]) -> List[str]:
+        """LLM 从分期文档列表中选出相关文档，模糊匹配回真实文件名。"""
+        clinical_summary = patient_history
+        if query.strip():
+            clinical_summary = (
+                f"Patient History:\n{patient_history}\n\n"
+                f"Query:\n{query.strip()}"
+            )
+
+        options = "\n".join(f"- {n}" for n in doc_names)
+        prompt = (
+            f"Given the clinical summary:\n\"\"\"\n{clinical_summary}\n\"\"\"\n\n"
+            f"Select all relevant staging documents from the list below. If no documents are relevant, return an empty list.\n"
+            f"Output only a comma‑separated list of filenames (without .txt):\n\n"
+            f"{options}"
+        )
+
+        resp = external_client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[{"role": "system", "content": prompt}],
+        )
+        reply = resp.choices[0].message.content or ""
+
+        raw_choices = [part.strip() for part in re.split(r"[,\n]", reply) if part.strip()]
+        return get_fuzzy_index(doc_names).match_all(raw_choices, cutoff=0.8)
 
     def get_tools(self) -> List[callable]:
         return [self.retrieve_staging_uicc]
\ No newline at end of file
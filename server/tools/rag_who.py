@@ -1,10 +1,10 @@
 from pathlib import Path
-import chromadb
 from openai import OpenAI
 from typing import List, Optional
 from agents import function_tool, RunContextWrapper
 from dataclasses import dataclass
 from rag_common import run_vector_rag
+from vector_store import open_collection
 
 # 导入统一的配置管理器
 from config_manager import (
@@ -33,10 +33,8 @@ class MedicalRAGToolkitWHO:
         who_storage: str | Path = WHO_DB_STORAGE,
         timeout: float = 30.0,
     ):
-        # 确保路径是字符串（ChromaDB 需要字符串路径）
-        who_str = str(who_storage) if isinstance(who_storage, Path) else who_storage
-        self.who_client = chromadb.PersistentClient(path=who_str)
-        self.who_collection = self.who_client.get_or_create_collection(name="medical_collection")
+        # 按 [rag] vector_backend 选择 Chroma / memmap 后端（已打开的库会被复用）
+        self.who_collection = open_collection(Path(who_storage), "medical_collection")
         self.timeout = timeout
 
     @staticmethod
@@ -44,13 +42,25 @@ class MedicalRAGToolkitWHO:
     def retrieve_medical_info(
         ctx: RunContextWrapper[MedicalContext],
         query: str = "",
+        queries: Optional[List[str]] = None,
     ) -> str:
         """
         Retrieve medical guideline chunks from the WHO database.
         Args:
             query: The query to retrieve information from medical guidelines, should contain Disease stage and histologic subtype, Disease location, Molecular markers and genetic alterations (if applicable).
             e.g. Treatment for Stage III diffuse large B-cell lymphoma, abdominal nodes, MYC/BCL2 double-expressor
+            queries: Optional list of several such queries answered in one call (results are grouped per query).
         """
+        return MedicalRAGToolkitWHO._retrieve_who_impl(ctx, query=query, queries=queries)
+
+    @staticmethod
+    def _retrieve_who_impl(
+        ctx: RunContextWrapper[MedicalContext],
+        *,
+        query: str,
+        queries: Optional[List[str]] = None,
+        prefetch: bool = False,
+    ) -> str:
         toolkit = MedicalRAGToolkitWHO()
 
         def build_citation(md: dict) -> str:
@@ -81,6 +91,7 @@ class MedicalRAGToolkitWHO:
             tool_name="rag_tool_who",
             patient_history=ctx.context.patient_history,
             query=query,
+            queries=queries,
             role_hint=ctx.context.role_hint,
             external_client=external_client,
             sources=sources,
@@ -88,6 +99,7 @@ class MedicalRAGToolkitWHO:
             n_results=20,
             top_k=5,
             score_threshold=0.6,
+            prefetch=prefetch,
         )
 
     def get_tools(self) -> List[callable]:
@@ -0,0 +1,291 @@
+"""
+Reranker 客户端：持久连接池 + 可配置超时 + 抖动退避重试 + 熔断 + 大列表并发分批。
+
+配置读取 config.toml 的 [reranker] 段（均为可选）：
+  timeout / connect_timeout          单次请求超时（秒）
+  max_retries / backoff_base / backoff_max   重试次数与指数退避（full jitter）
+  max_batch_size / max_concurrency   文档分批大小与并发子批数
+  max_connections                    连接池上限
+  breaker_failure_threshold / breaker_reset_seconds   熔断阈值与冷却时间
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import httpx
+
+from async_runtime import run_async, run_sync
+from config_manager import config_manager, RERANKER_MODEL, RERANKER_URL
+
+logger = logging.getLogger(__name__)
+
+# 这些状态码视为 reranker 暂时不可用，可以重试
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RerankerUnavailable(Exception):
+    """Reranker 调用失败（重试耗尽 / 熔断打开 / 未配置）。"""
+
+
+class CircuitBreaker:
+    """
+    简单的三态熔断器：closed → open（连续失败达到阈值）→ half-open（冷却后放行一次探测）。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否允许发起请求；half-open 状态只放行一个探测请求。"""
+        with self._lock:
+            state = self._state_locked()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """探测请求被取消（既非成功也非失败）时归还探测名额。"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class RerankerClient:
+    """
+    /v1/rerank 的异步客户端。连接池绑定在 async_runtime 的后台 loop 上，
+    同步调用方使用 rerank_sync()，异步调用方使用 rerank_async()。
+    """
+
+    def __init__(
+        self,
+        url: Optional[str],
+        model: str,
+        api_key: Optional[str] = None,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 4.0,
+        max_batch_size: int = 64,
+        max_concurrency: int = 4,
+        max_connections: int = 16,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        # 每个文档的平均 rerank 耗时（EMA），用于估算裁剪带来的节省
+        self.ms_per_doc: Optional[float] = None
+
+    @classmethod
+    def from_config(cls) -> "RerankerClient":
+        cfg = config_manager.reranker_config
+        # reranker 的鉴权应优先读取 reranker_config；兼容旧逻辑才 fallback 到 embedding_config
+        api_key = cfg.get("api_key")
+        if not api_key:
+            api_key = config_manager.embedding_config.get("api_key")
+        return cls(
+            url=RERANKER_URL,
+            model=RERANKER_MODEL,
+            api_key=api_key,
+            timeout=float(cfg.get("timeout", 30)),
+            connect_timeout=float(cfg.get("connect_timeout", 5)),
+            max_retries=int(cfg.get("max_retries", 2)),
+            backoff_base=float(cfg.get("backoff_base", 0.5)),
+            backoff_max=float(cfg.get("backoff_max", 4.0)),
+            max_batch_size=int(cfg.get("max_batch_size", 64)),
+            max_concurrency=int(cfg.get("max_concurrency", 4)),
+            max_connections=int(cfg.get("max_connections", 16)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(cfg.get("breaker_failure_threshold", 5)),
+                reset_seconds=float(cfg.get("breaker_reset_seconds", 30)),
+            ),
+        )
+
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"bearer {self.api_key}"
+        return headers
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 只会在后台 loop 内调用，无需加锁
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, headers=self._headers())
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _post_batch(self, query: str, docs: Sequence[str]) -> List[dict]:
+        client = self._get_client()
+        payload = {"model": self.model, "query": query, "documents": list(docs)}
+        last_exc: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = await client.post(self.url, json=payload)
+                if resp.status_code in RETRYABLE_STATUS:
+                    raise httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=resp.request, response=resp)
+                resp.raise_for_status()
+                body = resp.json()
+                results = body.get("results", []) if isinstance(body, dict) else None
+                if not isinstance(results, list):
+                    raise RerankerUnavailable(f"malformed reranker response: {str(body)[:200]}")
+                return results
+            except httpx.HTTPStatusError as exc:
+                last_exc = exc
+                if exc.response.status_code not in RETRYABLE_STATUS:
+                    break
+            except (httpx.TransportError, ValueError) as exc:
+                last_exc = exc
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                logger.warning("Reranker attempt %d failed (%s), retrying in %.2fs", attempt + 1, last_exc, delay)
+                await asyncio.sleep(delay)
+        raise RerankerUnavailable(f"reranker request failed: {last_exc}")
+
+    async def _rerank(self, query: str, docs: Sequence[str]) -> List[Tuple[int, float]]:
+        if not self.url:
+            raise RerankerUnavailable("reranker url not configured")
+        if not self.breaker.allow():
+            raise RerankerUnavailable(f"circuit breaker {self.breaker.state}")
+
+        batches = [(i, docs[i:i + self.max_batch_size]) for i in range(0, len(docs), self.max_batch_size)]
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def _run(offset: int, batch: Sequence[str]) -> List[Tuple[int, float]]:
+            async with sem:
+                results = await self._post_batch(query, batch)
+            out: List[Tuple[int, float]] = []
+            for item in results:
+                if not isinstance(item, dict):
+                    continue
+                idx = item.get("index")
+                if idx is None or idx >= len(batch):
+                    continue
+                out.append((offset + idx, float(item.get("relevance_score") or 0)))
+            return out
+
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(_run(off, b)) for off, b in batches]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except RerankerUnavailable:
+            self.breaker.record_failure()
+            raise
+        except Exception as exc:
+            # 任何其他异常也计为失败，否则 half-open 的探测名额永远不会归还
+            self.breaker.record_failure()
+            raise RerankerUnavailable(f"reranker request failed: {exc!r}") from exc
+        finally:
+            # 一个子批失败后不再等待其余子批
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        self.breaker.record_success()
+        elapsed = time.perf_counter() - start
+        if docs:
+            sample = elapsed * 1000 / len(docs)
+            self.ms_per_doc = sample if self.ms_per_doc is None else 0.8 * self.ms_per_doc + 0.2 * sample
+        scored = [pair for part in parts for pair in part]
+        scored.sort(key=lambda x: x[1], reverse=True)
+        logger.info("Reranked %d docs in %d sub-batches | elapsed=%.2fs", len(docs), len(batches), elapsed)
+        return scored
+
+    def estimate_ms(self, n_docs: int) -> Optional[float]:
+        """按历史平均估算 rerank n_docs 个文档的耗时；尚无样本时返回 None。"""
+        if self.ms_per_doc is None:
+            return None
+        return self.ms_per_doc * n_docs
+
+    def rerank_sync(self, query: str, docs: Sequence[str]) -> List[Tuple[int, float]]:
+        """返回按分数降序排列的 (原始下标, relevance_score)。失败时抛出 RerankerUnavailable。"""
+        return run_sync(self._rerank(query, docs))
+
+    async def rerank_async(self, query: str, docs: Sequence[str]) -> List[Tuple[int, float]]:
+        return await run_async(self._rerank(query, docs))
+
+    async def _rerank_many(
+        self, queries: Sequence[str], docs_lists: Sequence[Sequence[str]]
+    ) -> List[Optional[List[Tuple[int, float]]]]:
+        results = await asyncio.gather(
+            *(self._rerank(q, d) if d else asyncio.sleep(0, result=[]) for q, d in zip(queries, docs_lists)),
+            return_exceptions=True,
+        )
+        out: List[Optional[List[Tuple[int, float]]]] = []
+        for q, res in zip(queries, results):
+            if isinstance(res, RerankerUnavailable):
+                logger.warning("[RERANKER] unavailable for query %.60r: %s", q, res)
+                out.append(None)
+            elif isinstance(res, BaseException):
+                raise res
+            else:
+                out.append(res)
+        return out
+
+    def rerank_many_sync(
+        self, queries: Sequence[str], docs_lists: Sequence[Sequence[str]]
+    ) -> List[Optional[List[Tuple[int, float]]]]:
+        """并发 rerank 多个 (query, docs)；某个 query 失败时对应位置为 None。"""
+        return run_sync(self._rerank_many(queries, docs_lists))
+
+
+_default_client: Optional[RerankerClient] = None
+_default_lock = threading.Lock()
+
+
+def get_reranker_client() -> RerankerClient:
+    """进程内共享的 reranker 客户端（懒加载）。"""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = RerankerClient.from_config()
+    return _default_client
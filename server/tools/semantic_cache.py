@@ -0,0 +1,127 @@
+"""
+会话级语义检索缓存。
+
+同一次 MDT 讨论里，血液科 / 病理科 / 监督 agent 经常针对同一个患者提出措辞不同、含义相同的指南查询，
+每次都会完整跑一遍 选文件 → embedding → query → rerank。这里缓存最近的查询向量及其最终输出：
+  - 键：tool + 患者上下文（病史哈希）+ 可选文件集合 + 影响输出的全部设置（角色、top_k / 阈值、裁剪 / 去重 / 压缩等）
+  - 新查询与同键下某条缓存的余弦相似度 ≥ threshold 时直接返回该输出
+  - 条目在 ttl 秒后过期（近似“会话”范围），每个键最多保留最近的 max_entries 条，键按最近使用淘汰
+命中 / 未命中通过 rag_metrics.note_cache("semantic", ...) 计入当前 trace，
+/api/metrics 中按 tool 给出命中率；stats() 给出进程内合计。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config_manager import config_manager
+
+
+def fingerprint(*parts: Any) -> str:
+    """把若干可 repr 的部分压成短哈希（患者病史、文件列表等）。"""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(repr(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray  # L2 归一化
+    output: str
+    created: float
+    query: str
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 1800.0, max_entries: int = 64, max_keys: int = 256):
+        self.threshold = float(threshold)
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self.max_keys = int(max_keys)
+        self._data: "OrderedDict[Hashable, List[_Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vec: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n > 0 else v
+
+    def lookup(
+        self, key: Hashable, embedding: Sequence[float], threshold: Optional[float] = None
+    ) -> Optional[Tuple[str, float, str]]:
+        """返回 (输出, 相似度, 命中的原查询)；未命中返回 None。threshold 缺省用实例阈值。"""
+        q = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._data.get(key)
+            if entries:
+                entries[:] = [e for e in entries if now - e.created < self.ttl]
+            if not entries:
+                self._data.pop(key, None)
+                self.misses += 1
+                return None
+            sims = np.stack([e.vector for e in entries]) @ q
+            best = int(np.argmax(sims))
+            if float(sims[best]) < (self.threshold if threshold is None else threshold):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            hit = entries[best]
+            return hit.output, float(sims[best]), hit.query
+
+    def store(self, key: Hashable, embedding: Sequence[float], output: str, query: str = "") -> None:
+        entry = _Entry(self._normalize(embedding), output, time.monotonic(), query)
+        with self._lock:
+            entries = self._data.setdefault(key, [])
+            entries.append(entry)
+            del entries[:-self.max_entries]
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_keys:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "keys": len(self._data),
+                "entries": sum(len(v) for v in self._data.values()),
+            }
+
+
+def resolve_semantic_cache_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [rag.semantic_cache] 与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("rag").get("semantic_cache", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "enabled": bool(cfg.get("enabled", False)),
+        "threshold": float(cfg.get("threshold", 0.95)),
+        "ttl": float(cfg.get("ttl", 1800)),
+        "max_entries": int(cfg.get("max_entries", 64)),
+    }
+
+
+_defaults = resolve_semantic_cache_settings()
+semantic_cache = SemanticCache(
+    threshold=_defaults["threshold"],
+    ttl=_defaults["ttl"],
+    max_entries=_defaults["max_entries"],
+)
@@ -0,0 +1,131 @@
+"""
+存储目录索引：目录 mtime 变化时重新扫描，此外每隔 rescan_interval 秒也重新扫描一次。
+
+ESMO/NCCN/HEMA/WHO/UICC/patho 目录可能挂在网络盘上，每次工具调用都 os.listdir
+会带来几十毫秒的额外开销；这里缓存 filename / suffix / size / mtime / doc_id，
+并用 check_interval 进一步限制 stat 的频率。
+原地编辑文件不会改变目录 mtime，定期重新扫描保证缓存的 size / mtime 最多滞后 rescan_interval 秒
+（uicc_index 依据它们决定是否重新读取文件）。
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from config_manager import config_manager
+
+try:
+    from rag_metrics import note_cache
+except ImportError:  # 目录索引不依赖 trace 统计
+    def note_cache(name: str, hit: bool) -> None:
+        pass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    filename: str
+    suffix: str  # 小写，带点，如 ".pdf"
+    size: int
+    mtime: float
+    doc_id: str  # 去掉后缀的文件名，对应 Chroma 元信息里的 pdf_name/txt_name/docx_name
+
+
+@dataclass
+class _DirIndex:
+    dir_mtime_ns: int
+    checked_at: float
+    entries: List[CatalogEntry]
+    scanned_at: float = 0.0
+
+
+class StorageCatalog:
+    """进程内共享的目录索引。"""
+
+    def __init__(self, check_interval: float = 2.0, rescan_interval: float = 30.0):
+        self.check_interval = float(check_interval)
+        self.rescan_interval = float(rescan_interval)
+        self._index: Dict[str, _DirIndex] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(path: Path) -> List[CatalogEntry]:
+        entries: List[CatalogEntry] = []
+        with os.scandir(path) as it:
+            for de in it:
+                try:
+                    if not de.is_file():
+                        continue
+                    st = de.stat()
+                except OSError:
+                    continue
+                stem, ext = os.path.splitext(de.name)
+                entries.append(CatalogEntry(de.name, ext.lower(), st.st_size, st.st_mtime, stem))
+        entries.sort(key=lambda e: e.filename)
+        return entries
+
+    def _get_index(self, storage_dir: Path) -> Optional[_DirIndex]:
+        key = str(storage_dir)
+        now = time.monotonic()
+        with self._lock:
+            idx = self._index.get(key)
+            if idx is not None and now - idx.checked_at < self.check_interval:
+                note_cache("catalog", True)
+                return idx
+        try:
+            dir_mtime_ns = os.stat(key).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._index.pop(key, None)
+            return None
+        if idx is not None and idx.dir_mtime_ns == dir_mtime_ns and now - idx.scanned_at < self.rescan_interval:
+            idx.checked_at = now
+            note_cache("catalog", True)
+            return idx
+        note_cache("catalog", False)
+
+        start = time.perf_counter()
+        entries = self._scan(storage_dir)
+        idx = _DirIndex(dir_mtime_ns=dir_mtime_ns, checked_at=now, entries=entries, scanned_at=now)
+        with self._lock:
+            self._index[key] = idx
+        logger.info("[CATALOG] indexed %s: %d files in %.1fms", key, len(entries), (time.perf_counter() - start) * 1000)
+        return idx
+
+    def exists(self, storage_dir: Path) -> bool:
+        return self._get_index(Path(storage_dir)) is not None
+
+    def entries(self, storage_dir: Path, suffixes: Optional[Sequence[str]] = None) -> List[CatalogEntry]:
+        """返回目录下（可按后缀过滤的）文件条目；目录不存在时返回空列表。"""
+        idx = self._get_index(Path(storage_dir))
+        if idx is None:
+            return []
+        if not suffixes:
+            return list(idx.entries)
+        wanted = {s.lower() for s in suffixes}
+        return [e for e in idx.entries if e.suffix in wanted]
+
+    def list_files(self, storage_dir: Path, suffixes: Sequence[str]) -> List[str]:
+        return [e.filename for e in self.entries(storage_dir, suffixes)]
+
+    def doc_ids(self, storage_dir: Path, suffixes: Sequence[str]) -> List[str]:
+        return [e.doc_id for e in self.entries(storage_dir, suffixes)]
+
+    def invalidate(self, storage_dir: Optional[Path] = None) -> None:
+        """丢弃缓存（不传参数时清空全部），下次访问会重新扫描。"""
+        with self._lock:
+            if storage_dir is None:
+                self._index.clear()
+            else:
+                self._index.pop(str(storage_dir), None)
+
+
+_catalog_cfg = config_manager.get_section("rag").get("catalog", {})
+storage_catalog = StorageCatalog(
+    check_interval=float(_catalog_cfg.get("check_interval", 2.0)),
+    rescan_interval=float(_catalog_cfg.get("rescan_interval", 30.0)),
+)
@@ -0,0 +1,180 @@
+"""
+工具调用型节点的预算：模型 ↔ 工具往返次数、每个工具 id 的调用次数、墙钟时限。
+
+agents SDK 路径原本没有任何上限，一个反复调用 rag_pathology 的 agent 可以拖住整个阶段几分钟。
+编排层为每个节点创建一个 NodeBudget，并像患者上下文一样通过 contextvar 交给工具包装层：
+  - 工具调用前检查该工具 id 的调用次数与剩余时间；超出时不执行工具，返回提示模型直接作答的消息
+  - 执行中的工具最多等待到时限为止
+  - 每次调用模型前（RunConfig.call_model_input_filter）计数往返次数；到达最后一轮、时限已过
+    或节点所有工具都已用完时，在返回的模型输入末尾追加收尾指令，并把本次运行的
+    RunConfig.model_settings 的 tool_choice 设为 "none"（不修改共享的 Agent）；此后的工具调用一律拒绝
+真正保证收尾的是收尾指令与工具拒绝；tool_choice 只是加强：Runner.run 在 filter 之后才解析
+model_settings（openai-agents 0.16–0.24 如此，见 requirements.txt），本轮即生效，否则从下一轮生效。
+Agent 需以 reset_tool_choice=False 创建，否则 SDK 在用过工具后会把 tool_choice 重置为 None。
+默认只有 max_turns（与 SDK 默认值相同）生效，调用次数与时限由模板按节点开启。
+用量（usage()）写入 SimulationResult.budget。
+"""
+import contextvars
+import dataclasses
+import time
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from config_manager import config_manager
+
+FINALIZE_PROMPT = (
+    "The tool budget for this step is exhausted ({reason}). Do not call any more tools. "
+    "Using the information already gathered, give your final answer now."
+)
+
+_node_budget: contextvars.ContextVar[Optional["NodeBudget"]] = contextvars.ContextVar("tool_node_budget", default=None)
+
+
+def resolve_budget_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [tools.budget]（含 max_calls 中的按工具上限）与节点级覆盖项（None 表示沿用配置）。"""
+    cfg = dict(config_manager.get_section("tools").get("budget", {}))
+    max_calls = {str(k): int(v) for k, v in (cfg.pop("max_calls", {}) or {}).items()}
+    overrides = dict(overrides or {})
+    max_calls.update({str(k): int(v) for k, v in (overrides.pop("max_calls", None) or {}).items()})
+    cfg.update({k: v for k, v in overrides.items() if v is not None})
+    return {
+        "max_turns": max(1, int(cfg.get("max_turns", 10))),
+        "deadline_seconds": float(cfg.get("deadline_seconds", 0.0)),
+        "max_calls_per_tool": int(cfg.get("max_calls_per_tool", 0)),
+        "max_calls": max_calls,
+    }
+
+
+def set_node_budget(budget: Optional["NodeBudget"]) -> contextvars.Token:
+    return _node_budget.set(budget)
+
+
+def current_node_budget() -> Optional["NodeBudget"]:
+    return _node_budget.get()
+
+
+class NodeBudget:
+    def __init__(
+        self,
+        tool_ids: Iterable[str],
+        *,
+        max_turns: int = 10,
+        deadline_seconds: float = 0.0,
+        max_calls_per_tool: int = 0,
+        max_calls: Optional[Mapping[str, int]] = None,
+    ):
+        self.tool_ids = list(dict.fromkeys(tool_ids))
+        self.max_turns = int(max_turns)
+        self.deadline_seconds = float(deadline_seconds)
+        self.max_calls_per_tool = int(max_calls_per_tool)
+        self.max_calls = dict(max_calls or {})
+        self.started = time.monotonic()
+        self.turns = 0
+        self.calls: Dict[str, int] = {}
+        self.denied = 0
+        self.exhausted: Optional[str] = None
+        self.forced_final = False
+        self._run_config: Any = None
+
+    @classmethod
+    def from_settings(cls, tool_ids: Iterable[str], overrides: Optional[Mapping[str, Any]] = None) -> "NodeBudget":
+        cfg = resolve_budget_settings(overrides)
+        return cls(
+            tool_ids,
+            max_turns=cfg["max_turns"],
+            deadline_seconds=cfg["deadline_seconds"],
+            max_calls_per_tool=cfg["max_calls_per_tool"],
+            max_calls=cfg["max_calls"],
+        )
+
+    def bind(self, run_config: Any) -> Any:
+        """关联本次运行的 RunConfig（收尾时修改其 model_settings）并返回它。"""
+        self._run_config = run_config
+        return run_config
+
+    def limit_for(self, tool_id: str) -> int:
+        return self.max_calls.get(tool_id, self.max_calls_per_tool)
+
+    def remaining(self) -> Optional[float]:
+        """距时限的剩余秒数；不限时返回 None。"""
+        if self.deadline_seconds <= 0:
+            return None
+        return self.deadline_seconds - (time.monotonic() - self.started)
+
+    def _mark(self, reason: str) -> None:
+        if self.exhausted is None:
+            self.exhausted = reason
+
+    def _tool_left(self, tool_id: str) -> bool:
+        limit = self.limit_for(tool_id)
+        return limit <= 0 or self.calls.get(tool_id, 0) < limit
+
+    def check_tool(self, tool_id: str) -> Optional[str]:
+        """允许调用时计数并返回 None；否则返回给模型的拒绝消息。"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self._mark("deadline")
+            self.denied += 1
+            return FINALIZE_PROMPT.format(reason=f"{self.deadline_seconds:g}s deadline reached")
+        if self.forced_final:
+            # 模型无视 tool_choice="none" 仍调用工具
+            self.denied += 1
+            return FINALIZE_PROMPT.format(reason=self.exhausted or "final turn")
+        if not self._tool_left(tool_id):
+            self._mark(f"tool_calls:{tool_id}")
+            self.denied += 1
+            return FINALIZE_PROMPT.format(reason=f"{tool_id} already called {self.calls.get(tool_id, 0)} times")
+        self.calls[tool_id] = self.calls.get(tool_id, 0) + 1
+        return None
+
+    def deadline_hit(self) -> str:
+        """执行中的工具到达时限。"""
+        self._mark("deadline")
+        return FINALIZE_PROMPT.format(reason=f"{self.deadline_seconds:g}s deadline reached while a tool was running")
+
+    def next_turn(self) -> Optional[str]:
+        """每次调用模型前计数；需要强制收尾时返回原因。"""
+        self.turns += 1
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self._mark("deadline")
+            return f"{self.deadline_seconds:g}s deadline reached"
+        if self.turns >= self.max_turns:
+            self._mark("turns")
+            return f"turn {self.turns} of {self.max_turns}"
+        if self.tool_ids and not any(self._tool_left(t) for t in self.tool_ids):
+            self._mark("tool_calls")
+            return "every tool reached its call limit"
+        return None
+
+    def model_input_filter(self, data: Any) -> Any:
+        """RunConfig.call_model_input_filter：需要收尾时追加收尾指令，并关闭本次运行的工具调用。"""
+        reason = self.next_turn()
+        if reason is None:
+            return data.model_data
+        self.forced_final = True
+        run_config = self._run_config
+        if run_config is not None:
+            if run_config.model_settings is None:
+                from agents import ModelSettings
+
+                run_config.model_settings = ModelSettings(tool_choice="none")
+            else:
+                run_config.model_settings = dataclasses.replace(run_config.model_settings, tool_choice="none")
+        model_data = data.model_data
+        model_data.input = list(model_data.input) + [
+            {"role": "user", "content": FINALIZE_PROMPT.format(reason=reason)}
+        ]
+        return model_data
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "max_turns": self.max_turns,
+            "tool_calls": dict(self.calls),
+            "max_calls": {t: self.limit_for(t) for t in self.tool_ids},
+            "denied_calls": self.denied,
+            "elapsed_ms": int((time.monotonic() - self.started) * 1000),
+            "deadline_ms": int(self.deadline_seconds * 1000) if self.deadline_seconds > 0 else None,
+            "exhausted": self.exhausted,
+            "forced_final": self.forced_final,
+        }
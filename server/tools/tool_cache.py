@@ -0,0 +1,387 @@
+"""
+跨运行持久化的外部工具结果缓存（SQLite）。
+
+CIViC / OncoKB / PubMed（ESearch / ESummary / EFetch）/ Tavily 的结果变化很慢，但批量处理时每个文件都会重新请求。
+这里把外部请求的原始响应按 (namespace, 规范化请求参数) 存入 SQLite：
+  - 每个 namespace 的 TTL 见 config.toml [tools.cache.ttl]（缺省 default_ttl）
+  - stale-while-revalidate：过期但未超过 ttl + stale_ttl 的条目先返回旧值，同时在后台刷新（同键只刷新一次）
+  - 总大小超过 max_mb 时按最近访问时间淘汰到 90%：总大小在内存中累计，淘汰沿 accessed 索引分批删除，不做全表排序
+  - 命中不写库：访问时间先记在内存里，写入 / 淘汰 / 管理查询前或积累到 _TOUCH_BATCH 条时批量落盘
+  - call_async 的查询与写入在线程中执行（asyncio.to_thread），不阻塞调用方的事件循环
+  - 命中 / 过期命中 / 未命中 / 刷新失败计入 metrics_registry（tool = "cache:<namespace>"）
+  - 管理接口：/api/tools/cache（统计）、/api/tools/cache/entries（查看）、DELETE /api/tools/cache（清除）
+只缓存成功的响应：fetch 抛出异常或 should_cache 返回 False 时不写入。
+默认关闭（[tools.cache] enabled = false）：外部知识库的响应会跨运行落盘到 path（默认 server/tools/data/tool_cache.sqlite3），
+需要显式开启；关闭时不创建数据库文件。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from config_manager import config_manager
+from rag_metrics import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    request TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+_TOUCH_BATCH = 256
+_EVICT_BATCH = 256
+
+
+def resolve_tool_cache_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [tools.cache]（含 ttl 中的按 namespace TTL）与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("tools").get("cache", {}))
+    if overrides:
+        cfg.update(overrides)
+    path = Path(str(cfg.get("path", "data/tool_cache.sqlite3")))
+    return {
+        "enabled": bool(cfg.get("enabled", False)),
+        "path": path if path.is_absolute() else config_manager.base_dir / path,
+        "max_bytes": int(float(cfg.get("max_mb", 256)) * 1024 * 1024),
+        "default_ttl": float(cfg.get("default_ttl", 86400)),
+        "stale_ttl": float(cfg.get("stale_ttl", 0)),
+        "ttl": {str(k): float(v) for k, v in (cfg.get("ttl", {}) or {}).items()},
+    }
+
+
+def request_key(request: Any) -> Tuple[str, str]:
+    """请求参数 → (哈希键, 规范 JSON)；dict 按键排序。"""
+    text = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest(), text
+
+
+class ToolCache:
+    def __init__(
+        self,
+        path: Path,
+        *,
+        max_bytes: int = 256 * 1024 * 1024,
+        default_ttl: float = 86400.0,
+        stale_ttl: float = 0.0,
+        ttl: Optional[Mapping[str, float]] = None,
+        enabled: bool = True,
+    ):
+        self.path = Path(path)
+        self.max_bytes = int(max_bytes)
+        self.default_ttl = float(default_ttl)
+        self.stale_ttl = float(stale_ttl)
+        self.ttl = dict(ttl or {})
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._refreshing: Set[Tuple[str, str]] = set()
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+        self._bg_tasks: "set[asyncio.Task]" = set()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._total: Optional[int] = None
+
+    @classmethod
+    def from_config(cls) -> "ToolCache":
+        cfg = resolve_tool_cache_settings()
+        return cls(
+            cfg["path"],
+            max_bytes=cfg["max_bytes"],
+            default_ttl=cfg["default_ttl"],
+            stale_ttl=cfg["stale_ttl"],
+            ttl=cfg["ttl"],
+            enabled=cfg["enabled"],
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        # 调用方持有 self._lock
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _has_db(self) -> bool:
+        """关闭时只读取已有的数据库文件，不新建。"""
+        return self.enabled or self._conn is not None or self.path.exists()
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttl.get(namespace, self.default_ttl)
+
+    # ─────────────────────────── 读写 ───────────────────────────
+
+    def get(self, namespace: str, request: Any) -> Tuple[Optional[Any], str]:
+        """返回 (值, 状态)；状态为 "fresh" / "stale" / "miss"（过期超过 stale_ttl 视为 miss）。"""
+        key, _ = request_key(request)
+        now = time.time()
+        with self._lock:
+            row = self._db().execute(
+                "SELECT value, created FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None, "miss"
+            age = now - row[1]
+            ttl = self.ttl_for(namespace)
+            if age >= ttl + self.stale_ttl:
+                return None, "miss"
+            self._touched[(namespace, key)] = now
+            if len(self._touched) >= _TOUCH_BATCH:
+                self._flush_touched_locked()
+        return json.loads(row[0]), ("fresh" if age < ttl else "stale")
+
+    def put(self, namespace: str, request: Any, value: Any) -> None:
+        key, text = request_key(request)
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload) + len(text)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            total = self._total_locked()
+            old = db.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, request, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, text, payload, size, now, now),
+            )
+            self._touched.pop((namespace, key), None)
+            self._total = total + size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict_locked()
+
+    def _total_locked(self) -> int:
+        if self._total is None:
+            self._total = int(self._db().execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0])
+        return self._total
+
+    def _flush_touched_locked(self) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._db().executemany(
+            "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+            [(ts, ns, key) for (ns, key), ts in touched.items()],
+        )
+
+    def _evict_locked(self) -> None:
+        self._flush_touched_locked()
+        db = self._db()
+        target = int(self.max_bytes * 0.9)
+        freed = evicted = 0
+        while self._total > target:
+            batch = db.execute(
+                "SELECT namespace, key, size FROM entries ORDER BY accessed LIMIT ?", (_EVICT_BATCH,)
+            ).fetchall()
+            if not batch:
+                self._total = 0
+                break
+            victims = []
+            for ns, key, size in batch:
+                if self._total <= target:
+                    break
+                victims.append((ns, key))
+                self._total -= size
+                freed += size
+            db.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+            evicted += len(victims)
+        logger.info("[TOOL_CACHE] evicted %d entries (%.1f MB)", evicted, freed / 1024 / 1024)
+
+    # ─────────────────────────── 读穿 ───────────────────────────
+
+    def _lookup(self, namespace: str, request: Any) -> Tuple[Optional[Any], str]:
+        if not self.enabled:
+            return None, "miss"
+        try:
+            value, state = self.get(namespace, request)
+        except sqlite3.Error as e:
+            logger.warning("[TOOL_CACHE] read failed (%s): %s", namespace, e)
+            return None, "miss"
+        metrics_registry.record_event(f"cache:{namespace}", {"fresh": "hits", "stale": "stale_hits"}.get(state, "misses"))
+        return value, state
+
+    def _store(self, namespace: str, request: Any, value: Any, should_cache: Optional[Callable[[Any], bool]]) -> None:
+        if not self.enabled or (should_cache is not None and not should_cache(value)):
+            return
+        try:
+            self.put(namespace, request, value)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning("[TOOL_CACHE] write failed (%s): %s", namespace, e)
+
+    def _claim_refresh(self, namespace: str, request: Any) -> bool:
+        slot = (namespace, request_key(request)[0])
+        with self._lock:
+            if slot in self._refreshing:
+                return False
+            self._refreshing.add(slot)
+            return True
+
+    def _release_refresh(self, namespace: str, request: Any) -> None:
+        with self._lock:
+            self._refreshing.discard((namespace, request_key(request)[0]))
+
+    def call(
+        self,
+        namespace: str,
+        request: Any,
+        fetch: Callable[[], Any],
+        should_cache: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """同步读穿：命中直接返回；过期命中返回旧值并在后台线程刷新；未命中调用 fetch 并写入。"""
+        value, state = self._lookup(namespace, request)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            if self._claim_refresh(namespace, request):
+                if self._refresh_pool is None:
+                    self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tool-cache-refresh")
+
+                def _refresh() -> None:
+                    try:
+                        self._store(namespace, request, fetch(), should_cache)
+                    except Exception as e:
+                        metrics_registry.record_event(f"cache:{namespace}", "refresh_errors")
+                        logger.warning("[TOOL_CACHE] refresh failed (%s): %s", namespace, e)
+                    finally:
+                        self._release_refresh(namespace, request)
+
+                self._refresh_pool.submit(_refresh)
+            return value
+        result = fetch()
+        self._store(namespace, request, result, should_cache)
+        return result
+
+    async def call_async(
+        self,
+        namespace: str,
+        request: Any,
+        fetch: Callable[[], Awaitable[Any]],
+        should_cache: Optional[Callable[[Any], bool]] = None,
+        refresh: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Any:
+        """
+        异步读穿；过期命中时在当前 loop 上后台刷新。fetch 依赖请求期间才有效的资源（如 async with 的客户端）时，
+        通过 refresh 提供一个独立的刷新协程工厂。
+        """
+        value, state = await asyncio.to_thread(self._lookup, namespace, request)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            if self._claim_refresh(namespace, request):
+
+                async def _refresh() -> None:
+                    try:
+                        fresh = await (refresh or fetch)()
+                        await asyncio.to_thread(self._store, namespace, request, fresh, should_cache)
+                    except Exception as e:
+                        metrics_registry.record_event(f"cache:{namespace}", "refresh_errors")
+                        logger.warning("[TOOL_CACHE] refresh failed (%s): %s", namespace, e)
+                    finally:
+                        self._release_refresh(namespace, request)
+
+                task = asyncio.get_running_loop().create_task(_refresh())
+                self._bg_tasks.add(task)
+                task.add_done_callback(self._bg_tasks.discard)
+            return value
+        result = await fetch()
+        await asyncio.to_thread(self._store, namespace, request, result, should_cache)
+        return result
+
+    # ─────────────────────────── 管理 ───────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        rows: List[Tuple[Any, ...]] = []
+        with self._lock:
+            if self._has_db():
+                self._flush_touched_locked()
+                rows = self._db().execute(
+                    "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0), MIN(created), MAX(created) "
+                    "FROM entries GROUP BY namespace ORDER BY namespace"
+                ).fetchall()
+        snapshot = metrics_registry.snapshot()
+        namespaces = {}
+        for ns, count, size, oldest, newest in rows:
+            events = snapshot.get(f"cache:{ns}", {}).get("events", {})
+            namespaces[ns] = {
+                "entries": count,
+                "bytes": size,
+                "ttl": self.ttl_for(ns),
+                "oldest_age_s": round(now - oldest, 1),
+                "newest_age_s": round(now - newest, 1),
+                "hits": events.get("hits", 0),
+                "stale_hits": events.get("stale_hits", 0),
+                "misses": events.get("misses", 0),
+            }
+        return {
+            "enabled": self.enabled,
+            "path": str(self.path),
+            "max_bytes": self.max_bytes,
+            "bytes": sum(v["bytes"] for v in namespaces.values()),
+            "stale_ttl": self.stale_ttl,
+            "namespaces": namespaces,
+        }
+
+    def entries(self, namespace: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        now = time.time()
+        sql = "SELECT namespace, key, request, size, created, accessed FROM entries"
+        params: List[Any] = []
+        if namespace:
+            sql += " WHERE namespace = ?"
+            params.append(namespace)
+        sql += " ORDER BY accessed DESC LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+        with self._lock:
+            if not self._has_db():
+                return []
+            self._flush_touched_locked()
+            rows = self._db().execute(sql, params).fetchall()
+        return [
+            {
+                "namespace": ns,
+                "key": key,
+                "request": json.loads(request),
+                "bytes": size,
+                "age_s": round(now - created, 1),
+                "expired": now - created >= self.ttl_for(ns),
+                "last_access_age_s": round(now - accessed, 1),
+            }
+            for ns, key, request, size, created, accessed in rows
+        ]
+
+    def purge(self, namespace: Optional[str] = None, key: Optional[str] = None, expired_only: bool = False) -> int:
+        """删除条目，返回删除数。expired_only 时只删除超过 ttl + stale_ttl 的条目。"""
+        now = time.time()
+        with self._lock:
+            if not self._has_db():
+                return 0
+            db = self._db()
+            self._flush_touched_locked()
+            rows = db.execute("SELECT namespace, key, created FROM entries").fetchall()
+            victims = [
+                (ns, k) for ns, k, created in rows
+                if (namespace is None or ns == namespace)
+                and (key is None or k == key)
+                and (not expired_only or now - created >= self.ttl_for(ns) + self.stale_ttl)
+            ]
+            db.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+            self._total = None
+        return len(victims)
+
+
+tool_cache = ToolCache.from_config()
@@ -0,0 +1,210 @@
+"""
+工具执行层：同步工具在按池划分的有界线程池中运行，不阻塞 FastAPI 事件循环。
+
+agents SDK 对同步 function_tool 直接使用 asyncio.to_thread，所有工具共享默认线程池：
+一个卡住的外部请求可以占满线程池，既没有超时，也看不到排队情况。这里：
+  - 每个池（默认按工具名）一个独立的 ThreadPoolExecutor，大小 / 超时 / 排队上限见 config.toml [tools.executor]
+  - 调用超时后向 agent 返回错误；已开始执行的线程无法中断，会跑完但结果被丢弃，仍在排队的调用直接取消
+  - 排队数超过 max_queue 时立即拒绝，避免请求无限堆积
+  - 排队等待 / 执行耗时、调用 / 错误 / 超时 / 拒绝次数计入 metrics_registry（tool = "executor:<池名>"），
+    stats() 给出各池当前的排队与运行数
+  - 通过 contextvars.copy_context 执行，trace 收集与患者上下文在线程内照常生效
+用法：
+    @function_tool(name_override="pubmed_query")
+    @offload("pubmed_query")
+    def pubmed_query_tool(query: str) -> str: ...
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar
+
+from config_manager import config_manager
+from rag_metrics import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ToolTimeout(TimeoutError):
+    """工具调用超过池的超时时间。"""
+
+
+class ToolRejected(RuntimeError):
+    """池的排队数已满，调用被拒绝。"""
+
+
+def resolve_executor_settings(pool: str, overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [tools.executor] 默认值、[tools.executor.pools.<pool>] 与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("tools").get("executor", {}))
+    pools = dict(cfg.pop("pools", {}) or {})
+    cfg.update(pools.get(pool, {}) or {})
+    if overrides:
+        cfg.update(overrides)
+    return {
+        "workers": max(1, int(cfg.get("workers", 4))),
+        "timeout": float(cfg.get("timeout", 120.0)),
+        "max_queue": int(cfg.get("max_queue", 64)),
+    }
+
+
+def resolve_parallel_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """同一轮内多个工具调用的并发设置：合并 config.toml [tools.parallel] 与调用方覆盖项（如节点级上限）。"""
+    cfg = dict(config_manager.get_section("tools").get("parallel", {}))
+    if overrides:
+        cfg.update({k: v for k, v in overrides.items() if v is not None})
+    enabled = bool(cfg.get("enabled", True))
+    return {
+        "enabled": enabled,
+        "max_concurrency": max(1, int(cfg.get("max_concurrency", 4))) if enabled else 1,
+    }
+
+
+class _Pool:
+    def __init__(self, name: str, workers: int, timeout: float, max_queue: int):
+        self.name = name
+        self.label = f"executor:{name}"
+        self.workers = workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"tool-{name}")
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def admit(self) -> None:
+        with self.lock:
+            if self.max_queue > 0 and self.queued >= self.max_queue:
+                self.rejected += 1
+                metrics_registry.record_event(self.label, "rejected")
+                raise ToolRejected(f"{self.name}: {self.queued} calls already queued")
+            self.queued += 1
+        metrics_registry.record_event(self.label, "calls")
+
+    def started(self, waited: float) -> None:
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        metrics_registry.observe(self.label, "queue_wait_ms", waited * 1000)
+
+    def finished(self, elapsed: float, failed: bool) -> None:
+        with self.lock:
+            self.running -= 1
+            self.completed += 1
+            self.errors += int(failed)
+        metrics_registry.observe(self.label, "run_ms", elapsed * 1000)
+        if failed:
+            metrics_registry.record_event(self.label, "errors")
+
+    def cancelled(self) -> None:
+        """调用在开始执行前被取消（超时 / 调用方取消）。"""
+        with self.lock:
+            self.queued -= 1
+
+    def timed_out(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+        metrics_registry.record_event(self.label, "timeouts")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "timeout": self.timeout,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+            }
+
+
+class ToolExecutor:
+    def __init__(self) -> None:
+        self._pools: Dict[str, _Pool] = {}
+        self._lock = threading.Lock()
+
+    def pool(self, name: str) -> _Pool:
+        pool = self._pools.get(name)
+        if pool is not None:
+            return pool
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                cfg = resolve_executor_settings(name)
+                pool = self._pools[name] = _Pool(name, cfg["workers"], cfg["timeout"], cfg["max_queue"])
+        return pool
+
+    async def run(
+        self, pool_name: str, fn: Callable[..., T], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> T:
+        """在指定池中执行 fn(*args, **kwargs) 并 await 结果；timeout 缺省用池的配置（<= 0 表示不限时）。"""
+        pool = self.pool(pool_name)
+        limit = pool.timeout if timeout is None else float(timeout)
+        pool.admit()
+        submitted = time.perf_counter()
+        ctx = contextvars.copy_context()
+
+        def _call() -> T:
+            started = time.perf_counter()
+            pool.started(started - submitted)
+            failed = False
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                pool.finished(time.perf_counter() - started, failed)
+
+        try:
+            fut: Future = pool.executor.submit(_call)
+        except RuntimeError:
+            pool.cancelled()
+            raise
+        fut.add_done_callback(lambda f: pool.cancelled() if f.cancelled() else None)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(fut), limit if limit > 0 else None)
+        except asyncio.TimeoutError:
+            fut.cancel()
+            pool.timed_out()
+            logger.warning("[EXECUTOR] %s timed out after %.1fs", pool_name, limit)
+            raise ToolTimeout(f"{pool_name} did not finish within {limit:g}s") from None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            pools = dict(self._pools)
+        return {name: pool.stats() for name, pool in sorted(pools.items())}
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+tool_executor = ToolExecutor()
+
+
+def offload(pool: str, timeout: Optional[float] = None) -> Callable[[Callable[..., T]], Callable[..., Any]]:
+    """把同步函数包装成在 tool_executor 指定池中执行的协程函数（签名 / docstring 保持不变，可直接交给 function_tool）。"""
+
+    def decorator(fn: Callable[..., T]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        async def _wrapped(*args: Any, **kwargs: Any) -> T:
+            return await tool_executor.run(pool, fn, *args, timeout=timeout, **kwargs)
+
+        return _wrapped
+
+    return decorator
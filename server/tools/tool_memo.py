@@ -0,0 +1,155 @@
+"""
+单次模拟运行内的工具结果复用（memo）。
+
+同一次模拟里，不同 agent 经常用相同或只差大小写 / 空白的参数调用同一个工具
+（同一组 genesearch_batch_tool 查询、只差大小写的 PubMed 检索词……）。这里按运行维护一张表：
+  - 键：工具 id（与 tool_budget 一致）+ 规范化后的参数（字符串去首尾空白、折叠空白、casefold；dict 按键排序；
+    UNORDERED_ARGS 中列出的参数视为无序集合，逗号分隔的字符串按元素处理；缺省参数按 schema 补齐）
+  - 同键的并发调用只执行一次（single-flight），其余调用等待首个调用的结果
+  - 复用的调用按 call_id 记录在 cached_calls，编排层据此在 ToolCallInfo 中标记 cached=true
+  - 失败结果（FAILURE_PREFIXES：工具包装层与 RAG 的错误消息、SDK 捕获异常后的默认消息）只分享给
+    并发等待者，不留给之后的调用（允许重试）
+编排层每次运行创建一个 RunMemo，并在每个节点的 task 中通过 set_run_memo 设置（与患者上下文一致）。
+"""
+import asyncio
+import contextvars
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from config_manager import config_manager
+from rag_metrics import metrics_registry
+
+# 工具与 SDK 报告失败时返回的消息前缀（比较时忽略大小写与开头空白）
+FAILURE_PREFIXES = (
+    "error",  # "Error retrieving guidelines: …" / "Error searching PubMed: …"
+    "⚠️ tool execution failed",  # rag_common / rag_staging_uicc
+    "rag dependencies not available",
+    "an error occurred while running the tool",  # agents SDK default_tool_error_function
+)
+
+# 顺序不影响结果的参数（工具 id → 参数名）
+UNORDERED_ARGS: Dict[str, frozenset] = {
+    "genesearch_batch_tool": frozenset({"genes"}),
+}
+
+_WS_RE = re.compile(r"\s+")
+
+_run_memo: contextvars.ContextVar[Optional["RunMemo"]] = contextvars.ContextVar("tool_run_memo", default=None)
+
+
+def resolve_memo_settings(overrides: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """合并 config.toml [tools.memo] 与调用方覆盖项。"""
+    cfg = dict(config_manager.get_section("tools").get("memo", {}))
+    if overrides:
+        cfg.update(overrides)
+    return {"enabled": bool(cfg.get("enabled", True))}
+
+
+def set_run_memo(memo: Optional["RunMemo"]) -> contextvars.Token:
+    return _run_memo.set(memo)
+
+
+def current_run_memo() -> Optional["RunMemo"]:
+    return _run_memo.get()
+
+
+def _normalize(value: Any, unordered: bool = False) -> Any:
+    if isinstance(value, str):
+        return _WS_RE.sub(" ", value.strip()).casefold()
+    if isinstance(value, Mapping):
+        return {str(k): _normalize(v) for k, v in sorted(value.items()) if v is not None}
+    if isinstance(value, (list, tuple)):
+        items = [_normalize(v) for v in value]
+        if unordered:
+            items.sort(key=lambda v: json.dumps(v, sort_keys=True, ensure_ascii=False))
+        return items
+    return value
+
+
+def memo_key(tool_id: str, args_json: str, schema: Optional[Mapping[str, Any]] = None) -> str:
+    """工具参数（模型给出的 JSON 字符串）→ 规范化后的键。无法解析时按原字符串的规范化形式。"""
+    try:
+        args = json.loads(args_json or "{}")
+    except (TypeError, ValueError):
+        return _normalize(str(args_json))
+    if not isinstance(args, dict):
+        return json.dumps(_normalize(args), sort_keys=True, ensure_ascii=False)
+
+    props = (schema or {}).get("properties", {}) or {}
+    for name, spec in props.items():
+        if args.get(name) is None and isinstance(spec, Mapping) and "default" in spec:
+            args[name] = spec["default"]
+
+    unordered = UNORDERED_ARGS.get(tool_id, frozenset())
+    normalized: Dict[str, Any] = {}
+    for name, value in sorted(args.items()):
+        if value is None:
+            continue
+        if name in unordered and isinstance(value, str):
+            value = [part for part in value.split(",") if part.strip()]
+        normalized[name] = _normalize(value, unordered=name in unordered)
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+def _is_error(result: Any) -> bool:
+    return isinstance(result, str) and result.lstrip().casefold().startswith(FAILURE_PREFIXES)
+
+
+class RunMemo:
+    """一次运行内的工具结果表；只在同一个事件循环中使用。"""
+
+    def __init__(self) -> None:
+        self._results: Dict[Tuple[str, str], "asyncio.Future[Any]"] = {}
+        self._owners: Dict[Tuple[str, str], Optional[str]] = {}
+        self.cached_calls: Dict[str, Optional[str]] = {}  # 复用结果的 call_id → 实际执行的 call_id
+        self.hits = 0
+        self.misses = 0
+
+    def is_cached(self, call_id: Optional[str]) -> bool:
+        return bool(call_id) and call_id in self.cached_calls
+
+    async def call(
+        self, tool_id: str, key: str, call_id: Optional[str], invoke: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        slot = (tool_id, key)
+        fut = self._results.get(slot)
+        if fut is not None:
+            self.hits += 1
+            metrics_registry.record_event(f"memo:{tool_id}", "hits")
+            if call_id:
+                self.cached_calls[call_id] = self._owners.get(slot)
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+                # 首个调用被取消：由当前调用重新执行
+                self.hits -= 1
+                self.cached_calls.pop(call_id or "", None)
+                return await self.call(tool_id, key, call_id, invoke)
+
+        fut = asyncio.get_running_loop().create_future()
+        # 没有等待者时也要取走异常，避免 "exception was never retrieved"
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._results[slot] = fut
+        self._owners[slot] = call_id
+        self.misses += 1
+        metrics_registry.record_event(f"memo:{tool_id}", "misses")
+        try:
+            result = await invoke()
+        except asyncio.CancelledError:
+            self._results.pop(slot, None)
+            fut.cancel()
+            raise
+        except BaseException as exc:
+            self._results.pop(slot, None)
+            fut.set_exception(exc)
+            raise
+        fut.set_result(result)
+        if _is_error(result):
+            self._results.pop(slot, None)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._results)}
@@ -2,7 +2,32 @@
 Simplified tool wrappers for openai-agents SDK.
 These are stateless versions that don't require MedicalContext.
 """
-from typing import Optional
+import asyncio
+import contextvars
+import copy
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The tool modules use flat imports (``from config_manager import ...``); make them
+# resolvable when this file is imported as part of the ``server.tools`` package.
+_TOOLS_DIR = str(Path(__file__).resolve().parent)
+if _TOOLS_DIR not in sys.path:
+    sys.path.append(_TOOLS_DIR)
+
+from rag_metrics import collect_traces, metrics_registry  # noqa: E402
+from rag_prefetch import current_patient_context, resolve_prefetch_settings, set_patient_context  # noqa: E402,F401
+from tool_executor import offload, resolve_parallel_settings, tool_executor  # noqa: E402,F401
+from tool_cache import tool_cache  # noqa: E402,F401
+from tool_memo import RunMemo, current_run_memo, memo_key, resolve_memo_settings, set_run_memo  # noqa: E402,F401
+from tool_budget import NodeBudget, current_node_budget, resolve_budget_settings, set_node_budget  # noqa: E402,F401
 
 # Lazy imports - only load when actually used
 _agents_available = False
@@ -26,26 +51,20 @@ def _get_rag_dependencies():
     global _rag_available
     try:
         import chromadb
-        # Try relative import first (when used as part of package)
-        try:
-            from .rag_common import run_vector_rag
-            from .config_manager import (
-                external_client,
-                ESMO_STORAGE, NCCN_STORAGE, HEMA_STORAGE,
-                ESMO_DB_STORAGE, NCCN_DB_STORAGE, HEMA_DB_STORAGE,
-            )
-        except ImportError:
-            # Fallback for direct execution (shouldn't happen in package context)
-            from rag_common import run_vector_rag
-            from config_manager import (
-                external_client,
-                ESMO_STORAGE, NCCN_STORAGE, HEMA_STORAGE,
-                ESMO_DB_STORAGE, NCCN_DB_STORAGE, HEMA_DB_STORAGE,
-            )
+        # Flat imports (the tools directory is on sys.path), so that rag_common,
+        # config_manager and rag_metrics are shared with the standalone tool modules
+        from rag_common import run_vector_rag
+        from guideline_store import guideline_source_settings
+        from config_manager import (
+            external_client,
+            ESMO_STORAGE, NCCN_STORAGE, HEMA_STORAGE,
+            ESMO_DB_STORAGE, NCCN_DB_STORAGE, HEMA_DB_STORAGE,
+        )
         _rag_available = True
         return {
             'chromadb': chromadb,
             'run_vector_rag': run_vector_rag,
+            'guideline_source_settings': guideline_source_settings,
             'external_client': external_client,
             'ESMO_STORAGE': ESMO_STORAGE,
             'NCCN_STORAGE': NCCN_STORAGE,
@@ -61,39 +80,44 @@ def _get_rag_dependencies():
 # ================================ RAG GUIDELINE TOOL ================================ #
 
 @function_tool(name_override="rag_guideline")
-def rag_guideline_tool(query: str, patient_context: str = "") -> str:
+@offload("rag_guideline")
+def rag_guideline_tool(query: str, patient_context: str = "", queries: Optional[List[str]] = None) -> str:
     """
     Retrieve relevant clinical guideline information from ESMO/NCCN/HEMA databases.
     
     Args:
         query: The specific medical question to search for
         patient_context: Optional patient history for context-aware retrieval
+        queries: Optional list of several related questions to answer in one call (results grouped per question)
     
     Returns:
         Retrieved guideline excerpts with citations
     """
+    return _rag_guideline(query, patient_context, queries)
+
+
+def _rag_guideline(
+    query: str, patient_context: str = "", queries: Optional[List[str]] = None, prefetch: bool = False
+) -> str:
+    """Shared body of rag_guideline_tool and its patient-level prefetch.
+
+    The patient history of the current run (set by the orchestrator) takes precedence over
+    the model-supplied patient_context, so every call for a patient shares the prefetched
+    selection and semantic cache entries.
+    """
+    patient_context = current_patient_context() or patient_context
     deps = _get_rag_dependencies()
     if deps is None:
         return "RAG dependencies not available. Please check chromadb and config_manager are installed."
     
     try:
-        chromadb = deps['chromadb']
         run_vector_rag = deps['run_vector_rag']
         external_client = deps['external_client']
         ESMO_STORAGE = deps['ESMO_STORAGE']
         NCCN_STORAGE = deps['NCCN_STORAGE']
         HEMA_STORAGE = deps['HEMA_STORAGE']
-        ESMO_DB_STORAGE = deps['ESMO_DB_STORAGE']
-        NCCN_DB_STORAGE = deps['NCCN_DB_STORAGE']
-        HEMA_DB_STORAGE = deps['HEMA_DB_STORAGE']
-        
-        esmo_client = chromadb.PersistentClient(path=str(ESMO_DB_STORAGE))
-        nccn_client = chromadb.PersistentClient(path=str(NCCN_DB_STORAGE))
-        hema_client = chromadb.PersistentClient(path=str(HEMA_DB_STORAGE))
-        
-        esmo_collection = esmo_client.get_or_create_collection(name="medical_collection")
-        nccn_collection = nccn_client.get_or_create_collection(name="medical_collection")
-        hema_collection = hema_client.get_or_create_collection(name="medical_collection")
+        # separate / consolidated 布局由 config.toml [rag] guideline_mode 决定
+        stores = deps['guideline_source_settings']()
 
         def build_citation(md: dict) -> str:
             citation = md.get("pdf_name", "Unknown")
@@ -111,7 +135,7 @@ def rag_guideline_tool(query: str, patient_context: str = "") -> str:
                 "label": "ESMO",
                 "storage_dir": ESMO_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": esmo_collection,
+                **stores["ESMO"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -121,7 +145,7 @@ def rag_guideline_tool(query: str, patient_context: str = "") -> str:
                 "label": "NCCN",
                 "storage_dir": NCCN_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": nccn_collection,
+                **stores["NCCN"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -131,7 +155,7 @@ def rag_guideline_tool(query: str, patient_context: str = "") -> str:
                 "label": "HEMA",
                 "storage_dir": HEMA_STORAGE,
                 "suffixes": [".pdf"],
-                "collection": hema_collection,
+                **stores["HEMA"],
                 "where_key": "pdf_name",
                 "id_transform": _pdf_id,
                 "citation_builder": build_citation,
@@ -143,6 +167,7 @@ def rag_guideline_tool(query: str, patient_context: str = "") -> str:
             tool_name="rag_guideline",
             patient_history=patient_context,
             query=query,
+            queries=queries,
             role_hint=None,
             external_client=external_client,
             sources=sources,
@@ -150,15 +175,103 @@ def rag_guideline_tool(query: str, patient_context: str = "") -> str:
             n_results=20,
             top_k=10,
             score_threshold=0.6,
+            prefetch=prefetch,
         )
     except Exception as e:
         return f"Error retrieving guidelines: {str(e)}"
 
 
+# ============================ SPECIALISED RAG TOOLS ============================ #
+
+def _toolkit_context(patient_context: str = ""):
+    """Stand-in for the RunContextWrapper[MedicalContext] the toolkits expect; the patient
+    history of the current run (set by the orchestrator) takes precedence, as for rag_guideline."""
+    from types import SimpleNamespace
+
+    history = current_patient_context() or patient_context
+    return SimpleNamespace(context=SimpleNamespace(patient_history=history, role_hint=None))
+
+
+@function_tool(name_override="rag_pathology")
+@offload("rag_pathology")
+def rag_pathology_tool(
+    query: str = "", patient_context: str = "", top_k: int = 5, queries: Optional[List[str]] = None
+) -> str:
+    """
+    Retrieve passages from the pathology reference documents (all chunks of the selected documents are scored).
+
+    Args:
+        query: The specific pathology question to search for
+        patient_context: Optional patient history for context-aware retrieval
+        top_k: Number of passages to return
+        queries: Optional list of several related questions to answer in one call (results grouped per question)
+
+    Returns:
+        Retrieved pathology excerpts with citations
+    """
+    if _get_rag_dependencies() is None:
+        return "RAG dependencies not available. Please check chromadb and config_manager are installed."
+    try:
+        from rag_pathology import PathologyRAGToolkit
+
+        return PathologyRAGToolkit._retrieve_pathology_impl(
+            _toolkit_context(patient_context), query=query, top_k=top_k, tool_name="rag_pathology", queries=queries
+        )
+    except Exception as e:
+        return f"Error retrieving pathology documents: {str(e)}"
+
+
+@function_tool(name_override="rag_tool_who")
+@offload("rag_tool_who")
+def rag_who_tool(query: str = "", patient_context: str = "", queries: Optional[List[str]] = None) -> str:
+    """
+    Retrieve chunks from the WHO classification database.
+
+    Args:
+        query: The question, ideally with disease stage and histologic subtype, location and molecular markers
+        patient_context: Optional patient history for context-aware retrieval
+        queries: Optional list of several related questions to answer in one call (results grouped per question)
+
+    Returns:
+        Retrieved WHO excerpts with citations
+    """
+    if _get_rag_dependencies() is None:
+        return "RAG dependencies not available. Please check chromadb and config_manager are installed."
+    try:
+        from rag_who import MedicalRAGToolkitWHO
+
+        return MedicalRAGToolkitWHO._retrieve_who_impl(_toolkit_context(patient_context), query=query, queries=queries)
+    except Exception as e:
+        return f"Error retrieving WHO documents: {str(e)}"
+
+
+@function_tool(name_override="rag_staging_uicc")
+@offload("rag_staging_uicc")
+def rag_staging_uicc_tool(query: str = "", patient_context: str = "") -> str:
+    """
+    Retrieve the relevant sections of the UICC TNM staging documents.
+
+    Args:
+        query: The staging question (tumour site, T/N/M findings)
+        patient_context: Optional patient history for context-aware retrieval
+
+    Returns:
+        Staging sections with their document names
+    """
+    try:
+        from rag_staging_uicc import UICCRAGToolkit
+
+        return UICCRAGToolkit._retrieve_uicc_impl(_toolkit_context(patient_context), query)
+    except ImportError:
+        return "RAG dependencies not available. Please check chromadb and config_manager are installed."
+    except Exception as e:
+        return f"Error retrieving staging documents: {str(e)}"
+
+
 # ================================ GENE SEARCH TOOL ================================ #
 
 @function_tool(name_override="gene_search")
-def gene_search_tool(genes: str) -> str:
+async def gene_search_tool(genes: str) -> str:
     """
     Search CIViC and OncoKB databases for gene variant clinical evidence.
     
@@ -169,17 +282,17 @@ def gene_search_tool(genes: str) -> str:
         Clinical evidence for the specified genes
     """
     try:
-        from .gene_search import search_genes_batch
+        from .gene_search import search_genes_batch_async
     except ImportError:
-        from gene_search import search_genes_batch
+        from gene_search import search_genes_batch_async
     
     gene_list = [g.strip() for g in genes.split(",") if g.strip()]
     if not gene_list:
         return "No genes specified"
     
     try:
-        results = search_genes_batch(gene_list)
-        return results
+        results = await search_genes_batch_async(gene_list)
+        return json.dumps(results, ensure_ascii=False)
     except Exception as e:
         return f"Error searching genes: {str(e)}"
 
@@ -187,7 +300,7 @@ def gene_search_tool(genes: str) -> str:
 # ================================ PUBMED TOOL ================================ #
 
 @function_tool(name_override="pubmed_query")
-def pubmed_query_tool(query: str, max_results: int = 5) -> str:
+async def pubmed_query_tool(query: str, max_results: int = 5) -> str:
     """
     Search PubMed for relevant medical literature.
     
@@ -199,12 +312,12 @@ def pubmed_query_tool(query: str, max_results: int = 5) -> str:
         Abstracts and citations from matching publications
     """
     try:
-        from .pubmedv4 import search_pubmed
+        from .pubmedv4 import pubmed_query
     except ImportError:
-        from pubmedv4 import search_pubmed
+        from pubmedv4 import pubmed_query
     
     try:
-        results = search_pubmed(query, max_results=max_results)
+        results = await pubmed_query([query], retmax=max_results)
         return results
     except Exception as e:
         return f"Error searching PubMed: {str(e)}"
@@ -214,20 +327,207 @@ def pubmed_query_tool(query: str, max_results: int = 5) -> str:
 
 TOOL_REGISTRY = {
     "rag_guideline": rag_guideline_tool,
-    "rag_pathology": rag_guideline_tool,  # Fallback to guideline for now
-    "rag_tool_who": rag_guideline_tool,   # Fallback
-    "rag_staging_uicc": rag_guideline_tool,  # Fallback
+    "rag_pathology": rag_pathology_tool,
+    "rag_tool_who": rag_who_tool,
+    "rag_staging_uicc": rag_staging_uicc_tool,
     "genesearch_batch_tool": gene_search_tool,
     "pubmed_query": pubmed_query_tool,
     "web_search_tool": None,  # TODO: Implement web search
 }
 
 
+# Receives tool-start / tool-end events for the calls made in the current task; the
+# orchestrator sets one per node and streams the events to the client
+_tool_event_sink: "contextvars.ContextVar[Optional[Callable[[dict], None]]]" = contextvars.ContextVar(
+    "tool_event_sink", default=None
+)
+ARGS_PREVIEW_CHARS = 200
+
+
+def set_tool_event_sink(sink: Optional[Callable[[dict], None]]) -> contextvars.Token:
+    return _tool_event_sink.set(sink)
+
+
+def _args_preview(args: str) -> str:
+    text = " ".join(str(args or "").split())
+    return text if len(text) <= ARGS_PREVIEW_CHARS else text[: ARGS_PREVIEW_CHARS - 1] + "…"
+
+
+# RAG traces (rag_metrics) recorded during a tool call, keyed by tool_call_id
+_CALL_METRICS: "OrderedDict[str, list]" = OrderedDict()
+_CALL_METRICS_MAX = 1024
+_call_metrics_lock = threading.Lock()
+
+
+def _instrument(tool, tool_id: Optional[str] = None):
+    """Wrap a FunctionTool so the RAG traces emitted while it runs are kept by tool_call_id,
+    calls are checked against the node's budget (see tool_budget), identical calls within
+    a run (see tool_memo) share one execution, and start / end events reach the task's sink."""
+    invoke = getattr(tool, "on_invoke_tool", None)
+    if invoke is None:
+        return tool
+    budget_id = tool_id or tool.name
+
+    async def _on_invoke(ctx, args: str):
+        sink = _tool_event_sink.get()
+        if sink is None:
+            return await _budgeted(ctx, args)
+        call_id = getattr(ctx, "tool_call_id", None)
+        event = {"callId": call_id, "toolName": tool.name, "toolId": budget_id}
+        sink({"type": "tool-start", **event, "argsPreview": _args_preview(args)})
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = await _budgeted(ctx, args)
+            return result
+        except BaseException as exc:
+            error = str(exc) or type(exc).__name__
+            raise
+        finally:
+            memo = current_run_memo()
+            sink({
+                "type": "tool-end",
+                **event,
+                "durationMs": int((time.perf_counter() - started) * 1000),
+                "resultSize": len(str(result)) if result is not None else 0,
+                "cached": bool(memo and memo.is_cached(call_id)),
+                "error": error,
+            })
+
+    async def _budgeted(ctx, args: str):
+        budget = current_node_budget()
+        if budget is None:
+            return await _memoized(ctx, args)
+        denied = budget.check_tool(budget_id)
+        if denied is not None:
+            return denied
+        remaining = budget.remaining()
+        if remaining is None:
+            return await _memoized(ctx, args)
+        try:
+            return await asyncio.wait_for(_memoized(ctx, args), max(remaining, 0.0))
+        except asyncio.TimeoutError:
+            logger.warning("[BUDGET] %s cancelled at the node deadline", budget_id)
+            return budget.deadline_hit()
+
+    async def _memoized(ctx, args: str):
+        memo = current_run_memo()
+        if memo is None:
+            return await _traced(ctx, args)
+        key = memo_key(budget_id, args, getattr(tool, "params_json_schema", None))
+        return await memo.call(budget_id, key, getattr(ctx, "tool_call_id", None), lambda: _traced(ctx, args))
+
+    async def _traced(ctx, args: str):
+        with collect_traces() as traces:
+            try:
+                return await invoke(ctx, args)
+            finally:
+                call_id = getattr(ctx, "tool_call_id", None)
+                if call_id and traces:
+                    with _call_metrics_lock:
+                        _CALL_METRICS[call_id] = list(traces)
+                        while len(_CALL_METRICS) > _CALL_METRICS_MAX:
+                            _CALL_METRICS.popitem(last=False)
+
+    wrapped = copy.copy(tool)
+    wrapped.on_invoke_tool = _on_invoke
+    return wrapped
+
+
+def pop_tool_call_metrics(call_id: Optional[str]) -> Optional[list]:
+    """Return (and forget) the RAG traces recorded for a tool call, if any."""
+    if not call_id:
+        return None
+    with _call_metrics_lock:
+        return _CALL_METRICS.pop(call_id, None)
+
+
 def get_tools_for_node(tool_ids: list[str]) -> list:
     """Get tool functions for the specified tool IDs."""
     tools = []
     for tool_id in tool_ids:
         tool = TOOL_REGISTRY.get(tool_id)
         if tool is not None:
-            tools.append(tool)
+            tools.append(_instrument(tool, tool_id))
     return tools
+
+
+def new_run_memo() -> Optional[RunMemo]:
+    """A fresh per-run tool result memo, or None when [tools.memo] is disabled."""
+    return RunMemo() if resolve_memo_settings()["enabled"] else None
+
+
+def new_node_budget(tool_ids: list[str], overrides: Optional[dict] = None) -> NodeBudget:
+    """Turn / per-tool call / deadline budget for one node: [tools.budget] merged with the node's overrides."""
+    return NodeBudget.from_settings(tool_ids, overrides)
+
+
+# ================================ PATIENT PREFETCH ================================ #
+
+def _prefetch_pathology(patient: str) -> str:
+    from rag_pathology import PathologyRAGToolkit
+
+    return PathologyRAGToolkit._retrieve_pathology_impl(
+        _toolkit_context(patient), query="", top_k=5, tool_name="rag_pathology", prefetch=True
+    )
+
+
+def _prefetch_who(patient: str) -> str:
+    from rag_who import MedicalRAGToolkitWHO
+
+    return MedicalRAGToolkitWHO._retrieve_who_impl(_toolkit_context(patient), query="", prefetch=True)
+
+
+def _prefetch_uicc(patient: str) -> str:
+    from rag_staging_uicc import UICCRAGToolkit
+
+    return UICCRAGToolkit._retrieve_uicc_impl(_toolkit_context(patient), "", prefetch=True)
+
+
+# Patient-level warm-up per tool name
+PREFETCHERS = {
+    "rag_guideline": lambda patient: _rag_guideline("", patient, prefetch=True),
+    "rag_pathology": _prefetch_pathology,
+    "rag_tool_who": _prefetch_who,
+    "rag_staging_uicc": _prefetch_uicc,
+}
+
+_prefetch_tasks: "set[asyncio.Task]" = set()
+
+
+def prefetch_enabled() -> bool:
+    return resolve_prefetch_settings()["enabled"]
+
+
+def start_patient_prefetch(patient_history: str, tool_ids: list[str]) -> list:
+    """
+    Start patient-level retrieval for the given tools in the background (document selection,
+    embedding, retrieval and rerank with the patient history as the query). Later tool calls
+    for the same patient reuse the selection, and the semantic cache entry when [rag.semantic_cache]
+    is enabled (it ships disabled, so by default only the selection is reused). Must be called
+    from a running event loop; returns the scheduled tasks.
+    """
+    if not patient_history or not patient_history.strip():
+        return []
+    tasks = []
+    seen = set()
+    for tool_id in tool_ids:
+        tool = TOOL_REGISTRY.get(tool_id)
+        name = getattr(tool, "name", None)
+        if name not in PREFETCHERS or name in seen:
+            continue
+        seen.add(name)
+
+        async def _run(fn=PREFETCHERS[name], name=name):
+            start = time.perf_counter()
+            try:
+                await tool_executor.run("prefetch", fn, patient_history)
+                logger.info("[PREFETCH] %s warmed in %.0fms", name, (time.perf_counter() - start) * 1000)
+            except Exception:
+                logger.exception("[PREFETCH] %s failed", name)
+
+        task = asyncio.create_task(_run())
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+        tasks.append(task)
+    return tasks
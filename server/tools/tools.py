@@ -3,9 +3,10 @@ import logging
 import time
 
 from agents import function_tool
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
 
 from config_manager import get_env_var
+from tool_cache import tool_cache
 
 logger = logging.getLogger(__name__)
 
@@ -31,10 +32,12 @@ async def web_search_tool(user_query: str) -> str:
         logger.warning("Tavily API key missing")
         return "Tavily API key missing. Please set TAVILY_API_KEY in environment."
 
-    client = TavilyClient(tavily_api_key)
+    client = AsyncTavilyClient(tavily_api_key)
     try:
         start = time.perf_counter()
-        response = client.search(query=user_query)
+        response = await tool_cache.call_async(
+            "tavily", {"query": user_query.strip()}, lambda: client.search(query=user_query)
+        )
         elapsed = time.perf_counter() - start
         logger.info("Tavily search ok | elapsed=%.2fs", elapsed)
     except Exception as e:
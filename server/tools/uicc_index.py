@@ -0,0 +1,225 @@
+"""
+UICC 分期文档的内存索引：所有 .txt 只加载一次（按 size/mtime 增量刷新），
+切分为章节（T/N/M 定义、分期组合、解剖部位、分类规则等），
+按查询相关度挑选章节并控制在 token 预算内，避免整篇原文灌进下游 LLM。
+"""
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from candidate_pruning import bm25_scores
+from config_manager import config_manager
+from rag_metrics import note_cache
+from storage_catalog import CatalogEntry, storage_catalog
+
+logger = logging.getLogger(__name__)
+
+# 章节类型识别（按标题关键词）；越靠前优先级越高
+SECTION_KINDS: Tuple[Tuple[str, re.Pattern], ...] = (
+    ("stage", re.compile(r"\b(stage|prognostic)\s*(group|grouping)s?\b|\bstage\b", re.I)),
+    ("tnm", re.compile(r"^\s*p?[TNM]\s*[–—-]|\b(primary tumou?r|regional lymph nodes?|distant metastas[ie]s)\b", re.I)),
+    ("grading", re.compile(r"\b(grad(e|ing)|histopatholog)", re.I)),
+    ("rules", re.compile(r"\brules?\s+for\s+classification\b", re.I)),
+    ("site", re.compile(r"\b(anatomical\s+sites?|subsites?|regional\s+nodes)\b", re.I)),
+)
+
+# 常规情况下分期表与 TNM 定义最有用，给予先验加分
+KIND_BOOST: Dict[str, float] = {"stage": 1.0, "tnm": 0.8, "grading": 0.3, "rules": 0.2, "site": 0.2, "other": 0.0}
+
+_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s*)?(?:[A-Z0-9][\w/()'’,&\- ]{1,78}|p?[TNM]\s*[–—-].{0,70})$"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class UICCSection:
+    doc: str
+    order: int
+    title: str
+    kind: str
+    text: str
+    tokens: int = 0
+
+    def render(self) -> str:
+        return f"## {self.title}\n{self.text}" if self.title else self.text
+
+
+@dataclass
+class _DocEntry:
+    size: int
+    mtime: float
+    sections: List[UICCSection] = field(default_factory=list)
+
+
+def _classify(title: str) -> str:
+    for kind, pattern in SECTION_KINDS:
+        if pattern.search(title):
+            return kind
+    return "other"
+
+
+def _is_heading(line: str, prev_blank: bool) -> bool:
+    s = line.strip()
+    if not s or len(s) > 80 or s.endswith((".", ";", ",")):
+        return False
+    if s.startswith("#") or re.match(r"^p?[TNM]\s*[–—-]", s):
+        return True
+    if not prev_blank or not _HEADING_RE.match(s):
+        return False
+    # 空行后的短行：含已知关键词，或全大写（如 "SUMMARY"）才视为标题
+    return _classify(s) != "other" or (s.isupper() and len(s) > 3)
+
+
+def split_sections(doc: str, text: str) -> List[UICCSection]:
+    """按标题行切分章节；没有识别到标题时整篇作为一个章节。"""
+    sections: List[UICCSection] = []
+    title = ""
+    buf: List[str] = []
+    prev_blank = True
+
+    def _flush() -> None:
+        body = "\n".join(buf).strip()
+        if body or title:
+            sections.append(UICCSection(doc, len(sections), title, _classify(title), body))
+
+    for line in text.splitlines():
+        if _is_heading(line, prev_blank):
+            _flush()
+            title, buf = line.strip().lstrip("#").strip(), []
+        else:
+            buf.append(line)
+        prev_blank = not line.strip()
+    _flush()
+    for sec in sections:
+        sec.tokens = estimate_tokens(sec.render())
+    return sections
+
+
+def _truncate(sec: UICCSection, max_tokens: int) -> UICCSection:
+    """按行截断过长章节，使其不超过 max_tokens。"""
+    lines: List[str] = []
+    budget = max_tokens * 4 - len(sec.title) - 8
+    for line in sec.text.splitlines():
+        if len(line) + 1 > budget:
+            break
+        lines.append(line)
+        budget -= len(line) + 1
+    cut = UICCSection(sec.doc, sec.order, sec.title, sec.kind, "\n".join(lines) + "\n…")
+    cut.tokens = estimate_tokens(cut.render())
+    return cut
+
+
+@dataclass
+class UICCSelection:
+    sections: List[UICCSection]
+    total_sections: int
+    total_tokens: int
+    returned_tokens: int
+
+    @property
+    def trimmed_tokens(self) -> int:
+        return self.total_tokens - self.returned_tokens
+
+    def render(self) -> str:
+        out: List[str] = []
+        current = None
+        for sec in self.sections:
+            if sec.doc != current:
+                current = sec.doc
+                out.append(f"=== {sec.doc}.txt ===")
+            out.append(sec.render())
+        if self.trimmed_tokens > 0:
+            out.append(
+                f"[UICC: returned {len(self.sections)}/{self.total_sections} sections "
+                f"(~{self.returned_tokens} tokens); omitted ~{self.trimmed_tokens} tokens of less relevant text]"
+            )
+        return "\n\n".join(out)
+
+
+class UICCIndex:
+    def __init__(self, uicc_dir: Path):
+        self.uicc_dir = Path(uicc_dir)
+        self._docs: Dict[str, _DocEntry] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, entry: CatalogEntry) -> _DocEntry:
+        cached = self._docs.get(entry.doc_id)
+        if cached is not None and cached.size == entry.size and cached.mtime == entry.mtime:
+            note_cache("uicc_doc", True)
+            return cached
+        note_cache("uicc_doc", False)
+        text = (self.uicc_dir / entry.filename).read_text(encoding="utf-8").strip()
+        doc = _DocEntry(entry.size, entry.mtime, split_sections(entry.doc_id, text))
+        self._docs[entry.doc_id] = doc
+        logger.info("[UICC_INDEX] loaded %s: %d sections", entry.filename, len(doc.sections))
+        return doc
+
+    def sections_for(self, doc_ids: Sequence[str]) -> List[UICCSection]:
+        wanted = set(doc_ids)
+        out: List[UICCSection] = []
+        with self._lock:
+            for entry in storage_catalog.entries(self.uicc_dir, [".txt"]):
+                if entry.doc_id in wanted:
+                    out.extend(self._load(entry).sections)
+        return out
+
+    def select(self, query: str, doc_ids: Sequence[str], token_budget: int) -> UICCSelection:
+        """按 BM25 + 章节类型先验挑选章节；每个文档至少保留最相关的一节，然后按总分填满预算。"""
+        sections = self.sections_for(doc_ids)
+        total_tokens = sum(s.tokens for s in sections)
+        if not sections:
+            return UICCSelection([], 0, 0, 0)
+        if total_tokens <= token_budget:
+            return UICCSelection(sections, len(sections), total_tokens, total_tokens)
+
+        lex = bm25_scores(query, [f"{s.title}\n{s.text}" for s in sections])
+        top = max(lex) or 1.0
+        scores = [l / top + KIND_BOOST.get(s.kind, 0.0) for l, s in zip(lex, sections)]
+        ranked = sorted(range(len(sections)), key=lambda i: scores[i], reverse=True)
+
+        chosen: Dict[int, UICCSection] = {}
+        used = 0
+        seen_docs = set()
+        share = max(1, token_budget // max(1, len(set(doc_ids))))
+        for i in ranked:  # 第一轮：每个文档的最佳章节（超出平均份额时截断）
+            if sections[i].doc not in seen_docs:
+                seen_docs.add(sections[i].doc)
+                sec = sections[i] if sections[i].tokens <= share else _truncate(sections[i], share)
+                chosen[i] = sec
+                used += sec.tokens
+        for i in ranked:  # 第二轮：按分数填满预算
+            if i in chosen or used + sections[i].tokens > token_budget:
+                continue
+            chosen[i] = sections[i]
+            used += sections[i].tokens
+
+        doc_rank = {d: n for n, d in enumerate(doc_ids)}
+        picked = sorted(chosen.values(), key=lambda s: (doc_rank.get(s.doc, 0), s.order))
+        return UICCSelection(picked, len(sections), total_tokens, used)
+
+
+_indexes: Dict[str, UICCIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_uicc_index(uicc_dir: Path) -> UICCIndex:
+    key = str(uicc_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = UICCIndex(Path(uicc_dir))
+        return _indexes[key]
+
+
+def uicc_token_budget(default: int = 3000) -> int:
+    return int(config_manager.get_section("rag").get("uicc", {}).get("token_budget", default))
+
+
+def select_uicc_sections(uicc_dir: Path, query: str, doc_ids: Sequence[str], token_budget: Optional[int] = None) -> UICCSelection:
+    return get_uicc_index(uicc_dir).select(query, doc_ids, token_budget or uicc_token_budget())
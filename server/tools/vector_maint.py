@@ -0,0 +1,339 @@
+"""
+Chroma 向量库维护：体积 / HNSW 参数 / 召回率报告，以及按新参数重建并原子切换。
+
+这些库经历了大量 upsert / delete，HNSW 段只做软删除、容量按 resize_factor 只增不减，
+chroma.sqlite3 里的写入日志也会持续增长。这里：
+  - report:  每个 collection 的行数、HNSW 配置、段文件大小、已分配槽位 vs 实际行数、常驻内存估计，
+             以及对抽样查询的 recall@k 与延迟（和全量精确检索对比）
+  - rebuild: 把整个库逐 collection 复制到新目录（目标 collection 使用新的 M / ef），
+             校验行数与 recall 后切换：库路径是软链接时用 os.replace 原子替换软链接；
+             首次切换会把原目录改名为 <库名>.v<时间戳> 并在原路径建立软链接
+切换后已打开旧库的进程需要重启（PersistentClient 按路径缓存）。
+
+用法（在 server/tools 目录下）：
+    python vector_maint.py report esmo uicc --sample 200 -k 10
+    python vector_maint.py rebuild esmo --collection medical_collection --m 32 --ef-construction 200 --ef-search 100
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config_manager import (
+    ESMO_DB_STORAGE,
+    NCCN_DB_STORAGE,
+    HEMA_DB_STORAGE,
+    GUIDELINE_DB_STORAGE,
+    PATHO_DB_STORAGE,
+    WHO_DB_STORAGE,
+    UICC_DB_STORAGE,
+)
+
+logger = logging.getLogger(__name__)
+
+STORES: Dict[str, Path] = {
+    "esmo": ESMO_DB_STORAGE,
+    "nccn": NCCN_DB_STORAGE,
+    "hema": HEMA_DB_STORAGE,
+    "guideline": GUIDELINE_DB_STORAGE,
+    "patho": PATHO_DB_STORAGE,
+    "who": WHO_DB_STORAGE,
+    "uicc": UICC_DB_STORAGE,
+}
+
+_HNSW_FILES = ("data_level0.bin", "link_lists.bin", "length.bin", "header.bin", "index_metadata.pickle")
+
+
+def resolve_store(name_or_path: str) -> Path:
+    if name_or_path in STORES:
+        return Path(STORES[name_or_path])
+    return Path(name_or_path)
+
+
+def _client(path: Path):
+    import chromadb
+
+    return chromadb.PersistentClient(path=str(path))
+
+
+# ─────────────────────────── 报告 ───────────────────────────
+
+@dataclass
+class CollectionReport:
+    store: str
+    collection: str
+    count: int
+    dim: int = 0
+    hnsw: Dict[str, Any] = field(default_factory=dict)
+    segment_files: Dict[str, int] = field(default_factory=dict)
+    allocated: int = 0  # data_level0.bin 中的槽位数（含软删除与扩容余量）
+    memory_bytes: int = 0  # 查询时常驻内存估计：data_level0 + link_lists
+    recall_at_k: Optional[float] = None
+    k: int = 0
+    sample: int = 0
+    ann_ms: Dict[str, float] = field(default_factory=dict)
+    exact_ms: Dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        seg = sum(self.segment_files.values())
+        slack = f"{self.allocated}/{self.count}" if self.allocated else "?"
+        hnsw = " ".join(f"{k}={v}" for k, v in self.hnsw.items())
+        line = (
+            f"[{self.store}/{self.collection}] rows={self.count} dim={self.dim} | {hnsw} | "
+            f"segment={seg / 1e6:.1f}MB slots/rows={slack} mem≈{self.memory_bytes / 1e6:.1f}MB"
+        )
+        if self.recall_at_k is not None:
+            line += (
+                f" | recall@{self.k}={self.recall_at_k:.3f} (n={self.sample}) "
+                f"ann p50={self.ann_ms.get('p50', 0):.1f}ms p95={self.ann_ms.get('p95', 0):.1f}ms "
+                f"exact p50={self.exact_ms.get('p50', 0):.1f}ms"
+            )
+        return line
+
+
+def _vector_segments(store: Path) -> Dict[str, str]:
+    """collection id → HNSW 段目录名（读 chroma.sqlite3 的 segments 表）。"""
+    db = store / "chroma.sqlite3"
+    if not db.exists():
+        return {}
+    con = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    try:
+        rows = con.execute("SELECT id, collection FROM segments WHERE scope = 'VECTOR'").fetchall()
+    finally:
+        con.close()
+    return {str(coll): str(seg) for seg, coll in rows}
+
+
+def _hnsw_config(collection) -> Dict[str, Any]:
+    cfg = getattr(collection, "configuration", None) or {}
+    hnsw = cfg.get("hnsw") or {}
+    return {k: hnsw[k] for k in ("space", "max_neighbors", "ef_construction", "ef_search") if k in hnsw}
+
+
+def load_embeddings(collection, batch_size: int = 2000) -> Tuple[List[str], np.ndarray]:
+    ids: List[str] = []
+    parts: List[np.ndarray] = []
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        res = collection.get(limit=batch_size, offset=offset, include=["embeddings"])
+        if not res.get("ids"):
+            break
+        ids.extend(res["ids"])
+        parts.append(np.asarray(res["embeddings"], dtype=np.float32))
+    return ids, (np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32))
+
+
+def _exact_topk(matrix: np.ndarray, q: np.ndarray, k: int, space: str) -> np.ndarray:
+    """与 Chroma 相同度量下的精确 top-k 行号。"""
+    if space == "cosine":
+        norms = np.linalg.norm(matrix, axis=1)
+        scores = -(matrix @ q) / (np.where(norms > 0, norms, 1.0) * (np.linalg.norm(q) or 1.0))
+    elif space == "ip":
+        scores = -(matrix @ q)
+    else:  # l2
+        scores = ((matrix - q) ** 2).sum(axis=1)
+    k = min(k, scores.shape[0])
+    top = np.argpartition(scores, k - 1)[:k]
+    return top[np.argsort(scores[top], kind="stable")]
+
+
+def _quantiles(samples: Sequence[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    arr = np.asarray(samples)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)), "mean": float(arr.mean())}
+
+
+def measure_recall(
+    collection, space: str, *, k: int = 10, sample: int = 200, noise: float = 0.01, seed: int = 0
+) -> Tuple[float, Dict[str, float], Dict[str, float], int]:
+    """
+    以库内随机向量加少量噪声作为查询，比较 collection.query 与全量精确检索的 top-k，
+    返回 (recall@k, ANN 延迟分位数, 精确检索延迟分位数, 实际样本数)。
+    """
+    ids, matrix = load_embeddings(collection)
+    if not ids:
+        return 0.0, {}, {}, 0
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(ids), size=min(sample, len(ids)), replace=False)
+    scale = float(np.linalg.norm(matrix, axis=1).mean()) / np.sqrt(matrix.shape[1])
+    hits = 0
+    ann_ms: List[float] = []
+    exact_ms: List[float] = []
+    for r in rows:
+        q = matrix[r] + rng.normal(scale=noise * scale, size=matrix.shape[1]).astype(np.float32)
+        start = time.perf_counter()
+        res = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+        ann_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        exact = _exact_topk(matrix, q, k, space)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        hits += len(set(res["ids"][0]) & {ids[i] for i in exact})
+    return hits / (len(rows) * min(k, len(ids))), _quantiles(ann_ms), _quantiles(exact_ms), len(rows)
+
+
+def report_store(store: Path, *, k: int = 10, sample: int = 200, recall: bool = True) -> List[CollectionReport]:
+    client = _client(store)
+    segments = _vector_segments(store)
+    reports: List[CollectionReport] = []
+    for coll in client.list_collections():
+        collection = client.get_collection(coll if isinstance(coll, str) else coll.name)
+        rep = CollectionReport(store=store.name, collection=collection.name, count=collection.count())
+        rep.hnsw = _hnsw_config(collection)
+        seg_dir = store / segments.get(str(collection.id), "")
+        if segments.get(str(collection.id)) and seg_dir.is_dir():
+            rep.segment_files = {f: (seg_dir / f).stat().st_size for f in _HNSW_FILES if (seg_dir / f).exists()}
+            rep.memory_bytes = rep.segment_files.get("data_level0.bin", 0) + rep.segment_files.get("link_lists.bin", 0)
+        peek = collection.get(limit=1, include=["embeddings"])
+        if peek.get("ids"):
+            rep.dim = int(np.asarray(peek["embeddings"]).shape[1])
+            m = int(rep.hnsw.get("max_neighbors", 16))
+            # 每个槽位：2M 条 level0 邻接（uint32）+ 计数 + 向量 + label
+            per_slot = 2 * m * 4 + 4 + rep.dim * 4 + 8
+            rep.allocated = rep.segment_files.get("data_level0.bin", 0) // per_slot
+        if recall and rep.count:
+            rep.k, rep.sample = k, sample
+            rep.recall_at_k, rep.ann_ms, rep.exact_ms, rep.sample = measure_recall(
+                collection, str(rep.hnsw.get("space", "l2")), k=k, sample=sample
+            )
+        reports.append(rep)
+    sqlite_path = store / "chroma.sqlite3"
+    if sqlite_path.exists():
+        logger.info("[%s] chroma.sqlite3 %.1fMB", store.name, sqlite_path.stat().st_size / 1e6)
+    return reports
+
+
+# ─────────────────────────── 重建 ───────────────────────────
+
+def rebuild_store(
+    store: Path,
+    out_dir: Path,
+    *,
+    collection: Optional[str] = None,
+    hnsw: Optional[Dict[str, Any]] = None,
+    batch_size: int = 1000,
+) -> Dict[str, int]:
+    """
+    把 store 的所有 collection 复制到 out_dir（重建 HNSW，顺带丢掉软删除与写入日志）。
+    hnsw 只作用于 collection（为 None 时作用于全部）；其他参数沿用原 collection。
+    """
+    src_client = _client(store)
+    dst_client = _client(out_dir)
+    copied: Dict[str, int] = {}
+    for coll in src_client.list_collections():
+        src = src_client.get_collection(coll if isinstance(coll, str) else coll.name)
+        cfg = _hnsw_config(src)
+        if hnsw and (collection is None or src.name == collection):
+            cfg.update({k: v for k, v in hnsw.items() if v is not None})
+        dst = dst_client.create_collection(src.name, metadata=src.metadata or None, configuration={"hnsw": cfg})
+        total = src.count()
+        n = 0
+        for offset in range(0, total, batch_size):
+            res = src.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+            ids = res.get("ids") or []
+            if not ids:
+                break
+            dst.add(ids=ids, documents=res.get("documents"), metadatas=res.get("metadatas"), embeddings=res.get("embeddings"))
+            n += len(ids)
+            logger.info("[REBUILD] %s/%s: %d/%d", store.name, src.name, n, total)
+        if dst.count() != total:
+            raise RuntimeError(f"{src.name}: copied {dst.count()} rows, expected {total}")
+        copied[src.name] = n
+    return copied
+
+
+def switch_store(store: Path, new_dir: Path) -> Optional[Path]:
+    """
+    让 store 指向 new_dir。store 已是软链接时原子替换；否则先把原目录改名为 <库名>.v<时间戳>，
+    再在原路径建立软链接。返回旧库所在目录（确认无误后可手动删除）。
+    """
+    store = Path(store)
+    previous: Optional[Path] = store.resolve() if store.is_symlink() else None
+    if store.exists() and not store.is_symlink():
+        previous = store.with_name(f"{store.name}.v{time.strftime('%Y%m%d%H%M%S')}")
+        os.rename(store, previous)
+    tmp_link = store.with_name(f".{store.name}.link")
+    if tmp_link.is_symlink() or tmp_link.exists():
+        tmp_link.unlink()
+    os.symlink(Path(new_dir).resolve(), tmp_link)
+    os.replace(tmp_link, store)
+    return previous
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chroma store maintenance: size/recall report and HNSW rebuild.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_rep = sub.add_parser("report", help="per-collection size, HNSW parameters, recall@k and latency")
+    p_rep.add_argument("stores", nargs="+", help=f"store names ({', '.join(STORES)}) or paths")
+    p_rep.add_argument("-k", type=int, default=10)
+    p_rep.add_argument("--sample", type=int, default=200, help="number of sampled queries")
+    p_rep.add_argument("--no-recall", action="store_true", help="skip the recall/latency measurement")
+    p_rep.add_argument("--json", type=Path, help="also write the report as JSON")
+
+    p_reb = sub.add_parser("rebuild", help="copy a store into a fresh directory with new HNSW parameters and switch")
+    p_reb.add_argument("store", help=f"store name ({', '.join(STORES)}) or path")
+    p_reb.add_argument("--collection", help="collection to re-tune (default: all)")
+    p_reb.add_argument("--m", type=int, help="HNSW max_neighbors (M)")
+    p_reb.add_argument("--ef-construction", type=int)
+    p_reb.add_argument("--ef-search", type=int)
+    p_reb.add_argument("--out", type=Path, help="target directory (default: <store>.rebuild-<timestamp>)")
+    p_reb.add_argument("--batch-size", type=int, default=1000)
+    p_reb.add_argument("--sample", type=int, default=200, help="queries for the post-rebuild recall check")
+    p_reb.add_argument("--min-recall", type=float, default=0.0, help="do not switch below this recall@10")
+    p_reb.add_argument("--no-switch", action="store_true", help="only build the new directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "report":
+        all_reports: List[CollectionReport] = []
+        for name in args.stores:
+            store = resolve_store(name)
+            if not store.exists():
+                print(f"{name}: store not found: {store}")
+                continue
+            reports = report_store(store, k=args.k, sample=args.sample, recall=not args.no_recall)
+            for rep in reports:
+                print(rep.summary())
+            all_reports.extend(reports)
+        if args.json:
+            args.json.write_text(json.dumps([asdict(r) for r in all_reports], indent=2, ensure_ascii=False))
+        return 0
+
+    store = resolve_store(args.store)
+    if not store.exists():
+        print(f"store not found: {store}")
+        return 1
+    out = args.out or store.with_name(f"{store.name}.rebuild-{time.strftime('%Y%m%d%H%M%S')}")
+    if out.exists():
+        print(f"target already exists: {out}")
+        return 1
+    hnsw = {"max_neighbors": args.m, "ef_construction": args.ef_construction, "ef_search": args.ef_search}
+    copied = rebuild_store(store, out, collection=args.collection, hnsw=hnsw, batch_size=args.batch_size)
+    for name, n in copied.items():
+        print(f"{name}: {n} rows → {out}")
+
+    reports = report_store(out, sample=args.sample)
+    for rep in reports:
+        print(rep.summary())
+    worst = min((r.recall_at_k for r in reports if r.recall_at_k is not None), default=1.0)
+    if worst < args.min_recall:
+        print(f"recall {worst:.3f} below --min-recall {args.min_recall}; not switching (new store left at {out})")
+        return 1
+    if args.no_switch:
+        return 0
+    previous = switch_store(store, out)
+    print(f"{store} → {out.resolve()}" + (f" (previous store: {previous})" if previous else ""))
+    print("Restart the API server so it reopens the store.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
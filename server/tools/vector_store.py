@@ -0,0 +1,385 @@
+"""
+向量库后端抽象：query_collection 只依赖 VectorStore 接口。
+
+  - ChromaVectorStore:  包装现有的 Chroma collection（SQLite + HNSW）
+  - MemmapVectorStore:  float16 矩阵（.npy, mmap_mode="r"）上的精确余弦 top-k；
+                        多个 uvicorn worker 通过 page cache 共享同一份只读数据
+
+memmap 目录结构（由 export_chroma_collection 生成）：
+  vectors.npy     (N, D) float16，已 L2 归一化，行按 sort_keys 排序
+  records.json    {"ids": [...], "documents": [...], "metadatas": [...]}
+  ranges.json     {field: {value: [[start, end], ...]}}  元信息字段 → 行区间
+
+后端选择：config.toml [rag] vector_backend = "chroma" | "memmap"，memmap 数据放在 memmap_dir 下。
+导出（在 server/tools 目录下）：
+    python vector_store.py export data/ESMO_chroma_db_qwen --collection medical_collection
+"""
+import argparse
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config_manager import config_manager
+
+logger = logging.getLogger(__name__)
+
+QueryResult = Tuple[List[str], List[dict], List[float]]
+
+# 导出时为这些字段预计算行区间（只要字段存在）
+INDEXED_FIELDS = ("source", "pdf_name", "txt_name", "docx_name")
+
+
+class VectorStore:
+    """query_collection 使用的最小接口。"""
+
+    def query(self, embedding: Sequence[float], where: Optional[dict], n_results: int) -> QueryResult:
+        raise NotImplementedError
+
+    def query_many(self, embeddings: Sequence[Sequence[float]], where: Optional[dict], n_results: int) -> List[QueryResult]:
+        """同一 where 下的多个查询向量；默认逐个调用 query。"""
+        return [self.query(e, where, n_results) for e in embeddings]
+
+    def get(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None, with_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        """按 id 或 where 取记录；with_embeddings=True 时额外返回 "embeddings"（(n, D) float32，未归一化）。"""
+        raise NotImplementedError
+
+    def scan_metadata(self, batch_size: int = 5000) -> Iterable[Tuple[List[str], List[dict]]]:
+        """分批遍历全部 (ids, metadatas)，用于构建文档 → chunk 索引。"""
+        res = self.get()
+        yield res["ids"], res["metadatas"]
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, embedding: Sequence[float], where: Optional[dict], n_results: int) -> QueryResult:
+        return self.query_many([embedding], where, n_results)[0]
+
+    def query_many(self, embeddings: Sequence[Sequence[float]], where: Optional[dict], n_results: int) -> List[QueryResult]:
+        if not embeddings:
+            return []
+        res = self.collection.query(
+            query_embeddings=[list(e) for e in embeddings],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        out: List[QueryResult] = []
+        for qi in range(len(embeddings)):
+            docs = res["documents"][qi] if res.get("documents") else []
+            metas = res["metadatas"][qi] if res.get("metadatas") else []
+            dists = res["distances"][qi] if res.get("distances") else []
+            out.append((docs, metas, dists))
+        return out
+
+    def get(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None, with_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] + (["embeddings"] if with_embeddings else [])
+        res = self.collection.get(ids=list(ids) if ids is not None else None, where=where, include=include)
+        out: Dict[str, Any] = {
+            "ids": res.get("ids") or [],
+            "documents": res.get("documents") or [],
+            "metadatas": res.get("metadatas") or [],
+        }
+        if with_embeddings:
+            emb = res.get("embeddings")
+            out["embeddings"] = np.asarray(emb if emb is not None else [], dtype=np.float32)
+        return out
+
+    def scan_metadata(self, batch_size: int = 5000) -> Iterable[Tuple[List[str], List[dict]]]:
+        total = self.collection.count()
+        for offset in range(0, total, batch_size):
+            res = self.collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+            if not res.get("ids"):
+                break
+            yield res["ids"], res.get("metadatas") or [{}] * len(res["ids"])
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+# query_many 每次转换为 float32 并相乘的行数（4096 维时约 256 MB）
+QUERY_CHUNK_ROWS = 16384
+
+
+class MemmapVectorStore(VectorStore):
+    """只读的精确检索后端；distances 返回余弦距离（1 - cos）。"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        with open(self.path / "records.json", "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids: List[str] = records["ids"]
+        self.documents: List[str] = records["documents"]
+        self.metadatas: List[dict] = records["metadatas"]
+        with open(self.path / "ranges.json", "r", encoding="utf-8") as f:
+            self.ranges: Dict[str, Dict[str, List[List[int]]]] = json.load(f)
+        self._id_rows: Optional[Dict[str, int]] = None
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    # ── where 过滤：索引字段走预计算行区间，其余字段退化为逐行比较 ──
+    def _rows_for_value(self, field: str, value: Any) -> np.ndarray:
+        if field in self.ranges:
+            spans = self.ranges[field].get(str(value), [])
+            if not spans:
+                return np.empty(0, dtype=np.int64)
+            return np.concatenate([np.arange(s, e, dtype=np.int64) for s, e in spans])
+        return np.fromiter(
+            (i for i, md in enumerate(self.metadatas) if md.get(field) == value), dtype=np.int64
+        )
+
+    def _eval(self, where: Mapping[str, Any]) -> np.ndarray:
+        sets: List[np.ndarray] = []
+        for key, cond in where.items():
+            if key == "$and":
+                parts = [self._eval(c) for c in cond]
+                rows = parts[0]
+                for p in parts[1:]:
+                    rows = np.intersect1d(rows, p, assume_unique=True)
+                sets.append(rows)
+            elif key == "$or":
+                sets.append(np.unique(np.concatenate([self._eval(c) for c in cond])))
+            elif isinstance(cond, Mapping):
+                if "$in" in cond:
+                    vals = cond["$in"]
+                    parts = [self._rows_for_value(key, v) for v in vals]
+                    sets.append(np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64))
+                elif "$eq" in cond:
+                    sets.append(self._rows_for_value(key, cond["$eq"]))
+                else:
+                    raise ValueError(f"Unsupported where operator for memmap backend: {cond}")
+            else:
+                sets.append(self._rows_for_value(key, cond))
+        rows = sets[0]
+        for s in sets[1:]:
+            rows = np.intersect1d(rows, s, assume_unique=True)
+        return rows
+
+    def query(self, embedding: Sequence[float], where: Optional[dict], n_results: int) -> QueryResult:
+        return self.query_many([embedding], where, n_results)[0]
+
+    def query_many(self, embeddings: Sequence[Sequence[float]], where: Optional[dict], n_results: int) -> List[QueryResult]:
+        if not embeddings:
+            return []
+        q = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms > 0, norms, 1.0)
+        if where:
+            rows = self._eval(where)
+            if rows.size == 0:
+                return [([], [], []) for _ in range(len(q))]
+            total = int(rows.size)
+        else:
+            rows = None
+            total = len(self.ids)
+
+        # 按行分块相乘（每块才转换为 float32），并对每个 query 维护滚动 top-k，
+        # 避免整个 float16 memmap 在每次查询时被转换成一份 float32 副本
+        k = min(int(n_results), total)
+        if k <= 0:
+            return [([], [], []) for _ in range(len(q))]
+        best_rows = np.empty((q.shape[0], 0), dtype=np.int64)
+        best_sims = np.empty((q.shape[0], 0), dtype=np.float32)
+        for start in range(0, total, QUERY_CHUNK_ROWS):
+            if rows is not None:
+                chunk_rows = rows[start:start + QUERY_CHUNK_ROWS]
+                block = self.vectors[chunk_rows]
+            else:
+                chunk_rows = np.arange(start, min(start + QUERY_CHUNK_ROWS, total), dtype=np.int64)
+                block = self.vectors[start:start + QUERY_CHUNK_ROWS]
+            sims = (np.asarray(block, dtype=np.float32) @ q.T).T  # (n_queries, chunk)
+            cand_sims = np.concatenate([best_sims, sims], axis=1)
+            cand_rows = np.concatenate([best_rows, np.broadcast_to(chunk_rows, sims.shape)], axis=1)
+            if cand_sims.shape[1] > k:
+                keep = np.argpartition(-cand_sims, k - 1, axis=1)[:, :k]
+                cand_sims = np.take_along_axis(cand_sims, keep, axis=1)
+                cand_rows = np.take_along_axis(cand_rows, keep, axis=1)
+            best_sims, best_rows = cand_sims, cand_rows
+
+        out: List[QueryResult] = []
+        for qi in range(q.shape[0]):
+            order = np.argsort(-best_sims[qi], kind="stable")
+            picked = best_rows[qi][order]
+            docs = [self.documents[i] for i in picked]
+            metas = [self.metadatas[i] for i in picked]
+            dists = (1.0 - best_sims[qi][order]).astype(float).tolist()
+            out.append((docs, metas, dists))
+        return out
+
+    def get(
+        self, ids: Optional[Sequence[str]] = None, where: Optional[dict] = None, with_embeddings: bool = False
+    ) -> Dict[str, Any]:
+        if ids is not None:
+            if self._id_rows is None:
+                self._id_rows = {cid: i for i, cid in enumerate(self.ids)}
+            rows = [self._id_rows[i] for i in ids if i in self._id_rows]
+        elif where:
+            rows = self._eval(where).tolist()
+        else:
+            rows = list(range(len(self.ids)))
+        out: Dict[str, Any] = {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.documents[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
+        if with_embeddings:
+            out["embeddings"] = np.asarray(self.vectors[rows], dtype=np.float32)
+        return out
+
+
+def as_vector_store(collection) -> VectorStore:
+    return collection if isinstance(collection, VectorStore) else ChromaVectorStore(collection)
+
+
+# ─────────────────────────── 打开 / 缓存 ───────────────────────────
+
+_clients: Dict[str, Any] = {}
+_memmaps: Dict[str, MemmapVectorStore] = {}
+_lock = threading.Lock()
+
+
+def get_persistent_client(path: Path):
+    """按路径复用 PersistentClient，避免每次工具调用都重新打开库。"""
+    import chromadb
+
+    key = str(path)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = chromadb.PersistentClient(path=key)
+            _clients[key] = client
+    return client
+
+
+def memmap_dir_for(db_path: Path, collection_name: str) -> Path:
+    base = config_manager.base_dir / str(config_manager.get_section("rag").get("memmap_dir", "data/memmap"))
+    return base / f"{Path(db_path).name}__{collection_name}"
+
+
+def open_collection(db_path: Path, collection_name: str):
+    """
+    按 [rag] vector_backend 打开集合：memmap 后端且已导出时返回 MemmapVectorStore，
+    否则返回 Chroma collection（query_collection 两者都支持）。
+    """
+    if str(config_manager.get_section("rag").get("vector_backend", "chroma")) == "memmap":
+        mdir = memmap_dir_for(db_path, collection_name)
+        key = str(mdir)
+        with _lock:
+            store = _memmaps.get(key)
+        if store is not None:
+            return store
+        if (mdir / "vectors.npy").exists():
+            store = MemmapVectorStore(mdir)
+            with _lock:
+                _memmaps.setdefault(key, store)
+            return _memmaps[key]
+        logger.warning("[VECTOR_STORE] memmap export missing for %s, using Chroma", mdir)
+    return get_persistent_client(db_path).get_or_create_collection(name=collection_name)
+
+
+# ─────────────────────────── 导出 ───────────────────────────
+
+def _iter_collection(collection, batch_size: int) -> Iterable[Dict[str, Any]]:
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        res = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+        if not res.get("ids"):
+            break
+        yield res
+
+
+def export_chroma_collection(collection, out_dir: Path, batch_size: int = 2000) -> int:
+    """把 Chroma 集合导出为 memmap 目录，返回导出的行数。"""
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[dict] = []
+    vec_parts: List[np.ndarray] = []
+    for res in _iter_collection(collection, batch_size):
+        ids.extend(res["ids"])
+        docs.extend(res.get("documents") or [""] * len(res["ids"]))
+        metas.extend([dict(md or {}) for md in (res.get("metadatas") or [{}] * len(res["ids"]))])
+        vec_parts.append(np.asarray(res["embeddings"], dtype=np.float32))
+    if not ids:
+        raise ValueError("collection is empty")
+
+    vecs = np.concatenate(vec_parts)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    vecs /= np.where(norms > 0, norms, 1.0)
+
+    # 按 (source, 文档名, chunk_index) 排序，使同一文档的 chunk 连续存放
+    def _sort_key(i: int) -> tuple:
+        md = metas[i]
+        return tuple(str(md.get(f, "")) for f in INDEXED_FIELDS) + (int(md.get("chunk_index", 0) or 0),)
+
+    order = sorted(range(len(ids)), key=_sort_key)
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    mm = np.lib.format.open_memmap(out_dir / "vectors.npy", mode="w+", dtype=np.float16, shape=vecs.shape)
+    mm[:] = vecs[order].astype(np.float16)
+    mm.flush()
+    del mm
+
+    ids = [ids[i] for i in order]
+    docs = [docs[i] for i in order]
+    metas = [metas[i] for i in order]
+
+    ranges: Dict[str, Dict[str, List[List[int]]]] = {}
+    for field in INDEXED_FIELDS:
+        spans: Dict[str, List[List[int]]] = {}
+        prev = None
+        for row, md in enumerate(metas):
+            if field not in md:
+                prev = None
+                continue
+            val = str(md[field])
+            if val == prev:
+                spans[val][-1][1] = row + 1
+            else:
+                spans.setdefault(val, []).append([row, row + 1])
+            prev = val
+        if spans:
+            ranges[field] = spans
+
+    with open(out_dir / "records.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "documents": docs, "metadatas": metas}, f, ensure_ascii=False)
+    with open(out_dir / "ranges.json", "w", encoding="utf-8") as f:
+        json.dump(ranges, f, ensure_ascii=False)
+    return len(ids)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vector store utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_exp = sub.add_parser("export", help="export a Chroma store to the memmap backend")
+    p_exp.add_argument("db_path", type=Path, help="Chroma PersistentClient directory")
+    p_exp.add_argument("--collection", default="medical_collection")
+    p_exp.add_argument("--out", type=Path, help="output directory (defaults to [rag] memmap_dir)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command == "export":
+        db_path = args.db_path if args.db_path.is_absolute() else config_manager.base_dir / args.db_path
+        collection = get_persistent_client(db_path).get_collection(name=args.collection)
+        out = args.out or memmap_dir_for(db_path, args.collection)
+        n = export_chroma_collection(collection, out)
+        print(f"Exported {n} rows → {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())